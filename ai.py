@@ -1,126 +1,302 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import matplotlib.tri as tri
-import torch
-from torchvision import transforms
-from moondream import Moondream
-from transformers import AutoTokenizer
-from PIL import Image
-import requests
-from io import BytesIO
 import os
-import zipfile
-from sklearn.neighbors import NearestNeighbors
+from functools import partial
 from tqdm import tqdm
-import kaggle
+from npk_cache import LRUCache
+from npk_dataset import DatasetCache
+from npk_describe import DescriptionCache
+from npk_dedup import HASH_METHODS, HashIndex, image_hash, near_duplicates
+from npk_store import EmbeddingStore, content_hash
+from npk_embed import (IMAGE_SIZE, INFERENCE_MODES, EmbeddingPipeline, hash_sources, iter_hashed,
+                       moondream_encoder, moondream_features, preprocess, read_image_bytes)
+from npk_fetch import Fetcher
+from npk_index import load_index, make_index
+from npk_samples import SAMPLE_COLUMNS, SampleLog
+from npk_sources import open_source
+
+MODEL_ID = "vikhyatk/moondream0"
+KAGGLE_DIR = "kaggle_data"
+
+# Columns of each loaded image dataset (kept even when a source has no images)
+DATASET_COLUMNS = ['Plant_Name', 'Species', 'Image_Path', 'N', 'P', 'K', 'Source']
+
+# Per-reference-image metadata kept alongside the embedding matrix
+META_COLUMNS = ['Plant_Name', 'Species', 'Source', 'N', 'P', 'K', 'N_norm', 'P_norm', 'K_norm']
+
+# How neighbours' NPK values are combined: by 1/distance, equally, or by softmax(-distance / T)
+WEIGHTINGS = ("inverse", "uniform", "softmax")
+SOFTMAX_TEMPERATURE = 0.05  # Cosine distance; nearer neighbours dominate more as it shrinks
+
+
+def l2_normalize(matrix):
+    """Scale rows (or a single vector) to unit length in place"""
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    matrix /= np.maximum(norms, 1e-12)
+    return matrix
+
+
+def neighbour_weights(distances, weighting="inverse"):
+    """(B, k) cosine distances -> (B, k) neighbour weights, each row summing to 1"""
+    if weighting == "inverse":
+        weights = 1 / (distances + 1e-6)
+    elif weighting == "uniform":
+        weights = np.ones_like(distances)
+    elif weighting == "softmax":
+        weights = np.exp((distances.min(axis=1, keepdims=True) - distances) / SOFTMAX_TEMPERATURE)
+    else:
+        raise ValueError(f"Unknown weighting {weighting!r}; choose from {WEIGHTINGS}")
+    return weights / weights.sum(axis=1, keepdims=True)
+
 
 class ComprehensivePlantNPKAnalyzer:
-    def __init__(self, csv_path, tomato_zip_path, kaggle_dataset="baronn/lettuce-npk-dataset"):
-        # Initialize Moondream
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model = Moondream.from_pretrained("vikhyatk/moondream0").to(self.device)
-        self.tokenizer = AutoTokenizer.from_pretrained("vikhyatk/moondream0")
+    def __init__(self, csv_path, tomato_zip_path, kaggle_dataset="baronn/lettuce-npk-dataset",
+                 cache_dir="embedding_cache", batch_size=16, num_workers=None,
+                 embedding_dtype=np.float32, index="exact", index_params=None, n_neighbors=3, weighting="inverse",
+                 compact_ratio=0.25, refresh_kaggle=False, query_cache_bytes=64 * 2**20,
+                 inference_mode="fp32", num_threads=None, download_workers=16,
+                 dedup_distance=4, dedup_method="dhash", plot_cache_bytes=16 * 2**20,
+                 description_cache_bytes=4 * 2**20, description_ttl=24 * 3600):
+        # Moondream and the neighbour index load on first use
+        self.device = None
+        self._model = None
+        self._tokenizer = None
+        self._encoder = None
+        self._index = None
+        if inference_mode not in INFERENCE_MODES:
+            raise ValueError(f"Unknown inference mode {inference_mode!r}; choose from {INFERENCE_MODES}")
+        self.inference_mode = inference_mode  # "fp32", "int8" or "traced" (see moondream_encoder)
+        self.num_threads = num_threads
         
-        # NPK triangle setup
+        # Embeddings persisted by image content hash, per model + input size
+        # (int8 vectors differ slightly, so they get their own store)
+        store_id = f"{MODEL_ID}@{IMAGE_SIZE}" + ("+int8" if inference_mode == "int8" else "")
+        self.embedding_store = EmbeddingStore(cache_dir, store_id)
+        self.pipeline = EmbeddingPipeline(self.encode_batch, IMAGE_SIZE, batch_size, num_workers)
+        
+        # Dataset Image_URLs: pooled keep-alive downloads with retries, cached on disk.
+        # Query URLs don't use the disk cache (a camera URL serves new frames)
+        self.download_workers = download_workers
+        self.fetcher = Fetcher(os.path.join(cache_dir, "http"), pool_size=download_workers)
+        self.embedding_dtype = np.dtype(embedding_dtype)  # float16 halves the matrix again
+        
+        # Dataset images within dedup_distance bits of an earlier one (perceptual hash)
+        # are collapsed into it: not embedded, not indexed. None keeps every image
+        if dedup_method not in HASH_METHODS:
+            raise ValueError(f"Unknown hash method {dedup_method!r}; choose from {HASH_METHODS}")
+        self.dedup_distance = dedup_distance
+        self.dedup_method = dedup_method
+        
+        # Neighbour search: "exact" (BLAS dot product) or "ivf" (approximate, persisted)
+        self.index_kind = index
+        self.index_params = index_params or {}
+        self.n_neighbors = n_neighbors
+        if weighting not in WEIGHTINGS:
+            raise ValueError(f"Unknown weighting {weighting!r}; choose from {WEIGHTINGS}")
+        self.weighting = weighting
+        self.index_path = (None if index == "exact" else
+                           os.path.join(self.embedding_store.path, f"index_{index}"))
+        
+        # Samples added/removed at runtime; compacted once pending updates pass compact_ratio
+        self.sample_log = SampleLog(os.path.join(cache_dir, "samples.jsonl"))
+        self.samples_dir = os.path.join(cache_dir, "samples")
+        self.compact_ratio = compact_ratio
+        
+        # NPK triangle setup (the plot's figure is built on first use)
         self.corners = np.array([[0, 0], [1, 0], [0.5, np.sqrt(3)/2]])
         self.triang = tri.Triangulation(self.corners[:, 0], self.corners[:, 1])
+        self.plot_cache_bytes = plot_cache_bytes
+        self._plotter = None
         
-        # Image transforms
-        self.transform = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5])
-        ])
-        
-        # Load and combine all datasets
+        # Load and combine all datasets (unchanged sources come from the cache)
+        self.dataset_cache = DatasetCache(cache_dir)
+        self.refresh_kaggle = refresh_kaggle
+        self.sources = {}  # name -> (checksum, frame, file, stat), in combined order
         self.df = self._load_and_combine_datasets(csv_path, tomato_zip_path, kaggle_dataset)
-        self.image_cache = {}
+        self.query_cache = LRUCache(query_cache_bytes)  # Query embeddings by content hash
+        self.description_cache = DescriptionCache(description_cache_bytes, description_ttl)
         
         # Prepare dataset embeddings
         self._prepare_dataset()
-        self._build_knn_model()
+    
+    def _load_model(self):
+        # Imported here so a start with nothing to embed never pays for torch
+        import torch
+        from moondream import Moondream
+        from transformers import AutoTokenizer
+        
+        print("Loading Moondream...")
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self._model = Moondream.from_pretrained(MODEL_ID).to(self.device)
+        self._tokenizer = AutoTokenizer.from_pretrained(MODEL_ID)
+        self._encoder = moondream_encoder(self._model, self.device, self.inference_mode, self.num_threads)
+    
+    @property
+    def model(self):
+        if self._model is None:
+            self._load_model()
+        return self._model
+    
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            self._load_model()
+        return self._tokenizer
+    
+    def encode_batch(self, batch):
+        """(B, 3, H, W) float32 -> (B, D) float32 embeddings"""
+        if self._encoder is None:
+            self._load_model()
+        return self._encoder(batch)
+    
+    @property
+    def plotter(self):
+        if self._plotter is None:
+            from npk_plot import TernaryPlot
+            self._plotter = TernaryPlot(self.triang, self.corners, cache_bytes=self.plot_cache_bytes)
+        return self._plotter
+    
+    def plot_cache_stats(self):
+        """Stats of the plot cache, or None if nothing has been plotted yet"""
+        return self._plotter.cache.stats() if self._plotter is not None else None
+    
+    @property
+    def index(self):
+        if self._index is None:
+            self._build_index()
+        return self._index
     
     def _load_and_combine_datasets(self, csv_path, tomato_zip_path, kaggle_dataset):
         """Load and combine all data sources into one dataframe"""
         print("Loading and combining datasets...")
         
         # 1. Load main CSV
-        main_df = pd.read_csv(csv_path)
+        checksum, stat = self.dataset_cache.file_checksum(csv_path)
+        main_df = self._cached_source("main", checksum, lambda: pd.read_csv(csv_path), csv_path, stat)
         
         # 2. Load Tomato Image Dataset
-        tomato_df = self._load_tomato_dataset(tomato_zip_path)
+        checksum, stat = self.dataset_cache.file_checksum(tomato_zip_path)
+        tomato_df = self._cached_source("tomato", checksum, lambda: self._load_tomato_dataset(tomato_zip_path),
+                                        tomato_zip_path, stat)
         
-        # 3. Load Kaggle Lettuce Dataset
-        lettuce_df = self._load_kaggle_dataset(kaggle_dataset)
+        # 3. Load Kaggle Lettuce Dataset (downloaded only if there is no local copy)
+        if self.refresh_kaggle or not os.path.isdir(KAGGLE_DIR) or not os.listdir(KAGGLE_DIR):
+            self._download_kaggle_dataset(kaggle_dataset)
+        checksum = content_hash(f"{kaggle_dataset}\n{self.dataset_cache.dir_checksum(KAGGLE_DIR)}".encode())
+        lettuce_df = self._cached_source("lettuce", checksum, self._load_kaggle_dataset)
+        
+        # 4. Samples added at runtime, in log order after every dataset row
+        samples_df = self._normalize_npk(self._samples_frame(self.sample_log.added()))
         
         # Combine all datasets
-        combined_df = pd.concat([main_df, tomato_df, lettuce_df], ignore_index=True)
+        combined_df = pd.concat([main_df, tomato_df, lettuce_df, samples_df], ignore_index=True)
+        self.n_base_rows = len(combined_df) - len(samples_df)
         
-        # Clean NPK values
+        return combined_df
+    
+    def _cached_source(self, name, checksum, load, file=None, stat=None):
+        """Normalized frame for one source, rebuilt only when its checksum changes"""
+        frame = self.dataset_cache.load(name, checksum)
+        if frame is None:
+            frame = self._normalize_npk(load())
+            frame['Image_Key'] = None  # Content and perceptual hashes, filled in by _prepare_dataset
+            frame['Image_Hash'] = None
+            self.dataset_cache.save(name, checksum, frame, file, stat)
+        else:
+            self.dataset_cache.note_stat(name, stat)
+            print(f"Using cached {name} dataset ({len(frame)} rows)")
+        self.sources[name] = (checksum, frame, file, stat)
+        return frame
+    
+    def _save_image_keys(self, keys, hashes):
+        """Write content/perceptual hashes back to the cached source frames so later starts skip hashing"""
+        start = 0
+        for name, (checksum, frame, file, stat) in self.sources.items():
+            changed = False
+            for col, values in [('Image_Key', keys), ('Image_Hash', hashes)]:
+                new = values[start:start + len(frame)]
+                old = [value if isinstance(value, str) else None for value in frame.get(col, [None] * len(frame))]
+                if new != old:
+                    frame[col] = new
+                    changed = True
+            if changed:
+                self.dataset_cache.save(name, checksum, frame, file, stat)
+            start += len(frame)
+    
+    def _normalize_npk(self, df):
+        """Clean NPK values and add N/P/K_norm columns summing to 100"""
         for col in ['N', 'P', 'K']:
-            combined_df[col] = pd.to_numeric(combined_df[col], errors='coerce').fillna(0)
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
         
-        # Normalize NPK to sum 100
-        combined_df['NPK_sum'] = combined_df[['N', 'P', 'K']].sum(axis=1)
-        combined_df['N_norm'] = 100 * combined_df['N'] / combined_df['NPK_sum']
-        combined_df['P_norm'] = 100 * combined_df['P'] / combined_df['NPK_sum']
-        combined_df['K_norm'] = 100 * combined_df['K'] / combined_df['NPK_sum']
+        df['NPK_sum'] = df[['N', 'P', 'K']].sum(axis=1)
+        df['N_norm'] = 100 * df['N'] / df['NPK_sum']
+        df['P_norm'] = 100 * df['P'] / df['NPK_sum']
+        df['K_norm'] = 100 * df['K'] / df['NPK_sum']
         
-        return combined_df
+        return df
+    
+    def _samples_frame(self, records):
+        """Dataset rows for sample log "add" records"""
+        return pd.DataFrame([{**{col: rec[col] for col in SAMPLE_COLUMNS},
+                              'Image_Path': rec['path'], 'Image_Key': rec['key']}
+                             for rec in records], columns=SAMPLE_COLUMNS + ['Image_Path', 'Image_Key'])
     
     def _load_tomato_dataset(self, zip_path):
-        """Extract and process tomato image dataset"""
+        """Process tomato image dataset, reading images straight from the ZIP"""
         print("Processing tomato dataset...")
         
-        # Extract zip file
-        extract_path = os.path.join(os.path.dirname(zip_path), "extracted_tomato")
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_path)
-        
         # Create dataframe for tomato images
         tomato_data = []
-        for root, _, files in os.walk(extract_path):
-            for file in files:
-                if file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    # Assuming healthy tomatoes have balanced NPK (adjust as needed)
-                    tomato_data.append({
-                        'Plant_Name': 'Tomato',
-                        'Species': 'Solanum lycopersicum',
-                        'Image_Path': os.path.join(root, file),
-                        'N': 30,  # Default values - adjust based on your knowledge
-                        'P': 30,
-                        'K': 40,
-                        'Source': 'Tomato Image Dataset'
-                    })
-        
-        return pd.DataFrame(tomato_data)
-    
-    def _load_kaggle_dataset(self, dataset_name):
-        """Download and process Kaggle dataset"""
-        print("Downloading Kaggle dataset...")
+        source = open_source(zip_path)
+        for member in source.members():
+            # Assuming healthy tomatoes have balanced NPK (adjust as needed)
+            tomato_data.append({
+                'Plant_Name': 'Tomato',
+                'Species': 'Solanum lycopersicum',
+                'Image_Path': source.uri(member),
+                'N': 30,  # Default values - adjust based on your knowledge
+                'P': 30,
+                'K': 40,
+                'Source': 'Tomato Image Dataset'
+            })
         
-        # Download dataset (requires kaggle API setup)
-        kaggle.api.dataset_download_files(dataset_name, path="kaggle_data", unzip=True)
+        return pd.DataFrame(tomato_data, columns=DATASET_COLUMNS)
+    
+    def _download_kaggle_dataset(self, dataset_name):
+        """Download Kaggle dataset (kept zipped; images are read from the archive)"""
+        print("Downloading Kaggle dataset...")
         
+        # Download dataset (requires kaggle API setup; importing kaggle authenticates)
+        import kaggle
+        kaggle.api.dataset_download_files(dataset_name, path=KAGGLE_DIR, unzip=False)
+    
+    def _kaggle_sources(self):
+        """The downloaded archive(s), or loose files from an older unzipped download"""
+        archives = sorted(f for f in os.listdir(KAGGLE_DIR) if f.lower().endswith('.zip'))
+        if archives:
+            return [open_source(os.path.join(KAGGLE_DIR, f)) for f in archives]
+        return [open_source(KAGGLE_DIR)]
+    
+    def _load_kaggle_dataset(self):
+        """Process the downloaded Kaggle dataset"""
         # Process the dataset (adjust based on actual structure)
         lettuce_data = []
-        for root, _, files in os.walk("kaggle_data"):
-            for file in files:
-                if file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    # Extract NPK from filename or metadata (adjust as needed)
-                    npk = self._extract_npk_from_filename(file)
-                    lettuce_data.append({
-                        'Plant_Name': 'Lettuce',
-                        'Species': 'Lactuca sativa',
-                        'Image_Path': os.path.join(root, file),
-                        'N': npk[0],
-                        'P': npk[1],
-                        'K': npk[2],
-                        'Source': 'Kaggle Lettuce Dataset'
-                    })
-        
-        return pd.DataFrame(lettuce_data)
+        for source in self._kaggle_sources():
+            for member in source.members():
+                # Extract NPK from filename or metadata (adjust as needed)
+                npk = self._extract_npk_from_filename(os.path.basename(member))
+                lettuce_data.append({
+                    'Plant_Name': 'Lettuce',
+                    'Species': 'Lactuca sativa',
+                    'Image_Path': source.uri(member),
+                    'N': npk[0],
+                    'P': npk[1],
+                    'K': npk[2],
+                    'Source': 'Kaggle Lettuce Dataset'
+                })
+        
+        return pd.DataFrame(lettuce_data, columns=DATASET_COLUMNS)
     
     def _extract_npk_from_filename(self, filename):
         """Extract NPK values from filename if available"""
@@ -135,81 +311,416 @@ class ComprehensivePlantNPKAnalyzer:
             return (30, 20, 50)  # Default values
     
     def _prepare_dataset(self):
-        """Process images and generate embeddings"""
+        """Generate embeddings, encoding only images that are not in the store"""
         print("Preparing dataset embeddings...")
         
-        self.df['embedding'] = None
+        # Local path takes precedence over URL
+        sources = pd.Series(None, index=self.df.index, dtype=object)
+        for col in ['Image_URL', 'Image_Path']:
+            if col in self.df:
+                sources = self.df[col].where(self.df[col].notna(), sources)
+        sources = sources.tolist()
+        
+        # Perceptual hashes ("<method>:<hex>") of dataset rows, for near-duplicate collapsing
+        n_base = self.n_base_rows
+        dedup = self.dedup_distance is not None
+        prefix = f"{self.dedup_method}:"
+        cached = self.df['Image_Hash'].tolist() if 'Image_Hash' in self.df else [None] * len(sources)
+        hashes = [int(h[len(prefix):], 16) if isinstance(h, str) and h.startswith(prefix) else None
+                  for h in cached]
+        
+        # Stage 1: read/download and hash images without a cached, stored key in threads,
+        # each distinct source once; only new content is embedded. When deduplicating,
+        # dataset rows need a cached key and perceptual hash (a collapsed row is never stored)
+        cached = self.df['Image_Key'].tolist() if 'Image_Key' in self.df else [None] * len(sources)
+        keys = [key if isinstance(key, str) else None for key in cached]
+        rows_by_source = {}
+        for i, src in enumerate(sources):
+            if dedup and i < n_base:
+                needed = keys[i] is None or hashes[i] is None
+            else:
+                needed = keys[i] is None or keys[i] not in self.embedding_store
+            if needed and isinstance(src, str) and src:
+                rows_by_source.setdefault(src, []).append(i)
+        unique = list(rows_by_source)
+        to_embed, to_embed_set = [], set()  # Content hashes in the order they enter stage 2
+        skipped = 0  # Near-duplicates not embedded
+        seen = HashIndex(self.dedup_distance) if dedup else None
+        if dedup:
+            near_duplicates(hashes[:n_base], self.dedup_distance, index=seen)
+        
+        def misses():
+            nonlocal skipped
+            perceptual = partial(image_hash, method=self.dedup_method) if dedup else None
+            # In row order when deduplicating, so the images kept are the ones row order keeps
+            for j, key, data, h in iter_hashed(unique, self.download_workers, self.fetcher, perceptual,
+                                               ordered=dedup):
+                if isinstance(key, Exception):
+                    print(f"Error processing image {unique[j]}: {key}")
+                    continue
+                rows = rows_by_source[unique[j]]
+                for i in rows:
+                    keys[i] = key
+                    hashes[i] = h if i < n_base else None
+                if seen is not None and h is not None and rows[0] < n_base:
+                    if seen.find(h) is not None:
+                        skipped += key not in self.embedding_store and key not in to_embed_set
+                        continue
+                    seen.add(h, rows[0])
+                if key not in self.embedding_store and key not in to_embed_set:
+                    to_embed_set.add(key)
+                    to_embed.append(key)
+                    yield data if unique[j].startswith('http') else unique[j]
+        
+        # Stage 2: decode in worker processes, encode in batches; consumes stage 1 as a
+        # stream, so downloads overlap decoding and encoding
+        if unique:
+            with tqdm(desc="Embedding", unit="img") as bar:
+                matrix, ok = self.pipeline.run(misses(), progress=bar.update)
+            if to_embed:
+                self.embedding_store.put_many([key for key, good in zip(to_embed, ok) if good], matrix[ok])
+                stats = self.pipeline.last_stats
+                print(f"Embedded {stats['images']} images in {stats['seconds']:.1f}s "
+                      f"({stats['images_per_sec']:.1f} img/s, batch {stats['batch_size']}, "
+                      f"{stats['num_workers']} workers)")
+            if self.fetcher.stats["requests"]:
+                fetched = self.fetcher.stats
+                print(f"Downloaded {fetched['bytes'] / 2**20:.1f} MiB in {fetched['requests']} requests "
+                      f"({fetched['cache_hits']} from the HTTP cache)")
+        
+        image_hashes = [None if h is None else f"{prefix}{h:016x}" for h in hashes]
+        self.df['Image_Key'] = keys
+        self.df['Image_Hash'] = image_hashes
+        self._save_image_keys(keys[:n_base], image_hashes[:n_base])
+        
+        # Collapse near-duplicate dataset rows into the first similar row
+        duplicate = np.zeros(len(keys), dtype=bool)
+        if dedup:
+            duplicate[:n_base] = self._near_duplicates(hashes[:n_base], image_hashes[:n_base]) != np.arange(n_base)
+            to_embed += self._embed_late_representatives(sources, keys, duplicate)
+            print(f"Near-duplicates: {int(duplicate.sum())} of {n_base} dataset images collapsed "
+                  f"({skipped} embeddings skipped this run)")
+        self.n_duplicates = int(duplicate.sum())
+        
+        # Replay runtime additions/removals; removed rows stay as tombstones until compaction
+        keys = [key if key in self.embedding_store and not dup else None for key, dup in zip(keys, duplicate)]
+        rows, self.active = self.sample_log.replay(keys, self.n_base_rows)
+        added = self.sample_log.added()
+        self.row_records = [added[i - self.n_base_rows] if i >= self.n_base_rows else None for i in rows]
+        self.base_keys = {key for key in keys[:self.n_base_rows] if key is not None}
+        
+        # One contiguous, L2-normalized matrix; row i describes self.meta row i
+        self.row_keys = [keys[i] for i in rows]
+        stored, _ = self.embedding_store.get_many(self.row_keys)
+        self.embeddings = l2_normalize(stored).astype(self.embedding_dtype, copy=False)
+        self._set_meta(self._compact_meta(self.df.iloc[rows]))
         self.df['image_available'] = False
+        self.df.loc[self.df.index[rows], 'image_available'] = True
+        print(f"Embeddings: {int(self.active.sum())} available, {len(to_embed)} computed this run "
+              f"({self.embeddings.nbytes / 2**20:.1f} MiB {self.embedding_dtype.name} matrix)")
+    
+    def _near_duplicates(self, hashes, image_hashes):
+        """Representative row per dataset row, cached while the hashes are unchanged"""
+        listing = "\n".join([str(self.dedup_distance)] + [h or "" for h in image_hashes])
+        checksum = content_hash(listing.encode())
+        frame = self.dataset_cache.load("duplicates", checksum)
+        if frame is not None:
+            return frame['Representative'].to_numpy()
+        representatives = near_duplicates(hashes, self.dedup_distance)
+        self.dataset_cache.save("duplicates", checksum, pd.DataFrame({'Representative': representatives}))
+        return representatives
+    
+    def _embed_late_representatives(self, sources, keys, duplicate):
+        """Embed kept rows that have no stored embedding; returns their keys.
         
-        for idx, row in tqdm(self.df.iterrows(), total=len(self.df)):
-            img_path = row.get('Image_Path') or row.get('Image_URL')
-            if img_path and not pd.isna(img_path):
+        Stage 1 already sees new images in row order, but they are matched
+        against the cached rows first, so when a new row comes before a
+        cached near-duplicate of it, the new row is the one kept.
+        """
+        late = {}
+        for i in np.flatnonzero(~duplicate[:self.n_base_rows]):
+            if keys[i] is not None and keys[i] not in self.embedding_store and keys[i] not in late:
+                late[keys[i]] = sources[i]
+        for key, src in late.items():
+            if src.startswith('http'):
+                late[key] = read_image_bytes(src, self.fetcher)  # From the HTTP cache
+        if late:
+            matrix, ok = self.pipeline.run(list(late.values()))
+            self.embedding_store.put_many([key for key, good in zip(late, ok) if good], matrix[ok])
+        return list(late)
+    
+    def _compact_meta(self, df):
+        """Metadata table aligned with the embedding matrix"""
+        meta = df.reindex(columns=META_COLUMNS).reset_index(drop=True)
+        for col in ['Plant_Name', 'Species', 'Source']:
+            meta[col] = meta[col].astype('category')
+        for col in ['N', 'P', 'K', 'N_norm', 'P_norm', 'K_norm']:
+            meta[col] = meta[col].astype(np.float32)
+        return meta
+    
+    def _set_meta(self, meta):
+        self.meta = meta
+        # (rows, 3) normalized NPK, gathered by neighbour index at prediction time
+        self.npk = meta[['N_norm', 'P_norm', 'K_norm']].to_numpy(dtype=np.float64)
+    
+    def _get_image_embeddings(self, images, return_data=False):
+        """Embeddings for image paths/URLs/bytes (from the query cache, the store, or new).
+        
+        Returns one entry per image: a normalized vector, or the exception
+        that stopped it from being embedded. With return_data=True, returns
+        (embeddings, image bytes) so callers reuse what was read here.
+        """
+        results = [None] * len(images)
+        sources = hash_sources(images)
+        
+        # Read and hash in threads; the cache is keyed by content, so an
+        # overwritten file is a miss, not a stale hit
+        to_encode = {}  # content hash -> (image bytes, rows wanting it)
+        for i, (key, data) in enumerate(sources):
+            if isinstance(key, Exception):
+                results[i] = key
+                continue
+            if key in to_encode:
+                to_encode[key][1].append(i)
+                continue
+            embedding = self.query_cache.get(key)
+            if embedding is None:
+                embedding = self.embedding_store.get(key)
+                if embedding is not None:
+                    embedding = l2_normalize(embedding)
+                    self.query_cache.put(key, embedding)
+            if embedding is None:
+                to_encode[key] = (data, [i])
+            else:
+                results[i] = embedding
+        
+        # Encode only what neither the cache nor the store has
+        batch_size = self.pipeline.batch_size
+        pending = list(to_encode.items())
+        for start in range(0, len(pending), batch_size):
+            chunk = []
+            for key, (data, rows) in pending[start:start + batch_size]:
                 try:
-                    embedding = self._get_image_embedding(img_path)
-                    self.df.at[idx, 'embedding'] = embedding
-                    self.df.at[idx, 'image_available'] = True
+                    chunk.append((key, rows, preprocess(data, IMAGE_SIZE)))
                 except Exception as e:
-                    print(f"Error processing image {img_path}: {e}")
+                    for i in rows:
+                        results[i] = e
+            if chunk:
+                encoded = self.encode_batch(np.stack([array for _, _, array in chunk]))
+                for (key, rows, _), embedding in zip(chunk, encoded):
+                    embedding = l2_normalize(np.asarray(embedding, dtype=np.float32))
+                    self.query_cache.put(key, embedding)
+                    for i in rows:
+                        results[i] = embedding
+        if return_data:
+            return results, [data for _, data in sources]
+        return results
     
     def _get_image_embedding(self, img_path):
-        """Get embedding for an image (from cache or new)"""
-        if img_path in self.image_cache:
-            return self.image_cache[img_path]
+        """Get embedding for a single image"""
+        embedding = self._get_image_embeddings([img_path])[0]
+        if isinstance(embedding, Exception):
+            raise embedding
+        return embedding
+    
+    def _build_index(self):
+        """Build the neighbour index, reusing a saved one built from the same rows"""
+        if len(self.embeddings) == 0:
+            raise ValueError("No valid images with embeddings found in dataset")
         
-        if img_path.startswith('http'):
-            response = requests.get(img_path)
-            img = Image.open(BytesIO(response.content)).convert("RGB")
+        if self.index_kind == "exact":
+            # Nothing to precompute beyond the normalized matrix already in memory
+            self._index = make_index("exact").build(self.embeddings)
         else:
-            img = Image.open(img_path).convert("RGB")
+            self._index = load_index(self.index_path, fingerprint=self._index_fingerprint())
+            if self._index is not None and self._index.kind == self.index_kind:
+                print(f"Loaded {self.index_kind} index ({len(self._index)} vectors, memory-mapped)")
+            else:
+                print(f"Building {self.index_kind} index over {len(self.embeddings)} vectors...")
+                self._index = make_index(self.index_kind, **self.index_params).build(self.embeddings)
+                self._save_index(full=True)
+        self._index.remove(np.flatnonzero(~self.active))
+    
+    def _index_fingerprint(self):
+        # Same rows in the same order with the same parameters -> same index
+        return content_hash("\n".join([repr(sorted(self.index_params.items()))]
+                                       + self.row_keys).encode())
+    
+    def _save_index(self, full=False):
+        """Persist the index (exact indexes are rebuilt from the store instead)"""
+        if self.index_path is None:
+            return
+        save = self.index.save if full else self.index.save_updates
+        save(self.index_path, fingerprint=self._index_fingerprint())
+    
+    def add_samples(self, images, npk_values, plant_name=None, species=None, source="Runtime sample"):
+        """Add labelled images (paths, URLs or bytes) to the reference set without a rebuild.
         
-        img_tensor = self.transform(img).unsqueeze(0).to(self.device)
+        npk_values has one (N, P, K) per image. Returns the images' content keys.
+        """
+        if len(images) != len(npk_values):
+            raise ValueError("Need one NPK value per image")
+        os.makedirs(self.samples_dir, exist_ok=True)
         
-        with torch.no_grad():
-            embedding = self.model.encode_image(img_tensor).cpu().numpy()[0]
+        # Keep a copy of each image so the sample survives a model change
+        records, missing = [], {}
+        for image, (n, p, k) in zip(images, npk_values):
+            data = bytes(image) if isinstance(image, (bytes, bytearray)) else read_image_bytes(image)
+            key = content_hash(data)
+            path = os.path.join(self.samples_dir, f"{key}.img")
+            if not os.path.exists(path):
+                with open(path, 'wb') as f:
+                    f.write(data)
+            records.append({'op': 'add', 'key': key, 'path': path, 'Plant_Name': plant_name,
+                            'Species': species, 'Source': source,
+                            'N': float(n), 'P': float(p), 'K': float(k)})
+            if key not in self.embedding_store:
+                missing[key] = data
         
-        self.image_cache[img_path] = embedding
-        return embedding
-    
-    def _build_knn_model(self):
-        """Build KNN model from available embeddings"""
-        valid_embeddings = self.df[self.df['image_available']]['embedding'].tolist()
-        if len(valid_embeddings) == 0:
-            raise ValueError("No valid images with embeddings found in dataset")
+        batch_size = self.pipeline.batch_size
+        missing_keys = list(missing)
+        for start in range(0, len(missing_keys), batch_size):
+            chunk = missing_keys[start:start + batch_size]
+            batch = np.stack([preprocess(missing[key], IMAGE_SIZE) for key in chunk])
+            self.embedding_store.put_many(chunk, self.encode_batch(batch))
         
-        self.knn = NearestNeighbors(n_neighbors=3, metric='cosine')
-        self.knn.fit(np.stack(valid_embeddings))
+        keys = [rec['key'] for rec in records]
+        stored, _ = self.embedding_store.get_many(keys)
+        vectors = l2_normalize(stored).astype(self.embedding_dtype, copy=False)
+        
+        # Log first: if we crash before the index is saved, its fingerprint no longer
+        # matches and the next start rebuilds it rather than using a stale one
+        self.sample_log.append(records)
+        self.index.add(vectors)
+        if self.index_kind == "exact":
+            self.embeddings = self.index.vectors  # Share the matrix instead of holding two copies
+        else:
+            self.embeddings = np.concatenate([self.embeddings, vectors])
+        new_meta = self._normalize_npk(self._samples_frame(records))
+        self._set_meta(self._compact_meta(pd.concat([self.meta, self._compact_meta(new_meta)],
+                                                     ignore_index=True)))
+        self.row_keys += keys
+        self.row_records += records
+        self.active = np.concatenate([self.active, np.ones(len(records), dtype=bool)])
+        
+        self._after_update()
+        return keys
     
-    def analyze_plant(self, image_path_or_url, plant_name=None):
-        """Full analysis pipeline for a plant image"""
-        # Get image embedding
-        try:
-            embedding = self._get_image_embedding(image_path_or_url)
-        except Exception as e:
-            return {"error": f"Could not process image: {e}"}
+    def remove_samples(self, keys):
+        """Tombstone every reference row with one of these content keys; returns rows removed"""
+        keys = set(keys)
+        rows = [i for i, key in enumerate(self.row_keys) if key in keys and self.active[i]]
+        if not rows:
+            return 0
         
-        # Find nearest neighbors
-        distances, indices = self.knn.kneighbors([embedding])
+        self.sample_log.append([{'op': 'remove', 'key': key}
+                                for key in sorted({self.row_keys[i] for i in rows})])
+        self.index.remove(rows)
+        self.active[rows] = False
         
-        # Get NPK values from nearest neighbors
-        similar_plants = self.df.iloc[indices[0]]
-        weights = 1 / (distances[0] + 1e-6)
-        weights /= weights.sum()
+        self._after_update()
+        return len(rows)
+    
+    def _after_update(self):
+        if self.index.pending() > self.compact_ratio * max(len(self.index), 1):
+            self.compact()
+        else:
+            self._save_index()
+    
+    def compact(self):
+        """Drop tombstoned rows and fold added vectors into the index's main arrays"""
+        keep = self.active
+        self.index.compact()
+        if self.index_kind == "exact":
+            self.embeddings = self.index.vectors
+        else:
+            self.embeddings = self.embeddings[keep]
+        self._set_meta(self.meta[keep].reset_index(drop=True))
+        self.row_keys = [key for key, alive in zip(self.row_keys, keep) if alive]
+        self.row_records = [rec for rec, alive in zip(self.row_records, keep) if alive]
+        self.active = np.ones(len(self.row_keys), dtype=bool)
+        
+        # Rewrite the log to replay to exactly this state: removals that still
+        # apply to dataset rows, surviving additions in row order, then a compact marker
+        surviving_base = {key for key, rec in zip(self.row_keys, self.row_records) if rec is None}
+        removed = {rec['key'] for rec in self.sample_log.records if rec['op'] == 'remove'}
+        removed = (removed | self.base_keys) - surviving_base
+        self.sample_log.rewrite([{'op': 'remove', 'key': key} for key in sorted(removed)]
+                                + [rec for rec in self.row_records if rec is not None]
+                                + [{'op': 'compact'}])
+        self._save_index(full=True)
+        print(f"Compacted reference set to {len(self.row_keys)} samples")
+    
+    def analyze_plants(self, images, plant_names=None, describe=True, visualize=False):
+        """Analyze a batch of plant images (paths, URLs or bytes) with one neighbour query.
         
-        predicted_npk = np.zeros(3)
-        for i, (_, row) in enumerate(similar_plants.iterrows()):
-            predicted_npk += weights[i] * row[['N_norm', 'P_norm', 'K_norm']].values
+        describe=True generates a description when the cache has none for
+        this NPK bucket and nearest reference image, "cached" returns only
+        cached text (None otherwise), False skips descriptions. With
+        visualize=True each result also carries a PNG of its NPK triangle
+        under "visualization"; otherwise call visualize_npk when it's needed.
+        """
+        plant_names = plant_names or [None] * len(images)
+        # Descriptions reuse these bytes: a query URL (e.g. a camera) is read once, uncached
+        embeddings, image_data = self._get_image_embeddings(images, return_data=True)
+        results = [{"error": f"Could not process image: {e}"} if isinstance(e, Exception) else None
+                   for e in embeddings]
+        ok = [i for i, result in enumerate(results) if result is None]
+        if not ok:
+            return results
+        n_live = int(self.active.sum())
+        if n_live == 0:
+            # Every reference row is tombstoned: there is nothing to predict from
+            for i in ok:
+                results[i] = {"error": "No reference samples available; add samples before analyzing"}
+            return results
         
-        # Generate description
-        description = self._generate_description(image_path_or_url, predicted_npk)
+        # Find nearest neighbors for the whole batch; never more than there are live rows,
+        # so no tombstoned row (at -inf score) can be picked as a neighbour
+        distances, indices = self.index.search(np.stack([embeddings[i] for i in ok]), min(self.n_neighbors, n_live))
         
-        # Visualize
-        self._visualize_npk(predicted_npk, plant_name)
+        # Weighted NPK of each image's neighbours: (B, k) x (B, k, 3) -> (B, 3)
+        weights = neighbour_weights(distances, self.weighting)
+        predicted = np.einsum('bk,bkc->bc', weights, self.npk[indices])
         
-        return {
-            "npk": predicted_npk.round().astype(int),
-            "description": description,
-            "similar_plants": similar_plants[['Plant_Name', 'Species', 'N', 'P', 'K', 'Source']].to_dict('records')
-        }
+        for row, i in enumerate(ok):
+            similar_plants = self.meta.iloc[indices[row]]
+            
+            # Description, memoized by NPK bucket and nearest reference image
+            description = None
+            if describe:
+                cluster = self.row_keys[indices[row][0]]
+                description = self.description_cache.get(predicted[row], cluster)
+                if description is None and describe != "cached":
+                    description = self._generate_description(image_data[i], predicted[row])
+                    self.description_cache.put(predicted[row], cluster, description)
+            
+            results[i] = {
+                "npk": predicted[row].round().astype(int),
+                "description": description,
+                "similar_plants": similar_plants[['Plant_Name', 'Species', 'N', 'P', 'K', 'Source']].to_dict('records')
+            }
+            if visualize:
+                results[i]["visualization"] = self.visualize_npk(predicted[row], plant_names[i])
+        return results
+    
+    def analyze_plant(self, image_path_or_url, plant_name=None, describe=True, visualize=False):
+        """Full analysis pipeline for a plant image"""
+        return self.analyze_plants([image_path_or_url], [plant_name], describe, visualize)[0]
+    
+    def _generate_description(self, data, npk):
+        """Moondream's description of the plant (image bytes) in light of its predicted NPK"""
+        # Same preprocessing and tensor input as the embedding path
+        batch = preprocess(data)[None]
+        n, p, k = npk
+        question = (f"The predicted nutrient balance of this plant is N {n:.0f}%, P {p:.0f}%, K {k:.0f}%. "
+                    "Describe its visible condition and any signs of nutrient deficiency or excess.")
+        return self.model.answer_question(moondream_features(self.model, self.device, batch), question,
+                                          self.tokenizer)
+    
+    def visualize_npk(self, npk, plant_name=None):
+        """PNG bytes of the NPK triangle with this prediction marked (cached by rounded NPK)"""
+        return self.plotter.render(npk, plant_name)
 
 # Example usage
 if __name__ == "__main__":
@@ -222,7 +733,8 @@ if __name__ == "__main__":
     # Analyze a plant (can be URL or local path)
     result = analyzer.analyze_plant(
         image_path_or_url="path/to/your_plant_image.jpg",
-        plant_name="Test Plant"
+        plant_name="Test Plant",
+        visualize=True
     )
     
     print("Analysis Results:")
@@ -230,4 +742,8 @@ if __name__ == "__main__":
     print(f"Description: {result['description']}")
     print("Similar Plants in Dataset:")
     for plant in result['similar_plants']:
-        print(f"- {plant['Plant_Name']} ({plant['Species']}) NPK: {plant['N']}-{plant['P']}-{plant['K']} [Source: {plant['Source']}]")
\ No newline at end of file
+        print(f"- {plant['Plant_Name']} ({plant['Species']}) NPK: {plant['N']}-{plant['P']}-{plant['K']} [Source: {plant['Source']}]")
+    if 'visualization' in result:
+        with open("npk_triangle.png", "wb") as f:
+            f.write(result['visualization'])
+        print("NPK triangle saved to npk_triangle.png")
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""
+Simulated comparison of the climate strategies in mega.py.
+
+A simple first-order grow-bed model (diurnal outside temperature and
+humidity, fan/Peltier cooling, evaporative spray) is driven by:
+  - fixed_2h:   the current schedule, fan/spray/Peltier 10s each every 2 hours
+  - fixed_15m:  a hypothetical timer, the same schedule stretched to 15 min
+                per device (not something mega.py has ever run)
+  - closed_loop: climate.ClimateController fed by the simulated DHT22
+
+Reports tracking error, time in band, duty cycle, energy and relay
+switches per day. Against the current schedule the closed loop is a
+regression on cost: roughly 40x the energy and ~1.4x the relay switches
+(159 vs 4 Wh/day, 104 vs 72 switches/day over 2 days), in exchange for
+holding the bed in band 83% of the time instead of 18%.
+
+Usage: python benchmarks/climate_bench.py [--days 2] [--json]
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from climate import ClimateController
+
+STEP = 5  # Seconds per simulation step
+TEMP_TARGET = 24.0
+HUMIDITY_TARGET = 60.0
+POWER_W = {"fan": 12, "spray": 25, "peltier": 72}
+PINS = {"fan": 16, "spray": 26, "peltier": 4}
+
+
+class GrowBed:
+    """First-order thermal/humidity model of the enclosure"""
+    def __init__(self, seed=0):
+        self.temperature = 26.0
+        self.humidity = 55.0
+        self.rng = random.Random(seed)
+
+    def outside(self, t):
+        phase = 2 * math.pi * (t / 86400 - 0.375)  # Warmest mid-afternoon
+        return 27 + 5 * math.sin(phase), 55 - 15 * math.sin(phase)
+
+    def step(self, t, relays):
+        t_out, h_out = self.outside(t)
+        dT = (t_out - self.temperature) / 1800 + 0.0004  # Lights/plants add heat
+        dH = (h_out - self.humidity) / 2400 + 0.001      # Transpiration
+        if relays["fan"]:
+            dT -= 0.004
+            dH -= 0.006
+        if relays["peltier"]:
+            dT -= 0.01
+        if relays["spray"]:
+            dT -= 0.002
+            dH += 0.08
+        self.temperature += dT * STEP
+        self.humidity = min(100.0, max(0.0, self.humidity + dH * STEP))
+
+    def read(self):
+        """DHT22-like reading with noise"""
+        return (self.temperature + self.rng.gauss(0, 0.1),
+                self.humidity + self.rng.gauss(0, 1.0))
+
+
+def fixed_policy(seconds_each):
+    """Sequential fan -> spray -> peltier run every 2 hours"""
+    def relays(t, reading):
+        into = t % 7200
+        return {
+            "fan": into < seconds_each,
+            "spray": seconds_each <= into < 2 * seconds_each,
+            "peltier": 2 * seconds_each <= into < 3 * seconds_each,
+        }
+    return relays
+
+
+def closed_loop_policy():
+    controller = ClimateController(lambda pin, level: None, PINS["fan"], PINS["spray"],
+                                   PINS["peltier"], TEMP_TARGET, HUMIDITY_TARGET)
+
+    def relays(t, reading):
+        return controller.update(reading[0], reading[1], now=t)
+    return relays
+
+
+def simulate(policy, days):
+    bed = GrowBed()
+    state = {name: False for name in POWER_W}
+    on_time = {name: 0 for name in POWER_W}
+    switches = 0
+    sq_temp = sq_hum = 0.0
+    in_band = 0
+    steps = int(days * 86400 / STEP)
+
+    for i in range(steps):
+        t = i * STEP
+        new_state = policy(t, bed.read())
+        switches += sum(new_state[name] != state[name] for name in state)
+        state = dict(new_state)
+        bed.step(t, state)
+        for name, on in state.items():
+            on_time[name] += STEP if on else 0
+
+        sq_temp += (bed.temperature - TEMP_TARGET) ** 2
+        sq_hum += (bed.humidity - HUMIDITY_TARGET) ** 2
+        if abs(bed.temperature - TEMP_TARGET) <= 1.5 and abs(bed.humidity - HUMIDITY_TARGET) <= 10:
+            in_band += 1
+
+    total = steps * STEP
+    energy_wh = sum(POWER_W[name] * on_time[name] for name in POWER_W) / 3600
+    return {
+        "temp_rmse_c": math.sqrt(sq_temp / steps),
+        "humidity_rmse_pct": math.sqrt(sq_hum / steps),
+        "time_in_band_pct": 100 * in_band / steps,
+        "duty_pct": {name: 100 * on_time[name] / total for name in POWER_W},
+        "energy_wh_per_day": energy_wh / days,
+        "switches_per_day": switches / days,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=float, default=2)
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    results = {
+        "fixed_2h": simulate(fixed_policy(10), args.days),
+        "fixed_15m": simulate(fixed_policy(900), args.days),
+        "closed_loop": simulate(closed_loop_policy(), args.days),
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'strategy':<12} {'T rmse':>7} {'RH rmse':>8} {'in band':>8} "
+          f"{'fan%':>6} {'spray%':>7} {'pelt%':>6} {'Wh/day':>7} {'sw/day':>7}")
+    for name, r in results.items():
+        d = r["duty_pct"]
+        print(f"{name:<12} {r['temp_rmse_c']:>7.2f} {r['humidity_rmse_pct']:>8.1f} "
+              f"{r['time_in_band_pct']:>7.1f}% {d['fan']:>6.1f} {d['spray']:>7.1f} "
+              f"{d['peltier']:>6.1f} {r['energy_wh_per_day']:>7.0f} {r['switches_per_day']:>7.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Compare the Moondream encoder's CPU inference modes against fp32.
+
+For each --modes entry, loads a fresh model (int8 quantizes in place),
+embeds the same images and reports:
+  - images/sec and speedup over fp32
+  - cosine similarity to the fp32 embedding of each image (mean and min)
+  - nearest-neighbour agreement: how often an image's nearest other
+    image in the sample is the same as under fp32
+
+Usage: python benchmarks/cpu_inference.py IMAGE_DIR [--limit 64]
+           [--modes fp32 int8 traced] [--threads 1 4] [--batch-size 8] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import torch
+from moondream import Moondream
+
+from ai import MODEL_ID, l2_normalize
+from embed_tuning import list_images
+from npk_embed import IMAGE_SIZE, INFERENCE_MODES, moondream_encoder, preprocess
+
+
+def nearest_other(embeddings):
+    sims = embeddings @ embeddings.T
+    np.fill_diagonal(sims, -np.inf)
+    return sims.argmax(axis=1)
+
+
+def run_mode(mode, threads, batches):
+    model = Moondream.from_pretrained(MODEL_ID).to("cpu").eval()
+    encode_batch = moondream_encoder(model, "cpu", mode, threads)
+    encode_batch(batches[0])  # Warm-up (and trace) outside the timing
+
+    started = time.perf_counter()
+    embeddings = np.concatenate([encode_batch(batch) for batch in batches])
+    elapsed = time.perf_counter() - started
+    return l2_normalize(embeddings), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("image_dir")
+    parser.add_argument("--limit", type=int, default=64)
+    parser.add_argument("--modes", nargs="+", default=list(INFERENCE_MODES), choices=INFERENCE_MODES)
+    parser.add_argument("--threads", type=int, nargs="+", default=[torch.get_num_threads()])
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    images = list_images(args.image_dir, args.limit)
+    if len(images) < 2:
+        sys.exit(f"Need at least 2 images under {args.image_dir}")
+    arrays = np.stack([preprocess(path, IMAGE_SIZE) for path in images])
+    batches = [arrays[i:i + args.batch_size] for i in range(0, len(arrays), args.batch_size)]
+
+    results = []
+    for threads in args.threads:
+        reference, reference_time = run_mode("fp32", threads, batches)
+        reference_nn = nearest_other(reference)
+        for mode in args.modes:
+            if mode == "fp32":
+                embeddings, elapsed = reference, reference_time
+            else:
+                embeddings, elapsed = run_mode(mode, threads, batches)
+            cosine = (embeddings * reference).sum(axis=1)
+            results.append({
+                "mode": mode,
+                "threads": threads,
+                "images_per_sec": len(images) / elapsed,
+                "speedup": reference_time / elapsed,
+                "cosine_mean": float(cosine.mean()),
+                "cosine_min": float(cosine.min()),
+                "nn_agreement": float((nearest_other(embeddings) == reference_nn).mean()),
+            })
+            if not args.json:
+                r = results[-1]
+                print(f"{mode:<7} threads={threads:<3} {r['images_per_sec']:7.2f} img/s  "
+                      f"x{r['speedup']:.2f}  cos mean {r['cosine_mean']:.4f} min {r['cosine_min']:.4f}  "
+                      f"NN agree {100 * r['nn_agreement']:.0f}%")
+
+    if args.json:
+        print(json.dumps({"images": len(images), "batch_size": args.batch_size, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
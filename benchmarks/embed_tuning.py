@@ -0,0 +1,79 @@
+"""
+Sweep batch size and worker count for the embedding pipeline.
+
+Embeds a sample of images from a directory with every combination of
+--batch-sizes and --workers and reports images/sec, so the defaults for
+ComprehensivePlantNPKAnalyzer(batch_size=..., num_workers=...) can be
+tuned per machine (CPU-only boxes in particular).
+
+Usage: python benchmarks/embed_tuning.py IMAGE_DIR [--limit 128]
+           [--batch-sizes 1 4 8 16 32] [--workers 1 2 4] [--threads N] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import torch
+from moondream import Moondream
+
+from ai import MODEL_ID
+from npk_embed import IMAGE_SIZE, EmbeddingPipeline, moondream_encoder
+
+
+def list_images(root, limit):
+    images = []
+    for dirpath, _, files in os.walk(root):
+        for file in sorted(files):
+            if file.lower().endswith(('.png', '.jpg', '.jpeg')):
+                images.append(os.path.join(dirpath, file))
+                if len(images) >= limit:
+                    return images
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("image_dir")
+    parser.add_argument("--limit", type=int, default=128, help="Images per configuration")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model = Moondream.from_pretrained(MODEL_ID).to(device)
+    encode_batch = moondream_encoder(model, device)
+
+    images = list_images(args.image_dir, args.limit)
+    if not images:
+        sys.exit(f"No images found under {args.image_dir}")
+
+    # Warm up so the first configuration doesn't pay for lazy init
+    EmbeddingPipeline(encode_batch, IMAGE_SIZE, batch_size=2, num_workers=1).run(images[:2])
+
+    results = []
+    for workers in args.workers:
+        for batch_size in args.batch_sizes:
+            pipeline = EmbeddingPipeline(encode_batch, IMAGE_SIZE, batch_size, workers)
+            pipeline.run(images)
+            stats = dict(pipeline.last_stats, device=device, torch_threads=torch.get_num_threads())
+            results.append(stats)
+            if not args.json:
+                print(f"workers={workers:<3} batch={batch_size:<4} {stats['images_per_sec']:8.2f} img/s")
+
+    best = max(results, key=lambda r: r["images_per_sec"])
+    if args.json:
+        print(json.dumps({"results": results, "best": best}, indent=2))
+    else:
+        print(f"Best: batch_size={best['batch_size']}, num_workers={best['num_workers']} "
+              f"({best['images_per_sec']:.2f} img/s on {device})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Benchmark URL image fetching against a local HTTP server.
+
+Serves the images in a directory from a ThreadingHTTPServer that adds
+--latency-ms per response and answers --fail-rate of first requests with
+503, then compares:
+  - sequential: one requests.get() per URL, no retries (the old path)
+  - pooled:     Fetcher + iter_hashed, cold disk cache
+  - cached:     the same again, served from the disk cache
+reporting wall time, images/sec and failures for each.
+
+Usage: python benchmarks/fetch_bench.py IMAGE_DIR [--limit 200] [--latency-ms 50]
+           [--fail-rate 0.05] [--workers 16] [--json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from npk_embed import iter_hashed
+from npk_fetch import Fetcher
+from npk_sources import DirectorySource
+
+
+def serve(images, latency, fail_rate, seed=0):
+    """Start a server for images (name -> bytes) on a free port; returns (server, base_url)"""
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    failed = set()  # Each path fails at most once, so retries can succeed
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive
+
+        def do_GET(self):
+            time.sleep(latency)
+            name = self.path.lstrip("/")
+            with lock:
+                fail = name not in failed and rng.random() < fail_rate
+                if fail:
+                    failed.add(name)
+            if name not in images or fail:
+                self.send_response(404 if name not in images else 503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = images[name]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", f'"{hash(body) & 0xffffffff:x}"')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def run_sequential(urls):
+    failures = 0
+    started = time.perf_counter()
+    for url in urls:
+        try:
+            requests.get(url, timeout=30).raise_for_status()
+        except requests.RequestException:
+            failures += 1
+    return time.perf_counter() - started, failures
+
+
+def run_pooled(urls, fetcher, workers):
+    failures = 0
+    started = time.perf_counter()
+    for _, key, _, _ in iter_hashed(urls, workers, fetcher):
+        failures += isinstance(key, Exception)
+    return time.perf_counter() - started, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("image_dir")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--fail-rate", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    source = DirectorySource(args.image_dir)
+    members = source.members()[:args.limit]
+    if not members:
+        sys.exit(f"No images found under {args.image_dir}")
+    images = {f"img{i}": source.read(member) for i, member in enumerate(members)}
+
+    results = []
+
+    def report(name, urls, elapsed, failures, stats=None):
+        results.append({"mode": name, "seconds": elapsed, "images_per_sec": len(urls) / elapsed,
+                        "failures": failures, "fetcher": stats})
+        if not args.json:
+            extra = f"  requests {stats['requests']}  cache hits {stats['cache_hits']}" if stats else ""
+            print(f"{name:<10} {elapsed:7.2f}s  {len(urls) / elapsed:8.1f} img/s  failures {failures}{extra}")
+
+    # A fresh server per network run, so each sees the same injected failures
+    server, base = serve(images, args.latency_ms / 1000, args.fail_rate)
+    urls = [f"{base}/{image}" for image in images]
+    report("sequential", urls, *run_sequential(urls))
+    server.shutdown()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        server, base = serve(images, args.latency_ms / 1000, args.fail_rate)
+        urls = [f"{base}/{image}" for image in images]
+        fetcher = Fetcher(cache_dir, pool_size=args.workers, backoff=0.05)
+        report("pooled", urls, *run_pooled(urls, fetcher, args.workers), fetcher.stats)
+        server.shutdown()  # The cached run must not need the network
+
+        fetcher = Fetcher(cache_dir, pool_size=args.workers)
+        report("cached", urls, *run_pooled(urls, fetcher, args.workers), fetcher.stats)
+
+    if args.json:
+        print(json.dumps({"images": len(images), "latency_ms": args.latency_ms, "fail_rate": args.fail_rate,
+                          "workers": args.workers, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Recall and latency of the NPK neighbour indexes as the dataset grows.
+
+Builds ExactIndex and IVFIndex over synthetic clustered, L2-normalized
+embeddings (a stand-in for image embeddings: many near-duplicate shots
+of a few plant types) and reports, for each size:
+  - build time, and load time of the saved index (memory-mapped)
+  - single-query latency p50/p99
+  - recall@k of IVF against the exact results, per --probes setting
+
+sklearn's brute-force NearestNeighbors(metric='cosine') is included for
+reference when sklearn is installed.
+
+Usage: python benchmarks/index_bench.py [--sizes 1000 10000 50000]
+           [--dim 512] [--queries 200] [--k 3] [--probes 1 4 8 16] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from npk_index import ExactIndex, IVFIndex, load_index
+
+
+def synthetic(n, dim, n_queries, seed=0):
+    """Clustered unit vectors plus queries drawn near (not on) dataset points"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(8, n // 200), dim)).astype(np.float32)
+    data = centers[rng.integers(0, len(centers), n)] + 0.6 * rng.normal(size=(n, dim)).astype(np.float32)
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    queries = data[rng.integers(0, n, n_queries)] + 0.3 * rng.normal(size=(n_queries, dim)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return data, queries
+
+
+def latency(search, queries, k):
+    """Per-query seconds, one query at a time as analyze_plant issues them"""
+    times = []
+    for query in queries:
+        started = time.perf_counter()
+        search(query, k)
+        times.append(time.perf_counter() - started)
+    return {"p50_ms": 1000 * float(np.percentile(times, 50)),
+            "p99_ms": 1000 * float(np.percentile(times, 99))}
+
+
+def recall(found, truth):
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def bench_size(n, args):
+    data, queries = synthetic(n, args.dim, args.queries)
+    results = {}
+
+    exact = ExactIndex(data)
+    _, truth = exact.search(queries, args.k)
+    results["exact"] = latency(exact.search, queries, args.k)
+
+    try:
+        from sklearn.neighbors import NearestNeighbors
+        started = time.perf_counter()
+        knn = NearestNeighbors(n_neighbors=args.k, metric='cosine').fit(data)
+        build = time.perf_counter() - started
+        results["sklearn"] = dict(latency(lambda q, k: knn.kneighbors([q], k), queries, args.k),
+                                  build_s=build)
+    except ImportError:
+        pass
+
+    started = time.perf_counter()
+    ivf = IVFIndex(seed=0).build(data)
+    build = time.perf_counter() - started
+    with tempfile.TemporaryDirectory() as path:
+        ivf.save(path)
+        started = time.perf_counter()
+        loaded = load_index(path)
+        load = time.perf_counter() - started
+        for n_probe in args.probes:
+            loaded.n_probe = n_probe
+            _, found = loaded.search(queries, args.k)
+            results[f"ivf/{n_probe}"] = dict(latency(loaded.search, queries, args.k),
+                                            recall=recall(found, truth), build_s=build,
+                                            load_s=load, n_lists=loaded.n_lists)
+        del loaded
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    results = {n: bench_size(n, args) for n in args.sizes}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'N':>7} {'backend':<10} {'p50 ms':>8} {'p99 ms':>8} {'recall':>7} {'build s':>8} {'load s':>7}")
+    for n, by_backend in results.items():
+        for name, r in by_backend.items():
+            print(f"{n:>7} {name:<10} {r['p50_ms']:>8.3f} {r['p99_ms']:>8.3f} "
+                  f"{r.get('recall', 1.0):>7.3f} {r.get('build_s', 0):>8.2f} {r.get('load_s', 0):>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Accuracy-vs-latency evaluation of the NPK analyzer.
+
+Builds a ComprehensivePlantNPKAnalyzer over a labelled image set, either
+the real datasets (--csv/--tomato-zip/--kaggle-dataset) or --synthetic N
+generated images whose colours follow their NPK label, then runs k-fold
+cross-validation over the reference embeddings. For every index backend,
+n_neighbors value and weighting scheme it reports NPK mean absolute error
+(percentage points, overall and per nutrient) next to a predict-the-mean
+baseline, plus:
+  - embedding throughput (images/sec through the analyzer's pipeline)
+  - index build time and single-query search latency p50/p99 per backend
+  - peak RSS of the process
+--json prints everything as one document for regression tracking.
+
+Usage: python benchmarks/npk_eval.py (--synthetic 500 | --csv data.csv --tomato-zip tomato.zip)
+           [--folds 5] [--backends exact ivf] [--neighbors 1 3 5 10]
+           [--weightings inverse uniform softmax] [--json]
+"""
+import argparse
+import contextlib
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import zipfile
+
+import numpy as np
+import pandas as pd
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ai import KAGGLE_DIR, WEIGHTINGS, ComprehensivePlantNPKAnalyzer, neighbour_weights
+from npk_index import make_index
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+
+def synthetic_dataset(root, n, seed=0):
+    """Write n leaf images labelled with random NPK, plus the files the analyzer expects.
+
+    Nitrogen deepens the green, phosphorus adds a purple cast, potassium
+    browns the leaf margins; shape, position and noise vary freely.
+    """
+    rng = np.random.default_rng(seed)
+    images_dir = os.path.join(root, "images")
+    os.makedirs(images_dir, exist_ok=True)
+    rows = []
+    for i, (n_, p, k) in enumerate(100 * rng.dirichlet([2, 2, 2], size=n)):
+        image = Image.new("RGB", (256, 256), tuple(int(v) for v in rng.integers(70, 120, 3)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(rng.integers(3, 7)):
+            cx, cy = rng.integers(40, 216, 2)
+            rx, ry = rng.integers(20, 50, 2)
+            leaf = (int(40 + 1.2 * p), int(90 + 1.3 * n_), int(30 + 0.8 * p))
+            margin = (int(60 + 1.5 * k), int(90 + 0.5 * k), 30)
+            draw.ellipse([cx - rx, cy - ry, cx + rx, cy + ry], fill=leaf, outline=margin, width=int(2 + k / 10))
+        pixels = np.asarray(image, dtype=np.float32) + rng.normal(0, 8, (256, 256, 3))
+        path = os.path.join(images_dir, f"leaf_{i:05d}.png")
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(path)
+        rows.append({"Plant_Name": "Synthetic", "Species": "Synthetic", "Image_Path": path,
+                     "N": n_, "P": p, "K": k, "Source": "Synthetic"})
+
+    csv_path = os.path.join(root, "synthetic.csv")
+    pd.DataFrame(rows).to_csv(csv_path, index=False)
+    tomato_zip = os.path.join(root, "empty.zip")
+    zipfile.ZipFile(tomato_zip, "w").close()
+    # A non-empty Kaggle directory without images: nothing to download, nothing to add
+    os.makedirs(os.path.join(root, KAGGLE_DIR), exist_ok=True)
+    open(os.path.join(root, KAGGLE_DIR, "README"), "w").close()
+    return csv_path, tomato_zip
+
+
+def folds(n, k, seed=0):
+    order = np.random.default_rng(seed).permutation(n)
+    return np.array_split(order, k)
+
+
+def search_latency(index, queries, k):
+    times = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query[None], k)
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def evaluate(embeddings, npk, args):
+    """k-fold NPK error per (backend, n_neighbors, weighting), plus build/search timings"""
+    max_k = max(args.neighbors)
+    errors = {}   # (backend, k, weighting) -> list of (queries, 3) absolute errors
+    baseline = []
+    timings = {backend: {"build": [], "search": []} for backend in args.backends}
+    for fold in folds(len(embeddings), args.folds, args.seed):
+        train = np.setdiff1d(np.arange(len(embeddings)), fold)
+        baseline.append(np.abs(npk[fold] - npk[train].mean(axis=0)))
+        for backend in args.backends:
+            started = time.perf_counter()
+            index = make_index(backend).build(embeddings[train])
+            timings[backend]["build"].append(time.perf_counter() - started)
+            timings[backend]["search"] += search_latency(index, embeddings[fold[:args.latency_queries]], max_k)
+
+            # Top max_k once; smaller k are prefixes of the same sorted result
+            distances, indices = index.search(embeddings[fold], max_k)
+            neighbour_npk = npk[train][indices]
+            for k in args.neighbors:
+                for weighting in args.weightings:
+                    weights = neighbour_weights(distances[:, :k], weighting)
+                    predicted = np.einsum("bk,bkc->bc", weights, neighbour_npk[:, :k])
+                    errors.setdefault((backend, k, weighting), []).append(np.abs(predicted - npk[fold]))
+
+    def summary(chunks):
+        absolute = np.concatenate(chunks)
+        return {"mae": float(absolute.mean()), "rmse": float(np.sqrt((absolute ** 2).mean())),
+                **{f"mae_{c}": float(v) for c, v in zip("npk", absolute.mean(axis=0))}}
+
+    results = [dict(backend=backend, n_neighbors=k, weighting=weighting, **summary(chunks))
+               for (backend, k, weighting), chunks in errors.items()]
+    latency = {backend: {"build_s": float(np.mean(t["build"])),
+                         "search_p50_ms": 1000 * float(np.percentile(t["search"], 50)),
+                         "search_p99_ms": 1000 * float(np.percentile(t["search"], 99))}
+               for backend, t in timings.items()}
+    return results, latency, summary(baseline)
+
+
+def embedding_throughput(analyzer, n):
+    """Images/sec through the analyzer's pipeline (decode + encode) for up to n dataset images"""
+    sources = analyzer.df.loc[analyzer.df['image_available'], 'Image_Path'].dropna().tolist()[:n]
+    if not sources:
+        return None
+    analyzer.pipeline.run(sources[:1])  # Load the model outside the timing
+    analyzer.pipeline.run(sources)
+    return analyzer.pipeline.last_stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, help="Generate this many labelled images instead")
+    parser.add_argument("--csv")
+    parser.add_argument("--tomato-zip")
+    parser.add_argument("--kaggle-dataset", default="baronn/lettuce-npk-dataset")
+    parser.add_argument("--cache-dir", help="Default: embedding_cache, or embedding_cache_eval for --synthetic")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--backends", nargs="+", default=["exact", "ivf"], choices=["exact", "ivf"])
+    parser.add_argument("--neighbors", type=int, nargs="+", default=[1, 3, 5, 10])
+    parser.add_argument("--weightings", nargs="+", default=list(WEIGHTINGS), choices=WEIGHTINGS)
+    parser.add_argument("--latency-queries", type=int, default=200, help="Timed single queries per fold")
+    parser.add_argument("--throughput-images", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+    if not args.synthetic and not (args.csv and args.tomato_zip):
+        parser.error("pass --synthetic N, or --csv and --tomato-zip")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Synthetic runs get their own cache so they never replace the real datasets' frames
+        cache_dir = os.path.abspath(args.cache_dir or ("embedding_cache_eval" if args.synthetic else "embedding_cache"))
+        if args.synthetic:
+            csv_path, tomato_zip = synthetic_dataset(tmp, args.synthetic, args.seed)
+            os.chdir(tmp)  # The analyzer looks for KAGGLE_DIR in the working directory
+        else:
+            csv_path, tomato_zip = args.csv, args.tomato_zip
+
+        # Keep stdout to the JSON document when --json is given
+        with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+            started = time.perf_counter()
+            analyzer = ComprehensivePlantNPKAnalyzer(csv_path, tomato_zip, args.kaggle_dataset, cache_dir=cache_dir)
+            setup_seconds = time.perf_counter() - started
+            throughput = embedding_throughput(analyzer, args.throughput_images)
+
+        live = np.flatnonzero(analyzer.active)
+        embeddings = np.ascontiguousarray(analyzer.embeddings[live], dtype=np.float32)
+        npk = analyzer.npk[live]
+        if len(embeddings) < args.folds:
+            sys.exit(f"Only {len(embeddings)} labelled images with embeddings; need at least {args.folds}")
+        results, latency, baseline = evaluate(embeddings, npk, args)
+
+    report = {
+        "dataset": "synthetic" if args.synthetic else args.csv,
+        "images": len(embeddings),
+        "folds": args.folds,
+        "setup_seconds": setup_seconds,
+        "embedding": throughput,
+        "baseline": baseline,
+        "latency": latency,
+        "results": sorted(results, key=lambda r: r["mae"]),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    if throughput:
+        print(f"Embedding: {throughput['images_per_sec']:.1f} img/s "
+              f"(batch {throughput['batch_size']}, {throughput['num_workers']} workers)")
+    for backend, t in latency.items():
+        print(f"{backend:<6} build {1000 * t['build_s']:8.1f} ms  "
+              f"search p50 {t['search_p50_ms']:6.2f} ms  p99 {t['search_p99_ms']:6.2f} ms")
+    print(f"{len(embeddings)} images, {args.folds}-fold; baseline (predict mean) MAE {baseline['mae']:.2f}")
+    for r in report["results"]:
+        print(f"{r['backend']:<6} k={r['n_neighbors']:<3} {r['weighting']:<8} MAE {r['mae']:6.2f}  "
+              f"(N {r['mae_n']:.2f} P {r['mae_p']:.2f} K {r['mae_k']:.2f})  RMSE {r['rmse']:.2f}")
+    print(f"Peak RSS {report['peak_rss_mb']:.0f} MiB")
+
+
+if __name__ == "__main__":
+    main()
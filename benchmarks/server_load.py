@@ -0,0 +1,96 @@
+"""
+Load test for npk_server.py.
+
+Posts images from a directory to /analyze from --concurrency client
+threads for --duration seconds, then prints throughput, client-side
+latency percentiles and the server's /metrics (mean batch size, queue
+wait). Run it against servers started with different --max-batch /
+--max-wait-ms to see what micro-batching buys (--max-batch 1 disables it).
+
+Usage: python benchmarks/server_load.py IMAGE_DIR [--url http://localhost:5005]
+           [--concurrency 1 4 16] [--duration 20] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from npk_sources import DirectorySource
+
+
+def run_level(url, images, concurrency, duration):
+    latencies, failures = [], [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client(offset):
+        session = requests.Session()
+        i = offset
+        while time.perf_counter() < stop_at:
+            data = images[i % len(images)]
+            i += concurrency
+            started = time.perf_counter()
+            try:
+                response = session.post(f"{url}/analyze", data=data,
+                                        headers={"Content-Type": "image/jpeg"}, timeout=120)
+                ok = response.status_code == 200
+            except requests.RequestException:
+                ok = False
+            with lock:
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    failures[0] += 1
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    p50, p95, p99 = (np.percentile(latencies, [50, 95, 99]) * 1000) if latencies else (0, 0, 0)
+    return {"concurrency": concurrency, "requests": len(latencies), "failures": failures[0],
+            "requests_per_sec": len(latencies) / elapsed, "p50_ms": p50, "p95_ms": p95, "p99_ms": p99}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("image_dir")
+    parser.add_argument("--url", default="http://localhost:5005")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--limit", type=int, default=64, help="Distinct images to cycle through")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    source = DirectorySource(args.image_dir)
+    images = [source.read(member) for member in source.members()[:args.limit]]
+    if not images:
+        sys.exit(f"No images found under {args.image_dir}")
+
+    results = []
+    for concurrency in args.concurrency:
+        result = run_level(args.url, images, concurrency, args.duration)
+        result["server"] = requests.get(f"{args.url}/metrics", timeout=10).json()
+        results.append(result)
+        if not args.json:
+            server = result["server"]
+            print(f"c={concurrency:<3} {result['requests_per_sec']:7.2f} req/s  "
+                  f"p50 {result['p50_ms']:7.1f} ms  p95 {result['p95_ms']:7.1f} ms  "
+                  f"p99 {result['p99_ms']:7.1f} ms  fail {result['failures']}  "
+                  f"server mean batch {server['mean_batch_size'] or 0:.1f}")
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Load test for the camera streaming servers.
+
+Starts a stream server in a child process over a fake frame source
+(noisy synthetic frames with a bar that moves every --still captures,
+so the change detector sees a mostly static scene), either the
+asyncio server (--mode async, AsyncStreamServer) or a threaded Flask app
+with the same routes (--mode flask, what camera.py/manc.py run without
+--async). For each --clients level it opens that many concurrent
+/video_feed streams from one asyncio client, --slow of them reading
+at most 2 frames/sec like a viewer on a bad link, plus --pollers clients
+fetching /image snapshots with If-None-Match, and reports:
+  - frames/sec received per fast viewer (mean and minimum) and total MB/s
+  - snapshot latency p50/p99 and how many came back 304
+  - server RSS and thread count at the peak, and RSS per extra viewer
+  - the broadcaster's captured/sent/dropped counters, and the encodes,
+    CPU and bandwidth its change detector saved (--change-threshold 0
+    turns it off for comparison)
+
+Usage: python benchmarks/stream_load.py [--mode async|flask] [--clients 1 10 50]
+           [--duration 10] [--fps 15] [--slow 2] [--pollers 2] [--still 1]
+           [--change-threshold 0.005] [--on-static skip|repeat] [--json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from hardware.streaming import (CHANGE_THRESHOLD, STATIC_MODES, AsyncStreamServer, FrameBroadcaster,
+                                MJPEG_MIMETYPE, snapshot_response)
+
+
+class FakeCamera:
+    """BGR frames: a fixed scene with sensor noise and a bar that moves every `still` calls"""
+    def __init__(self, width=640, height=480, still=1, seed=0):
+        rng = np.random.default_rng(seed)
+        scene = rng.integers(4, 156, (height, width, 3), dtype=np.uint8)
+        # A few noise patterns to cycle through, rather than drawing noise per frame
+        self.backgrounds = [scene + rng.integers(0, 5, scene.shape, dtype=np.uint8) for _ in range(4)]
+        self.still = still
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        frame = self.backgrounds[self.calls % len(self.backgrounds)].copy()
+        position = (8 * (self.calls // self.still)) % frame.shape[1]
+        frame[:, position:position + 16] = 255
+        return frame
+
+
+def serve(mode, port, fps, width, height, quality, still, change_threshold, on_static):
+    sys.stdout = sys.stderr  # Keep stdout to the report
+    broadcaster = FrameBroadcaster(FakeCamera(width, height, still), max_fps=fps, quality=quality,
+                                   change_threshold=change_threshold, on_static=on_static)
+    if mode == "async":
+        AsyncStreamServer(broadcaster, snapshot_paths=["/image"]).run("127.0.0.1", port)
+        return
+
+    from flask import Flask, Response, jsonify, request
+    from werkzeug.serving import make_server
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    app = Flask(__name__)
+
+    @app.route("/video_feed")
+    def video_feed():
+        return Response(broadcaster.mjpeg(), mimetype=MJPEG_MIMETYPE)
+
+    @app.route("/stream_stats")
+    def stream_stats():
+        return jsonify(broadcaster.status())
+
+    @app.route("/image")
+    def image():
+        status, body, headers = snapshot_response(broadcaster, request.args, request.headers)
+        return Response(body, status=status, headers=headers)
+
+    make_server("127.0.0.1", port, app, threaded=True).serve_forever()
+
+
+def process_status(pid):
+    """(RSS MiB, threads) of a process, from /proc"""
+    fields = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            fields[name] = value.split()
+    return int(fields["VmRSS"][0]) / 1024, int(fields["Threads"][0])
+
+
+async def get(port, path, headers=None):
+    """(status, headers, body) of one GET"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    lines = [f"GET {path} HTTP/1.1", "Host: localhost"] + [f"{k}: {v}" for k, v in (headers or {}).items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode())
+    status, response_headers = await read_head(reader)
+    length = int(response_headers.get("content-length", 0))
+    body = await reader.readexactly(length) if length else await reader.read()
+    writer.close()
+    return status, response_headers, body
+
+
+async def read_head(reader):
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            return status, headers
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+
+async def viewer(port, stop_at, max_fps=None):
+    """Read /video_feed until stop_at; returns (frames, bytes)"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /video_feed HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    frames = received = 0
+    try:
+        status, _ = await read_head(reader)
+        if status != 200:
+            return 0, 0
+        while time.monotonic() < stop_at:
+            # Part: boundary line, headers, blank line, JPEG, CRLF
+            length = 0
+            while True:
+                line = await asyncio.wait_for(reader.readline(), max(stop_at - time.monotonic(), 0.01))
+                if not line:
+                    return frames, received
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+                elif line == b"\r\n" and length:
+                    break
+            await reader.readexactly(length + 2)
+            frames += 1
+            received += length
+            if max_fps:
+                await asyncio.sleep(1 / max_fps)
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+    return frames, received
+
+
+async def poller(port, stop_at):
+    """Poll /image with If-None-Match until stop_at; returns (latencies, 304 count)"""
+    latencies, not_modified, etag = [], 0, None
+    while time.monotonic() < stop_at:
+        started = time.perf_counter()
+        status, headers, _ = await get(port, "/image", {"If-None-Match": etag} if etag else None)
+        latencies.append(time.perf_counter() - started)
+        not_modified += status == 304
+        etag = headers.get("etag", etag)
+        await asyncio.sleep(0.05)
+    return latencies, not_modified
+
+
+async def run_level(port, pid, clients, slow, pollers, duration):
+    slow = min(slow, clients - 1)  # Keep at least one full-speed viewer
+    start_at = time.monotonic()
+    stop_at = start_at + duration
+    tasks = [asyncio.ensure_future(viewer(port, stop_at, 2 if n < slow else None)) for n in range(clients)]
+    poll_tasks = [asyncio.ensure_future(poller(port, stop_at)) for _ in range(pollers)]
+    peak_rss, peak_threads = process_status(pid)
+    while time.monotonic() < stop_at:
+        await asyncio.sleep(0.25)
+        rss, threads = process_status(pid)
+        peak_rss, peak_threads = max(peak_rss, rss), max(peak_threads, threads)
+    results = await asyncio.gather(*tasks)
+    polls = await asyncio.gather(*poll_tasks)
+    elapsed = time.monotonic() - start_at
+
+    fast = [frames / elapsed for frames, _ in results[slow:]]
+    latencies = [t for samples, _ in polls for t in samples]
+    p50, p99 = (np.percentile(latencies, [50, 99]) * 1000) if latencies else (0, 0)
+    return {"clients": clients, "slow": slow,
+            "fps_mean": float(np.mean(fast)) if fast else 0.0, "fps_min": float(min(fast)) if fast else 0.0,
+            "mb_per_sec": sum(received for _, received in results) / elapsed / 2**20,
+            "snapshots": len(latencies), "not_modified": sum(n for _, n in polls),
+            "snapshot_p50_ms": float(p50), "snapshot_p99_ms": float(p99),
+            "server_rss_mb": peak_rss, "server_threads": peak_threads}
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    sys.exit(f"Server did not start on port {port}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["async", "flask"], default="async")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--fps", type=float, default=15)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--quality", type=int, default=80)
+    parser.add_argument("--slow", type=int, default=2, help="Viewers reading at most 2 frames/sec")
+    parser.add_argument("--pollers", type=int, default=2, help="Concurrent /image pollers")
+    parser.add_argument("--still", type=int, default=1, help="Captures between scene changes")
+    parser.add_argument("--change-threshold", type=float, default=CHANGE_THRESHOLD,
+                        help="Changed fraction of sampled pixels that triggers an encode; 0 encodes every frame")
+    parser.add_argument("--on-static", choices=STATIC_MODES, default="skip")
+    parser.add_argument("--port", type=int, default=5090)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    server = multiprocessing.Process(target=serve, daemon=True,
+                                     args=(args.mode, args.port, args.fps, args.width, args.height, args.quality,
+                                           args.still, args.change_threshold, args.on_static))
+    server.start()
+    try:
+        wait_for_port(args.port)
+        idle_rss, _ = process_status(server.pid)
+        results = [asyncio.run(run_level(args.port, server.pid, clients, args.slow, args.pollers, args.duration))
+                   for clients in args.clients]
+        stats = json.loads(asyncio.run(get(args.port, "/stream_stats"))[2])
+    finally:
+        server.terminate()
+        server.join()
+
+    if len(results) > 1:
+        first, last = results[0], results[-1]
+        per_viewer_kb = 1024 * (last["server_rss_mb"] - first["server_rss_mb"]) / max(last["clients"] - first["clients"], 1)
+    else:
+        per_viewer_kb = None
+    report = {"mode": args.mode, "fps": args.fps, "idle_rss_mb": idle_rss, "levels": results,
+              "rss_per_viewer_kb": per_viewer_kb, "broadcaster": stats}
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{args.mode} server, {args.width}x{args.height} at {args.fps:g} fps; idle RSS {idle_rss:.1f} MiB")
+    for r in results:
+        print(f"{r['clients']:>4} viewers ({r['slow']} slow): {r['fps_mean']:5.1f} fps mean, {r['fps_min']:5.1f} min, "
+              f"{r['mb_per_sec']:6.1f} MB/s | snapshots p50 {r['snapshot_p50_ms']:6.1f} ms "
+              f"p99 {r['snapshot_p99_ms']:6.1f} ms ({r['not_modified']}/{r['snapshots']} 304) | "
+              f"RSS {r['server_rss_mb']:6.1f} MiB, {r['server_threads']} threads")
+    if per_viewer_kb is not None:
+        print(f"Server RSS per extra viewer: {per_viewer_kb:.0f} KiB")
+    print(f"Broadcaster: {stats['captured']} captured, {stats['sent']} sent, {stats['dropped']} dropped")
+    print(f"Change detector: {stats['unchanged']} unchanged frames not encoded, {stats['keepalives']} keep-alives; "
+          f"saved {stats['cpu_seconds_saved']:.2f} CPU s (encode {stats['encode_ms']:.1f} ms/frame, "
+          f"detection {stats['detect_seconds']:.2f} s total) and {stats['bytes_saved'] / 2**20:.1f} MB "
+          f"({100 * stats['bandwidth_saved']:.0f}% of stream bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import { fetchSensorData } from "../services/api";
 import Speedometer from "./Speedometer";
 import SensorLineChart from "./SensorLineChart";
@@ -28,6 +28,8 @@ const Dashboard = () => {
   const [P, setP] = useState(0.00);
   const [K, setK] = useState(0.00);
   const [fine, setFine] = useState(0.00);
+  const [snapshotUrl, setSnapshotUrl] = useState(null);
+  const snapshotValidators = useRef({ etag: null, lastModified: null });
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [hiddenSensors, setHiddenSensors] = useState([]);
@@ -49,6 +51,13 @@ const Dashboard = () => {
     ph: 0
   });
 
+  // Free each snapshot's object URL once a newer one is shown, and on unmount
+  useEffect(() => {
+    return () => {
+      if (snapshotUrl) URL.revokeObjectURL(snapshotUrl);
+    };
+  }, [snapshotUrl]);
+
   // Simulate realistic Jalandhar values after 3 seconds
   useEffect(() => {
     const timer = setTimeout(() => {
@@ -320,25 +329,30 @@ const Dashboard = () => {
   downloadImage();
 const fetchNPK = async () => {
     try {
-      const captureUrl = '/p64.png'; // Capture endpoint
-      const imageUrl = '/p64.png';
-      
-      // First hit the capture endpoint
-      const isCaptured = await fetch(captureUrl);
-      if (!isCaptured.ok) {
-          throw new Error('Failed to capture image: ' + isCaptured.statusText);
+      // One conditional request: the server captures on demand and answers
+      // 304 while the scene is unchanged, so the last readings still stand
+      const headers = {};
+      if (snapshotValidators.current.etag) {
+        headers['If-None-Match'] = snapshotValidators.current.etag;
+      }
+      if (snapshotValidators.current.lastModified) {
+        headers['If-Modified-Since'] = snapshotValidators.current.lastModified;
+      }
+      const response = await fetch('/p64.png', { headers, cache: 'no-store' });
+      if (response.status === 304) {
+        return;
       }
-      
-      // const response = await fetch(imageUrl);
-    
-
-      // Fetch the image from the server
-      const response = await fetch('/p64.png');
       if (!response.ok) {
         throw new Error('Failed to fetch image: ' + response.statusText);
       }
 
+      const validators = {
+        etag: response.headers.get('ETag'),
+        lastModified: response.headers.get('Last-Modified'),
+      };
       const blob = await response.blob();
+      // Show the new frame; a 304 above keeps the current one
+      setSnapshotUrl(URL.createObjectURL(blob));
 
       // Create a File object from the Blob
       const file = new File([blob], 'img.jpg', { type: blob.type || 'image/jpeg' });
@@ -357,6 +371,8 @@ const fetchNPK = async () => {
         console.log("Prediction response:", data);
 
         handleNPKChange(data.Fine, data.N, data.P, data.K);
+        // Only skip the next refresh once this frame's readings are in
+        snapshotValidators.current = validators;
       } catch (error) {
         console.error("Error fetching NPK readings:", error);
       }
@@ -468,7 +484,7 @@ const fetchNPK = async () => {
 
           <h1 className="relative top-2 text-white ">Live Feed</h1>
           <img
-            src="/p64.png"
+            src={snapshotUrl || "/p64.png"}
             alt="Live Cam Input"
             className="object-cover w-full h-full"
             id="video-feed"
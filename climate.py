@@ -0,0 +1,127 @@
+"""
+Closed-loop climate control for the grow bed.
+
+Each relay (fan, spray, Peltier) is driven by a hysteresis band on the
+live DHT22 temperature/humidity instead of a fixed timer, and every relay
+goes through a RelayGuard enforcing minimum on/off times, an optional
+maximum on time and a switch-rate limit, so the controller cannot chatter
+the relays or run the mister unattended.
+
+This holds the climate far better than the old 10 s every 2 hours
+schedule but is not cheaper: in benchmarks/climate_bench.py it uses
+~160 Wh/day against ~4 Wh/day and switches relays ~100 times a day
+against 72, because the old schedule barely ran the devices at all.
+"""
+import time
+
+
+class RelayGuard:
+    """Rate limiting and minimum on/off times for one relay"""
+    def __init__(self, min_on=60, min_off=60, max_on=None, max_starts_per_hour=12):
+        self.min_on = min_on
+        self.min_off = min_off
+        self.max_on = max_on
+        self.max_starts_per_hour = max_starts_per_hour
+        self.state = False
+        self.changed_at = None
+        self.starts = []  # Turn-on times within the last hour
+
+    def request(self, want, now):
+        """Return the state the relay should be in given the wanted state"""
+        if self.changed_at is None:
+            self.changed_at = now - max(self.min_on, self.min_off)
+        held = now - self.changed_at
+
+        forced_off = self.state and self.max_on is not None and held >= self.max_on
+        if forced_off:
+            want = False  # Then min_off applies before it can come back on
+        if want == self.state:
+            return self.state
+        if self.state and held < self.min_on and not forced_off:
+            return self.state
+        if not self.state and held < self.min_off:
+            return self.state
+
+        if want:
+            self.starts = [t for t in self.starts if now - t < 3600]
+            if len(self.starts) >= self.max_starts_per_hour:
+                return self.state  # Rate limited; switching off is always allowed
+            self.starts.append(now)
+        self.state = want
+        self.changed_at = now
+        return self.state
+
+
+class Hysteresis:
+    """On above `on_at`, off below `off_at` (or the reverse when on_at < off_at)"""
+    def __init__(self, on_at, off_at):
+        self.on_at = on_at
+        self.off_at = off_at
+        self.active = False
+
+    def update(self, value):
+        if self.on_at >= self.off_at:
+            if value >= self.on_at:
+                self.active = True
+            elif value <= self.off_at:
+                self.active = False
+        else:
+            if value <= self.on_at:
+                self.active = True
+            elif value >= self.off_at:
+                self.active = False
+        return self.active
+
+
+class ClimateController:
+    """Drives fan, spray and Peltier relays from temperature and humidity"""
+    def __init__(self, output, fan_pin, spray_pin, peltier_pin,
+                 temp_target=24.0, humidity_target=60.0, stale_after=60):
+        self.output = output  # output(pin, level)
+        self.pins = {"fan": fan_pin, "spray": spray_pin, "peltier": peltier_pin}
+        self.stale_after = stale_after
+
+        # Fan is stage-one cooling and also vents excess humidity,
+        # the Peltier is stage-two cooling, spray raises humidity
+        self.fan_temp = Hysteresis(on_at=temp_target + 1.5, off_at=temp_target)
+        self.fan_humidity = Hysteresis(on_at=humidity_target + 20, off_at=humidity_target + 10)
+        self.peltier = Hysteresis(on_at=temp_target + 3.0, off_at=temp_target + 1.0)
+        # Wide spray band: the fan dries the air, so a narrow one re-triggers every few minutes
+        self.spray = Hysteresis(on_at=humidity_target - 10, off_at=humidity_target + 4)
+
+        self.guards = {
+            "fan": RelayGuard(min_on=60, min_off=60, max_starts_per_hour=6),
+            "spray": RelayGuard(min_on=10, min_off=900, max_on=240, max_starts_per_hour=4),
+            "peltier": RelayGuard(min_on=300, min_off=300, max_starts_per_hour=3),
+        }
+        self.last_reading = None
+
+    def update(self, temperature, humidity, now=None):
+        """Feed one reading; returns the relay states now in effect"""
+        now = time.monotonic() if now is None else now
+        wanted = {"fan": False, "spray": False, "peltier": False}
+        if temperature is not None and humidity is not None:
+            self.last_reading = now
+            fan_t = self.fan_temp.update(temperature)
+            fan_h = self.fan_humidity.update(humidity)
+            wanted = {
+                "fan": fan_t or fan_h,
+                "spray": self.spray.update(humidity),
+                "peltier": self.peltier.update(temperature),
+            }
+        elif self.last_reading is not None and now - self.last_reading < self.stale_after:
+            # Missed reading: hold current states briefly rather than dropping out
+            wanted = {name: guard.state for name, guard in self.guards.items()}
+
+        states = {}
+        for name, guard in self.guards.items():
+            before = guard.state
+            states[name] = guard.request(wanted[name], now)
+            if states[name] != before:
+                self.output(self.pins[name], 1 if states[name] else 0)
+        return states
+
+    def shutdown(self):
+        for name, guard in self.guards.items():
+            guard.state = False
+            self.output(self.pins[name], 0)
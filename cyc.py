@@ -1,15 +1,19 @@
-import RPi.GPIO as GPIO
 import time
 from datetime import datetime, timedelta
+from hwd import HardwareClient, RemoteGPIO
+from dosing import DosingPlanner, Pump
+from relays import RelayTimer
 
 # Initialize GPIO
+# Pins are owned by the hardware daemon (hwd.py); setup() leases them
+GPIO = RemoteGPIO(HardwareClient("cyc"))
 GPIO.setmode(GPIO.BCM)
 GPIO.setwarnings(False)
 
 # Pin Assignments (Update these to match your wiring)
 ### Motors ###
 # L298N Driver 1
-M1_EN = 17  # Motor 1 Enable
+M1_EN = 7   # Motor 1 Enable (BCM17 is the DHT22, reserved by hwd.py)
 M1_IN1 = 27 # Motor 1 Input 1
 M1_IN2 = 22 # Motor 1 Input 2
 
@@ -32,6 +36,17 @@ PUMP4 = 20  # Peristaltic Pump 4
 WATER_MOTOR = 21  # Main water pump
 SPRAY = 26       # Sprinkler relay
 
+### Dosing ###
+# Flow calibration in ml/s (time each pump into a measuring cylinder)
+DOSING_PUMPS = [
+    Pump("pump1", PUMP1, ml_per_second=1.0, current_a=0.3),
+    Pump("pump2", PUMP2, ml_per_second=1.0, current_a=0.3),
+    Pump("pump3", PUMP3, ml_per_second=1.0, current_a=0.3),
+    Pump("pump4", PUMP4, ml_per_second=1.0, current_a=0.3),
+]
+DOSE_ML = {"pump1": 5, "pump2": 5, "pump3": 5, "pump4": 5}
+PUMP_CURRENT_BUDGET_A = 1.2  # Max combined draw of running pumps
+
 ### Environmental ###  
 FAN = 16     # Cooling fan relay
 PELTIER = 4  # Peltier cooler relay
@@ -57,6 +72,9 @@ servo2.start(0)
 
 # System Variables
 last_water_change = datetime.now()
+dosing_planner = DosingPlanner(DOSING_PUMPS, PUMP_CURRENT_BUDGET_A,
+                               mix_pin=WATER_MOTOR, mix_seconds=120)
+relay_timer = RelayTimer(GPIO)
 
 def move_servo(servo, angle):
     """Move servo to specified angle (0-180)"""
@@ -115,11 +133,9 @@ def dose_nutrients(pump, duration):
     GPIO.output(WATER_MOTOR, GPIO.LOW)
 
 def control_relay(device, duration=10):
-    """Control relay devices with 10s default runtime"""
+    """Switch a relay device on for 10s by default (non-blocking)"""
     print(f"Activating {device} for {duration}s")
-    GPIO.output(device, GPIO.HIGH)
-    time.sleep(duration)
-    GPIO.output(device, GPIO.LOW)
+    relay_timer.pulse(device, duration)
 
 def check_water_age():
     """Check if water needs changing (3-day limit)"""
@@ -135,21 +151,18 @@ def full_dosing_cycle():
     """Complete nutrient dosing sequence"""
     print("\n=== Starting Dosing Cycle ===")
     
-    # Dose each pump sequentially
-    for i, pump in enumerate([PUMP1, PUMP2, PUMP3, PUMP4], 1):
-        dose_nutrients(pump, 5)  # 5s per pump
-        if i < 4:  # Pause between pumps (except last)
-            time.sleep(2)
+    # Dose all pumps together within the current budget, then mix once
+    dosing_planner.run(GPIO, DOSE_ML)
     
     print("=== Dosing Complete ===\n")
 
 def environmental_cycle():
-    """Run all environmental controls"""
+    """Run all environmental controls together (returns immediately)"""
     print("\nRunning Environmental Controls")
     control_relay(FAN)      # Cooling fan
     control_relay(SPRAY)    # Sprinkler
     control_relay(PELTIER)  # Peltier cooler
-    print("Environmental Cycle Complete\n")
+    print("Environmental Cycle Scheduled\n")
 
 # Example Usage
 try:
@@ -161,9 +174,9 @@ try:
     run_motor(1, 'fwd', 75, 2)
     run_motor(2, 'rev', 50, 2)
     
-    # Test full system
-    full_dosing_cycle()
+    # Test full system (environmental relays run alongside dosing)
     environmental_cycle()
+    full_dosing_cycle()
     
     # Check water age
     check_water_age()
@@ -177,6 +190,7 @@ except KeyboardInterrupt:
     
 finally:
     # Cleanup
+    relay_timer.stop()
     m1_pwm.stop()
     m2_pwm.stop()
     servo1.stop()
@@ -0,0 +1,116 @@
+"""
+Nutrient dosing planner.
+
+Doses are given in millilitres and converted to pump run times with each
+pump's flow calibration. Pumps run concurrently as long as their summed
+current stays within the supply budget and no incompatible pair overlaps,
+then the water motor runs a single combined mix at the end instead of a
+mix after every pump.
+"""
+import time
+
+
+class Pump:
+    """A peristaltic pump with its flow calibration and current draw"""
+    def __init__(self, name, pin, ml_per_second, current_a):
+        if ml_per_second <= 0:
+            raise ValueError(f"Pump {name}: ml_per_second must be positive")
+        self.name = name
+        self.pin = pin
+        self.ml_per_second = ml_per_second
+        self.current_a = current_a
+
+    def seconds_for(self, ml):
+        return ml / self.ml_per_second
+
+
+class DosingPlanner:
+    """Packs pump runs into the current budget and runs them with one mix"""
+    def __init__(self, pumps, current_budget_a, incompatible=(), mix_pin=None, mix_seconds=120):
+        self.pumps = {pump.name: pump for pump in pumps}
+        self.current_budget_a = current_budget_a
+        self.incompatible = {frozenset(pair) for pair in incompatible}
+        self.mix_pin = mix_pin
+        self.mix_seconds = mix_seconds
+        for pump in pumps:
+            if pump.current_a > current_budget_a:
+                raise ValueError(f"Pump {pump.name} draws {pump.current_a}A, "
+                                 f"over the {current_budget_a}A budget")
+
+    def _conflicts(self, name, running):
+        return any(frozenset((name, other)) in self.incompatible for other in running)
+
+    def plan(self, doses_ml):
+        """Return [(start_s, pump, duration_s)] sorted by start time.
+
+        Greedy list scheduling: longest runs first, each started as soon as
+        the budget and compatibility rules allow.
+        """
+        waiting = []
+        for name, ml in doses_ml.items():
+            if name not in self.pumps:
+                raise KeyError(f"Unknown pump: {name}")
+            if ml > 0:
+                pump = self.pumps[name]
+                waiting.append((pump.seconds_for(ml), pump))
+        waiting.sort(key=lambda item: -item[0])
+
+        schedule = []
+        running = []  # (end_s, pump)
+        now = 0.0
+        while waiting:
+            load = sum(pump.current_a for _, pump in running)
+            names = [pump.name for _, pump in running]
+            for item in list(waiting):
+                duration, pump = item
+                if load + pump.current_a <= self.current_budget_a and not self._conflicts(pump.name, names):
+                    schedule.append((now, pump, duration))
+                    running.append((now + duration, pump))
+                    load += pump.current_a
+                    names.append(pump.name)
+                    waiting.remove(item)
+            if waiting:
+                # Advance to the next pump finishing and free its slot
+                running.sort(key=lambda item: item[0])
+                now = running[0][0]
+                running = [item for item in running if item[0] > now]
+        return schedule
+
+    def duration(self, schedule):
+        """Total seconds for a plan, including the final mix"""
+        pumping = max((start + duration for start, _, duration in schedule), default=0)
+        return pumping + (self.mix_seconds if self.mix_pin is not None and schedule else 0)
+
+    def run(self, gpio, doses_ml):
+        """Execute a dosing plan on gpio (anything with output(pin, value))"""
+        schedule = self.plan(doses_ml)
+        if not schedule:
+            return schedule
+
+        events = []  # (time_s, order, pin, level); offs sort before ons at equal times
+        for start, pump, duration in schedule:
+            events.append((start, 1, pump.pin, 1))
+            events.append((start + duration, 0, pump.pin, 0))
+        events.sort(key=lambda event: (event[0], event[1]))
+
+        print(f"Dosing {len(schedule)} pumps, {self.duration(schedule):.0f}s including mix")
+        started = time.monotonic()
+        try:
+            for at, _, pin, level in events:
+                delay = started + at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                gpio.output(pin, level)
+        finally:
+            for _, pump, _ in schedule:
+                gpio.output(pump.pin, 0)
+
+        # One combined mix for all doses
+        if self.mix_pin is not None:
+            print(f"Mixing water for {self.mix_seconds}s")
+            gpio.output(self.mix_pin, 1)
+            try:
+                time.sleep(self.mix_seconds)
+            finally:
+                gpio.output(self.mix_pin, 0)
+        return schedule
@@ -1,9 +1,9 @@
-from flask import Flask, render_template, Response, send_file
+import argparse
+from flask import Flask, render_template, Response, jsonify, request
 from picamera2 import Picamera2
-import cv2
 import os
-from flask import redirect, url_for
 from flask_cors import CORS
+from streaming import AsyncStreamServer, FrameBroadcaster, MJPEG_MIMETYPE, snapshot_response
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
@@ -15,16 +15,16 @@ picam2.preview_configuration.main.format = "RGB888"
 picam2.preview_configuration.align()
 picam2.configure("preview")
 picam2.start()
-STATIC_IMAGE_PATH = 'static/img.jpg'
-os.makedirs('static', exist_ok=True)
 
-def gen_frames():
-    while True:
-        frame = picam2.capture_array()
-        ret, buffer = cv2.imencode('.jpg', frame)
-        frame = buffer.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+# One capture/encode thread shared by every /video_feed viewer; /image reuses its frames
+STREAM_FPS = float(os.environ.get('CAMERA_FPS', 15))
+STREAM_QUALITY = int(os.environ.get('CAMERA_JPEG_QUALITY', 80))
+# Unchanged frames aren't re-encoded: 0 disables the check; "skip" sends nothing, "repeat" resends the last JPEG
+CHANGE_THRESHOLD = float(os.environ.get('CAMERA_CHANGE_THRESHOLD', 0.005))
+KEEPALIVE = float(os.environ.get('CAMERA_KEEPALIVE', 5))
+ON_STATIC = os.environ.get('CAMERA_ON_STATIC', 'skip')
+broadcaster = FrameBroadcaster(picam2.capture_array, max_fps=STREAM_FPS, quality=STREAM_QUALITY,
+                               change_threshold=CHANGE_THRESHOLD, keepalive=KEEPALIVE, on_static=ON_STATIC)
 
 @app.route('/')
 def index():
@@ -32,21 +32,25 @@ def index():
 
 @app.route('/video_feed')
 def video_feed():
-    return Response(gen_frames(),
-                    mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(broadcaster.mjpeg(), mimetype=MJPEG_MIMETYPE)
+
+@app.route('/stream_stats')
+def stream_stats():
+    return jsonify(broadcaster.status())
 
 @app.route('/image')
 def capture_image():
-    try:
-        # Capture an image and save it
-        image = picam2.capture_array()
-        if image is None or image.size == 0:
-            return "Failed to capture image", 500
-        cv2.imwrite(STATIC_IMAGE_PATH, image)
-        # Redirect to the saved image
-        return redirect(url_for('static', filename='img.jpg'))
-    except Exception as e:
-        return f"Error capturing image: {str(e)}", 500
+    # JPEG straight from memory (?width=&quality= optional), 304 if the client has this frame
+    status, body, headers = snapshot_response(broadcaster, request.args, request.headers)
+    return Response(body, status=status, headers=headers)
 
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=5000)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="Serve /video_feed, /image and /stream_stats from one asyncio loop (no index page)")
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+    if args.use_async:
+        AsyncStreamServer(broadcaster, snapshot_paths=['/image']).run(port=args.port)
+    else:
+        app.run(host='0.0.0.0', port=args.port)
@@ -0,0 +1,463 @@
+"""
+Shared camera capture for the streaming endpoints.
+
+One FrameBroadcaster thread captures and JPEG-encodes frames, at most
+max_fps and only while someone is watching, and publishes the latest
+JPEG under a Condition. Each viewer waits for a frame newer than the
+last one it sent and takes whatever is latest, so N viewers cost one
+capture and one encode per frame, and a slow client skips frames
+instead of holding back the camera or the other viewers.
+
+Snapshots are served from the same frames, straight from memory: the
+latest frame when it is fresh enough, otherwise one captured on demand.
+Each carries an ETag and Last-Modified so a client polling for stills
+gets 304 Not Modified until there is a new frame.
+
+A ChangeDetector sits in front of the encoder: each capture is compared
+with the last encoded frame on a subsampled grid, and when too little of
+it changed the frame is not encoded. Depending on on_static the previous
+JPEG is then re-sent ("repeat") or nothing is sent ("skip"), with a
+freshly encoded keep-alive frame at least every keepalive seconds.
+status() reports the encodes and bytes this saved.
+
+AsyncStreamServer serves the same endpoints from one asyncio event loop
+instead of a thread per client, for dozens of concurrent viewers.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlsplit
+
+import cv2
+import numpy as np
+
+MJPEG_MIMETYPE = 'multipart/x-mixed-replace; boundary=frame'
+STREAM_HEADERS = {"Content-Type": MJPEG_MIMETYPE, "Cache-Control": "no-cache"}
+SNAPSHOT_MAX_AGE = 0.5  # Seconds a published frame is reused for snapshots
+CHANGE_THRESHOLD = 0.005  # Fraction of sampled pixels that must change before a frame is re-encoded
+KEEPALIVE = 5.0  # Seconds between encoded frames of an unchanged scene
+STATIC_MODES = ("skip", "repeat")
+
+
+def encode_jpeg(frame, quality=80):
+    ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return buffer.tobytes()
+
+
+def resize_to_width(frame, width):
+    height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+    return cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def mjpeg_header(jpeg):
+    return b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: ' + str(len(jpeg)).encode() + b'\r\n\r\n'
+
+
+def mjpeg_part(jpeg):
+    return mjpeg_header(jpeg) + jpeg + b'\r\n'
+
+
+class ChangeDetector:
+    """Whether a frame differs from a reference, judged on every step-th pixel"""
+    def __init__(self, threshold=CHANGE_THRESHOLD, pixel_delta=12, step=8):
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta  # Grey levels a sampled pixel must move to count as changed
+        self.step = step
+
+    def thumbnail(self, frame):
+        """Grey levels (int16) of a strided view: 1/step^2 of the pixels, no float conversion"""
+        small = frame[::self.step, ::self.step].astype(np.int16)
+        return small.sum(axis=2, dtype=np.int16) // small.shape[2] if small.ndim == 3 else small
+
+    def changed(self, reference, thumbnail):
+        if reference is None or reference.shape != thumbnail.shape:
+            return True
+        moved = np.abs(thumbnail - reference) > self.pixel_delta
+        return np.count_nonzero(moved) > self.threshold * moved.size
+
+
+class FrameBroadcaster:
+    """Single capture/encode thread fanning the latest JPEG out to every viewer"""
+    def __init__(self, capture, max_fps=15, quality=80, change_threshold=CHANGE_THRESHOLD,
+                 keepalive=KEEPALIVE, on_static="skip"):
+        if on_static not in STATIC_MODES:
+            raise ValueError(f"on_static must be one of {STATIC_MODES}")
+        self.capture = capture  # () -> BGR frame, or None when the camera has nothing
+        self.interval = 1 / max_fps if max_fps else 0
+        self.quality = quality
+        # No change threshold: encode every frame
+        self.detector = ChangeDetector(change_threshold) if change_threshold else None
+        self.keepalive = keepalive
+        self.on_static = on_static
+        self.condition = threading.Condition()
+        self.frame = None
+        self.jpeg = None
+        self.sequence = 0        # Increments with every published frame, repeats included
+        self.frame_id = 0        # Increments with every encoded frame; keys ETags and variants
+        self.timestamp = None    # time.time() of the latest encoded frame
+        self.checked = None      # time.time() of the latest capture, encoded or found unchanged
+        self.viewers = 0
+        self.stats = {"captured": 0, "errors": 0, "sent": 0, "dropped": 0, "snapshots": 0,
+                      "encoded": 0, "unchanged": 0, "keepalives": 0, "encode_seconds": 0.0,
+                      "detect_seconds": 0.0, "bytes_sent": 0, "bytes_saved": 0}
+        self._reference = None  # Detector thumbnail of the latest encoded frame
+        self._capture_lock = threading.Lock()  # The stream thread and snapshots share the camera
+        self._variants = {}  # (frame_id, width, quality) -> JPEG, for the latest frame only
+        self._etag_prefix = os.urandom(4).hex()  # Frame ids restart with the process
+        self.listeners = []  # Called from the capture thread after each publish
+        self._thread = None
+        self._stopped = False
+
+    def _start(self):
+        # Called with the condition held
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        next_at = time.monotonic()
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.viewers or self._stopped)  # Idle without viewers
+                if self._stopped:
+                    return
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_at = max(next_at + self.interval, time.monotonic())
+
+            try:
+                with self._capture_lock:
+                    self._capture_and_publish()
+            except Exception as e:
+                print(f"Camera capture failed: {e}")
+                time.sleep(max(self.interval, 0.5))
+
+    def _capture_and_publish(self):
+        # Called with the capture lock held
+        try:
+            frame = self.capture()
+            if frame is None or frame.size == 0:
+                raise ValueError("empty frame")
+            now = time.time()
+            if self.detector is not None:
+                started = time.thread_time()
+                thumbnail = self.detector.thumbnail(frame)
+                changed = self.detector.changed(self._reference, thumbnail)
+                detect_seconds = time.thread_time() - started
+                keepalive = not changed and now - self.timestamp >= self.keepalive
+                if not (changed or keepalive):
+                    self._publish_unchanged(now, detect_seconds)
+                    return
+            started = time.thread_time()
+            jpeg = encode_jpeg(frame, self.quality)
+            encode_seconds = time.thread_time() - started
+        except Exception:
+            with self.condition:
+                self.stats["errors"] += 1
+            raise
+        with self.condition:
+            self.frame, self.jpeg, self.timestamp, self.checked = frame, jpeg, now, now
+            self.sequence += 1
+            self.frame_id += 1
+            self.stats["captured"] += 1
+            self.stats["encoded"] += 1
+            self.stats["encode_seconds"] += encode_seconds
+            if self.detector is not None:
+                self._reference = thumbnail
+                self.stats["detect_seconds"] += detect_seconds
+                self.stats["keepalives"] += keepalive
+            self.condition.notify_all()
+        for listener in self.listeners:
+            listener()
+
+    def _publish_unchanged(self, now, detect_seconds):
+        # The previous JPEG still shows the scene: repeat it or send nothing
+        with self.condition:
+            self.checked = now
+            self.stats["captured"] += 1
+            self.stats["unchanged"] += 1
+            self.stats["detect_seconds"] += detect_seconds
+            if self.on_static == "skip":
+                self.stats["bytes_saved"] += len(self.jpeg) * self.viewers
+                return
+            self.sequence += 1
+            self.condition.notify_all()
+        for listener in self.listeners:
+            listener()
+
+    def add_viewer(self):
+        """Count a viewer in, starting capture; returns the sequence to send frames after"""
+        with self.condition:
+            self.viewers += 1
+            self._start()
+            self.condition.notify_all()
+            # Start from the latest frame if it's current, else wait for the next one
+            fresh = self.checked is not None and time.time() - self.checked < 1
+            return self.sequence - 1 if fresh else self.sequence
+
+    def remove_viewer(self):
+        with self.condition:
+            self.viewers -= 1
+
+    def latest(self, last):
+        """(sequence, JPEG) of the newest frame after sequence last, or None; counts it as sent"""
+        with self.condition:
+            if self.sequence <= last:
+                return None
+            self.stats["dropped"] += self.sequence - last - 1
+            self.stats["sent"] += 1
+            self.stats["bytes_sent"] += len(self.jpeg)
+            return self.sequence, self.jpeg
+
+    def frames(self, timeout=5):
+        """Yield each new JPEG for one viewer, skipping any published while it was busy"""
+        last = self.add_viewer()
+        try:
+            while True:
+                with self.condition:
+                    if not self.condition.wait_for(lambda: self.sequence > last or self._stopped, timeout):
+                        continue  # Camera stalled; keep the viewer waiting
+                    if self._stopped:
+                        return
+                    self.stats["dropped"] += self.sequence - last - 1
+                    self.stats["sent"] += 1
+                    self.stats["bytes_sent"] += len(self.jpeg)
+                    last, jpeg = self.sequence, self.jpeg
+                yield jpeg
+        finally:
+            self.remove_viewer()
+
+    def _fresh(self, max_age):
+        # An unchanged scene keeps the previous frame current
+        return self.checked is not None and time.time() - self.checked <= max_age
+
+    def snapshot(self, max_age=SNAPSHOT_MAX_AGE, width=None, quality=None):
+        """(JPEG bytes, ETag, frame time) of a frame at most max_age seconds old.
+        
+        Reuses the latest published frame when it is fresh enough, otherwise
+        captures one. width (pixels, keeping the aspect ratio) and quality
+        re-encode the frame; each variant is encoded once per frame.
+        """
+        with self.condition:
+            fresh = self._fresh(max_age)
+        if not fresh:
+            with self._capture_lock:
+                if not self._fresh(max_age):  # Another request may have just captured one
+                    self._capture_and_publish()
+
+        with self.condition:
+            self.stats["snapshots"] += 1
+            frame, jpeg, frame_id, timestamp = self.frame, self.jpeg, self.frame_id, self.timestamp
+        width = width if width and width < frame.shape[1] else None
+        quality = quality if quality and quality != self.quality else None
+        if width or quality:
+            key = (frame_id, width, quality)
+            variant = self._variants.get(key)
+            if variant is None:
+                variant = encode_jpeg(resize_to_width(frame, width) if width else frame, quality or self.quality)
+                self._variants = {k: v for k, v in self._variants.items() if k[0] == frame_id}
+                self._variants[key] = variant
+            jpeg = variant
+        etag = f'"{self._etag_prefix}-{frame_id}-{width or 0}-{quality or self.quality}"'
+        return jpeg, etag, timestamp
+
+    def mjpeg(self):
+        """multipart/x-mixed-replace body for one viewer"""
+        for jpeg in self.frames():
+            yield mjpeg_part(jpeg)
+
+    def status(self):
+        """Counters, plus what the change detector saved: encodes (CPU seconds net of detection) and bytes"""
+        with self.condition:
+            stats = dict(self.stats, viewers=self.viewers, sequence=self.sequence,
+                         frame_id=self.frame_id,
+                         max_fps=1 / self.interval if self.interval else None)
+        encode_seconds = stats["encode_seconds"] / stats["encoded"] if stats["encoded"] else 0.0
+        stats["encode_ms"] = 1000 * encode_seconds
+        stats["cpu_seconds_saved"] = stats["unchanged"] * encode_seconds - stats["detect_seconds"]
+        would_send = stats["bytes_sent"] + stats["bytes_saved"]
+        stats["bandwidth_saved"] = stats["bytes_saved"] / would_send if would_send else 0.0
+        return stats
+
+    def stop(self):
+        with self.condition:
+            self._stopped = True
+            self.condition.notify_all()
+
+
+def http_date(timestamp):
+    return formatdate(timestamp, usegmt=True)
+
+
+def not_modified(etag, timestamp, if_none_match=None, if_modified_since=None):
+    """Whether a conditional GET's validators still match this snapshot"""
+    if if_none_match:
+        return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    if if_modified_since:
+        try:
+            return int(timestamp) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def snapshot_response(broadcaster, args, headers, max_age=SNAPSHOT_MAX_AGE):
+    """(status, body, headers) for a snapshot request, for any web framework.
+    
+    args holds the query parameters (optional width and quality), headers
+    the request headers (for If-None-Match / If-Modified-Since).
+    """
+    try:
+        width = int(args['width']) if args.get('width') else None
+        quality = int(args['quality']) if args.get('quality') else None
+        if (width is not None and not 16 <= width <= 4096) or (quality is not None and not 1 <= quality <= 100):
+            raise ValueError
+    except ValueError:
+        return 400, b"width must be 16-4096 and quality 1-100", {"Content-Type": "text/plain"}
+    try:
+        jpeg, etag, timestamp = broadcaster.snapshot(max_age, width, quality)
+    except Exception as e:
+        return 500, f"Error capturing image: {e}".encode(), {"Content-Type": "text/plain"}
+
+    response_headers = {"ETag": etag, "Last-Modified": http_date(timestamp), "Cache-Control": "no-cache"}
+    if not_modified(etag, timestamp, headers.get('If-None-Match'), headers.get('If-Modified-Since')):
+        return 304, b"", response_headers
+    return 200, jpeg, dict(response_headers, **{"Content-Type": "image/jpeg"})
+
+
+class AsyncStreamServer:
+    """asyncio HTTP server for the stream, snapshots and stats: one event loop, no thread per viewer.
+
+    Every viewer is a coroutine that writes the broadcaster's latest JPEG
+    (the same bytes object for all of them) and asks for the next frame
+    only once its socket has drained below write_buffer bytes, so a
+    viewer holds at most about one frame however slow its connection is,
+    and frames published meanwhile are skipped. The capture thread wakes
+    the loop once per frame. Snapshots run in the loop's thread pool,
+    since a stale frame means a blocking capture.
+    """
+    def __init__(self, broadcaster, snapshot_paths=('/image',), stream_path='/video_feed',
+                 stats_path='/stream_stats', write_buffer=64 * 1024):
+        self.broadcaster = broadcaster
+        self.snapshot_paths = set(snapshot_paths)
+        self.stream_path = stream_path
+        self.stats_path = stats_path
+        self.write_buffer = write_buffer
+        self.loop = None
+        self._frame_event = None  # Replaced after every frame; viewers wait on the current one
+        self.broadcaster.listeners.append(self._on_frame)
+
+    def _on_frame(self):
+        # Capture thread
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        event, self._frame_event = self._frame_event, asyncio.Event()
+        event.set()
+
+    async def start(self, host='0.0.0.0', port=5000):
+        """Start listening on the running loop; returns the asyncio.Server"""
+        self.loop = asyncio.get_running_loop()
+        self._frame_event = asyncio.Event()
+        return await asyncio.start_server(self._handle, host, port, backlog=1024)
+
+    def run(self, host='0.0.0.0', port=5000):
+        """Serve until interrupted"""
+        async def main():
+            server = await self.start(host, port)
+            print(f"Async stream server on http://{host}:{port}{self.stream_path}")
+            async with server:
+                await server.serve_forever()
+        try:
+            asyncio.run(main())
+        except KeyboardInterrupt:
+            pass
+
+    async def _handle(self, reader, writer):
+        try:
+            method, path, args, headers = await asyncio.wait_for(read_request(reader), 10)
+            head = method == 'HEAD'  # Same headers as GET, no body
+            if method not in ('GET', 'HEAD'):
+                await respond(writer, 405, b"Only GET and HEAD are supported",
+                              {"Content-Type": "text/plain", "Allow": "GET, HEAD"})
+            elif path == self.stream_path:
+                if head:
+                    # Headers only: don't join the broadcaster or start the camera
+                    writer.write(response_head(200, STREAM_HEADERS))
+                    await writer.drain()
+                else:
+                    await self._stream(writer)
+            elif path in self.snapshot_paths:
+                status, body, response_headers = await self.loop.run_in_executor(
+                    None, snapshot_response, self.broadcaster, args, headers)
+                await respond(writer, status, body, response_headers, head)
+            elif path == self.stats_path:
+                body = json.dumps(self.broadcaster.status()).encode()
+                await respond(writer, 200, body, {"Content-Type": "application/json"}, head)
+            else:
+                await respond(writer, 404, b"Not found", {"Content-Type": "text/plain"}, head)
+        except (ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            pass  # Client went away or sent garbage
+        finally:
+            writer.close()
+
+    async def _stream(self, writer):
+        writer.transport.set_write_buffer_limits(high=self.write_buffer)
+        writer.write(response_head(200, STREAM_HEADERS))
+        broadcaster = self.broadcaster
+        last = broadcaster.add_viewer()
+        try:
+            while not broadcaster._stopped:
+                event = self._frame_event  # Taken before checking, so a frame in between still wakes us
+                latest = broadcaster.latest(last)
+                if latest is None:
+                    try:
+                        await asyncio.wait_for(event.wait(), 5)
+                    except asyncio.TimeoutError:
+                        pass  # Camera stalled; keep the viewer waiting
+                    continue
+                last, jpeg = latest
+                writer.write(mjpeg_header(jpeg))
+                writer.write(jpeg)
+                writer.write(b'\r\n')
+                await writer.drain()
+        finally:
+            broadcaster.remove_viewer()
+
+
+async def read_request(reader):
+    """(method, path, query args, headers) of one HTTP/1.x request head"""
+    request_line = (await reader.readline()).decode('latin-1')
+    method, target, _ = request_line.split(' ', 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().title()] = value.strip()
+    url = urlsplit(target)
+    return method, url.path, dict(parse_qsl(url.query)), headers
+
+
+def response_head(status, headers):
+    lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+             "Access-Control-Allow-Origin: *", "Connection: close"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1')
+
+
+async def respond(writer, status, body, headers, head=False):
+    """Write a complete response; for a HEAD request, the GET headers (real Content-Length) only"""
+    writer.write(response_head(status, dict(headers, **{"Content-Length": len(body)})))
+    if not head:
+        writer.write(body)
+    await writer.drain()
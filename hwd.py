@@ -0,0 +1,699 @@
+"""
+Hardware owner daemon for the hydroponic rig.
+
+One long-running process owns the GPIO pins and the I2C bus and serves
+them to the control scripts (ph.py, mega.py, cyc.py, rasberry.py) over a
+Unix socket. Scripts become thin clients: they lease the pins they drive,
+and bus transactions (PCA9548A channel select + ADS1115/BH1750 reads) run
+inside the daemon, so two scripts can never interleave them. The DHT22 is
+polled by the daemon too and clients share its latest sample.
+
+Protocol: newline-delimited JSON over a persistent connection.
+    request:  {"id": 1, "client": "ph", "ops": [{"op": "output", "pin": 18, "value": 1}, ...]}
+    response: {"id": 1, "results": [{"value": null}, {"error": "..."}, ...]}
+
+All ops of a request form one batch. Lease acquisitions of a batch are
+applied first, then the remaining ops run in order under the hardware
+lock, so a batch is never interleaved with another client's bus or pin
+traffic. The first failing op aborts the rest of its batch.
+
+Leases belong to a connection. When a lease expires or its connection
+drops, the daemon stops PWM on the pin and drives it back to the safe
+level given at setup, so a crashed script cannot leave a pump running.
+
+Run with:  python hwd.py
+"""
+import json
+import logging
+import os
+import random
+import signal
+import socket
+import socketserver
+import threading
+import time
+from contextlib import contextmanager
+
+SOCKET_PATH = os.environ.get("HWD_SOCKET", "/tmp/bhooyam_hwd.sock")
+
+# I2C layout (everything hangs off the PCA9548A multiplexer on bus 1)
+I2C_BUS = 1
+PCA9548A_ADDR = 0x70
+BH1750_ADDR = 0x23
+ADS1115_ADDR = 0x48
+BH1750_CHANNEL = 1    # BH1750 on channel 1
+ADS1115_CHANNEL = 3   # ADS1115 on channel 3
+
+# ADS1115 Registers
+ADS1115_REG_POINTER_CONVERT = 0x00
+ADS1115_REG_POINTER_CONFIG = 0x01
+ADS1115_FULL_SCALE = 4.096  # Volts at PGA +/-4.096V
+
+# DHT22 temperature/humidity sensor (read at most every 2s by the sensor spec)
+DHT_PIN = 17
+DHT_POLL_INTERVAL = 2.5
+
+LEASE_REAP_INTERVAL = 1.0  # Seconds between expired-lease sweeps
+
+
+class HardwareError(Exception):
+    """Raised when the daemon rejects or fails an operation"""
+
+
+class LeaseError(HardwareError):
+    """Raised when a pin is leased by another client"""
+
+
+class GpioBackend:
+    """RPi.GPIO wrapper, falling back to simulation when not on a Pi"""
+    def __init__(self):
+        try:
+            import RPi.GPIO as GPIO
+            GPIO.setmode(GPIO.BCM)
+            GPIO.setwarnings(False)
+            self.gpio = GPIO
+            self.simulation_mode = False
+        except (ImportError, RuntimeError) as e:
+            logging.warning(f"RPi.GPIO unavailable ({e}) - simulating GPIO")
+            self.gpio = None
+            self.simulation_mode = True
+
+        self.levels = {}       # pin -> last written level
+        self.safe_levels = {}  # pin -> level to restore when a lease ends
+        self.pwms = {}         # pin -> PWM object
+
+    def setup(self, pin, mode="out", initial=0):
+        if mode == "out":
+            if self.gpio:
+                self.gpio.setup(pin, self.gpio.OUT, initial=initial)
+            self.levels[pin] = initial
+            self.safe_levels[pin] = initial
+        elif self.gpio:
+            self.gpio.setup(pin, self.gpio.IN)
+
+    def output(self, pin, value):
+        if self.gpio:
+            self.gpio.output(pin, value)
+        self.levels[pin] = value
+
+    def input(self, pin):
+        if self.gpio:
+            return self.gpio.input(pin)
+        return self.levels.get(pin, 0)
+
+    def pwm_start(self, pin, freq, duty=0):
+        self.pwm_stop(pin)
+        if self.gpio:
+            pwm = self.gpio.PWM(pin, freq)
+            pwm.start(duty)
+            self.pwms[pin] = pwm
+        else:
+            self.pwms[pin] = {"freq": freq, "duty": duty}
+
+    def pwm_duty(self, pin, duty):
+        pwm = self.pwms.get(pin)
+        if pwm is None:
+            raise HardwareError(f"PWM not started on pin {pin}")
+        if self.gpio:
+            pwm.ChangeDutyCycle(duty)
+        else:
+            pwm["duty"] = duty
+
+    def pwm_stop(self, pin):
+        pwm = self.pwms.pop(pin, None)
+        if pwm is not None and self.gpio:
+            pwm.stop()
+
+    def make_safe(self, pin):
+        """Stop PWM and restore the pin's safe level"""
+        self.pwm_stop(pin)
+        if pin in self.safe_levels:
+            self.output(pin, self.safe_levels[pin])
+
+    def cleanup(self):
+        for pin in list(self.pwms):
+            self.pwm_stop(pin)
+        if self.gpio:
+            self.gpio.cleanup()
+
+
+class I2CBackend:
+    """SMBus access to the multiplexed sensor bus, simulated when unavailable"""
+    def __init__(self, bus=I2C_BUS):
+        self.mux_channel = None
+        try:
+            from smbus2 import SMBus
+            self.bus = SMBus(bus)
+            self.simulation_mode = False
+        except Exception as e:
+            logging.warning(f"I2C bus {bus} unavailable ({e}) - simulating sensors")
+            self.bus = None
+            self.simulation_mode = True
+
+    def select_channel(self, channel):
+        """Select a PCA9548A channel, skipping the write if already selected"""
+        if channel == self.mux_channel:
+            return
+        if self.bus:
+            self.bus.write_byte(PCA9548A_ADDR, 1 << channel)
+            time.sleep(0.1)
+        self.mux_channel = channel
+
+    def read_ads1115(self, channel):
+        """Single-shot, single-ended read of an ADS1115 input (raw counts)"""
+        if not self.bus:
+            return random.randint(10000, 25000)
+        self.select_channel(ADS1115_CHANNEL)
+
+        # OS=1, MUX=AINx vs GND, PGA=+/-4.096V, single-shot; 128SPS, comparator off
+        config = [0xC3 | (channel << 4), 0x83]
+        self.bus.write_i2c_block_data(ADS1115_ADDR, ADS1115_REG_POINTER_CONFIG, config)
+        time.sleep(0.01)  # One conversion at 128SPS takes ~8ms
+
+        data = self.bus.read_i2c_block_data(ADS1115_ADDR, ADS1115_REG_POINTER_CONVERT, 2)
+        value = (data[0] << 8) | data[1]
+        if value & 0x8000:
+            value -= 65536
+        return value
+
+    def read_bh1750(self):
+        """Read light level in lux from the BH1750"""
+        if not self.bus:
+            return random.uniform(100, 1000)
+        self.select_channel(BH1750_CHANNEL)
+        self.bus.write_byte(BH1750_ADDR, 0x10)  # Continuous high-res mode
+        time.sleep(0.2)
+        data = self.bus.read_i2c_block_data(BH1750_ADDR, 0x00, 2)
+        return (data[0] << 8 | data[1]) / 1.2
+
+    def close(self):
+        if self.bus:
+            self.bus.close()
+
+
+class DhtSensor:
+    """Background DHT22 poller; clients read the latest sample"""
+    def __init__(self, pin=DHT_PIN, interval=DHT_POLL_INTERVAL):
+        self.pin = pin
+        self.interval = interval
+        self.sample = None  # (temperature, humidity, time)
+        self.lock = threading.Lock()
+        self.thread = None
+        try:
+            import Adafruit_DHT
+            self.driver = Adafruit_DHT
+            self.simulation_mode = False
+        except ImportError as e:
+            logging.warning(f"Adafruit_DHT unavailable ({e}) - simulating DHT22")
+            self.driver = None
+            self.simulation_mode = True
+
+    def _read(self):
+        if self.driver is None:
+            return 23.0 + random.uniform(-1.0, 1.0), 45.0 + random.uniform(-5.0, 5.0)
+        humidity, temperature = self.driver.read_retry(self.driver.DHT22, self.pin)
+        if humidity is None or temperature is None:
+            return None
+        if not (0 <= humidity <= 100 and -40 <= temperature <= 80):
+            return None
+        return temperature, humidity
+
+    def _poll(self):
+        while True:
+            try:
+                reading = self._read()
+            except Exception as e:
+                logging.error(f"DHT22 read failed: {e}")
+                reading = None
+            if reading is not None:
+                with self.lock:
+                    self.sample = (reading[0], reading[1], time.time())
+            time.sleep(self.interval)
+
+    def latest(self):
+        """Latest reading as a dict, starting the poller on first use"""
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._poll)
+                self.thread.daemon = True
+                self.thread.start()
+            sample = self.sample
+        if sample is None:
+            return {"temperature": None, "humidity": None, "age": None}
+        temperature, humidity, taken = sample
+        return {"temperature": temperature, "humidity": humidity, "age": time.time() - taken}
+
+
+class LeaseTable:
+    """Per-pin ownership with optional expiry"""
+    def __init__(self, reserved=None):
+        self.cond = threading.Condition()
+        self.leases = {}  # pin -> (owner, expires_at or None, ttl)
+        self.reserved = dict(reserved or {})  # pin -> what the daemon uses it for; never leased
+
+    def _check_reserved(self, pins):
+        for pin in pins:
+            if pin in self.reserved:
+                raise LeaseError(f"Pin {pin} is reserved for the daemon's {self.reserved[pin]}")
+
+    def acquire(self, owner, pins, ttl=None, wait=0):
+        self._check_reserved(pins)
+        deadline = time.monotonic() + wait
+        with self.cond:
+            while True:
+                busy = {pin: self.leases[pin][0] for pin in pins
+                        if pin in self.leases and self.leases[pin][0] != owner}
+                if not busy:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise LeaseError(f"Pins already leased: {busy}")
+                self.cond.wait(min(remaining, LEASE_REAP_INTERVAL))
+
+            expires = time.monotonic() + ttl if ttl else None
+            for pin in pins:
+                self.leases[pin] = (owner, expires, ttl)
+
+    def check(self, owner, pin):
+        """Ensure owner holds pin, extending a TTL lease on use"""
+        self._check_reserved([pin])
+        with self.cond:
+            lease = self.leases.get(pin)
+            if lease is None or lease[0] != owner:
+                holder = lease[0] if lease else "nobody"
+                raise LeaseError(f"Pin {pin} is not leased by {owner} (held by {holder})")
+            ttl = lease[2]
+            if ttl:
+                self.leases[pin] = (owner, time.monotonic() + ttl, ttl)
+
+    def release(self, owner, pins=None):
+        with self.cond:
+            released = [pin for pin, (holder, _, _) in self.leases.items()
+                        if holder == owner and (pins is None or pin in pins)]
+            for pin in released:
+                del self.leases[pin]
+            self.cond.notify_all()
+        return released
+
+    def expired(self):
+        """Drop and return pins whose lease has run out"""
+        now = time.monotonic()
+        with self.cond:
+            expired = [pin for pin, (_, expires, _) in self.leases.items()
+                       if expires is not None and expires <= now]
+            for pin in expired:
+                del self.leases[pin]
+            if expired:
+                self.cond.notify_all()
+        return expired
+
+
+class HardwareDaemon:
+    """Owns the pins and bus and executes client batches against them"""
+    PIN_OPS = {"setup", "output", "input", "pwm_start", "pwm_duty", "pwm_stop"}
+
+    def __init__(self):
+        self.gpio = GpioBackend()
+        self.i2c = I2CBackend()
+        self.dht = DhtSensor()
+        self.leases = LeaseTable(reserved={self.dht.pin: "DHT22"})  # Driving it would corrupt the sensor line
+        self.hw_lock = threading.Lock()
+        self.running = True
+
+    def execute(self, owner, ops):
+        """Run one batch for owner and return per-op results"""
+        results = [None] * len(ops)
+        failed = False
+
+        # Acquire leases first, outside the hardware lock (they may wait)
+        for i, op in enumerate(ops):
+            if op.get("op") != "lease":
+                continue
+            try:
+                self.leases.acquire(owner, op["pins"], ttl=op.get("ttl"), wait=op.get("wait", 0))
+                results[i] = {"value": None}
+            except Exception as e:
+                results[i] = _error_result(e)
+                failed = True
+                break
+
+        with self.hw_lock:
+            for i, op in enumerate(ops):
+                if results[i] is not None:
+                    continue
+                if failed:
+                    results[i] = {"error": "skipped after earlier failure in batch"}
+                    continue
+                try:
+                    results[i] = {"value": self._hardware_op(owner, op)}
+                except Exception as e:
+                    results[i] = _error_result(e)
+                    failed = True
+        return results
+
+    def _hardware_op(self, owner, op):
+        name = op.get("op")
+        if name == "release":
+            # Called with the hardware lock held; a new holder's ops wait for it
+            pins = self.leases.release(owner, op.get("pins"))
+            for pin in pins:
+                self.gpio.make_safe(pin)
+            return pins
+        if name in self.PIN_OPS:
+            pin = op["pin"]
+            self.leases.check(owner, pin)
+            if name == "setup":
+                return self.gpio.setup(pin, op.get("mode", "out"), op.get("initial", 0))
+            if name == "output":
+                return self.gpio.output(pin, op["value"])
+            if name == "input":
+                return self.gpio.input(pin)
+            if name == "pwm_start":
+                return self.gpio.pwm_start(pin, op["freq"], op.get("duty", 0))
+            if name == "pwm_duty":
+                return self.gpio.pwm_duty(pin, op["duty"])
+            return self.gpio.pwm_stop(pin)
+        if name == "ads1115":
+            return self.i2c.read_ads1115(op["channel"])
+        if name == "bh1750":
+            return self.i2c.read_bh1750()
+        if name == "dht22":
+            return self.dht.latest()
+        if name == "ping":
+            return time.time()
+        raise HardwareError(f"Unknown op: {name}")
+
+    def make_safe(self, pins):
+        if not pins:
+            return
+        with self.hw_lock:
+            for pin in pins:
+                self.gpio.make_safe(pin)
+
+    def disconnect(self, owner):
+        """Release everything a dropped connection held"""
+        pins = self.leases.release(owner)
+        if pins:
+            logging.info(f"{owner} disconnected, releasing pins {pins}")
+        self.make_safe(pins)
+
+    def reap_leases(self):
+        while self.running:
+            pins = self.leases.expired()
+            if pins:
+                logging.warning(f"Lease expired on pins {pins}, returning them to safe level")
+            self.make_safe(pins)
+            time.sleep(LEASE_REAP_INTERVAL)
+
+    def shutdown(self):
+        self.running = False
+        with self.hw_lock:
+            self.gpio.cleanup()
+            self.i2c.close()
+
+
+def _error_result(e):
+    return {"error": str(e), "type": type(e).__name__}
+
+
+class _ClientHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        daemon = self.server.daemon
+        owner = None
+        try:
+            for line in self.rfile:
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    self._send({"error": f"Bad request: {e}"})
+                    continue
+                if owner is None:
+                    owner = f"{request.get('client', 'anon')}#{self.server.next_connection_id()}"
+                results = daemon.execute(owner, request.get("ops", []))
+                self._send({"id": request.get("id"), "results": results})
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            if owner is not None:
+                daemon.disconnect(owner)
+
+    def _send(self, message):
+        self.wfile.write(json.dumps(message).encode() + b"\n")
+        self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, daemon):
+        self.daemon = daemon
+        self._connections = 0
+        self._connections_lock = threading.Lock()
+        super().__init__(path, _ClientHandler)
+
+    def next_connection_id(self):
+        with self._connections_lock:
+            self._connections += 1
+            return self._connections
+
+
+class HardwareClient:
+    """Connection to the hardware daemon (thread-safe)"""
+    def __init__(self, name, path=SOCKET_PATH, timeout=10.0):
+        self.name = name
+        self.path = path
+        self.timeout = timeout
+        self._sock = None
+        self._reader = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._next_id = 0
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError as e:
+            sock.close()
+            raise HardwareError(f"Hardware daemon not reachable at {self.path}: {e}")
+        self._sock = sock
+        self._reader = sock.makefile("rb")
+
+    def call(self, *ops):
+        """Send ops as one batch; returns the last op's value"""
+        pending = getattr(self._local, "pending", None)
+        if pending is not None:
+            pending.extend(ops)
+            return None
+        values = self._send(list(ops))
+        return values[-1] if values else None
+
+    def _send(self, ops, timeout=None):
+        with self._lock:
+            if self._sock is None:
+                self._connect()
+            self._next_id += 1
+            request = {"id": self._next_id, "client": self.name, "ops": ops}
+            try:
+                self._sock.settimeout(timeout or self.timeout)
+                self._sock.sendall(json.dumps(request).encode() + b"\n")
+                line = self._reader.readline()
+            except OSError as e:
+                self._close_locked()
+                raise HardwareError(f"Lost connection to hardware daemon: {e}")
+            if not line:
+                self._close_locked()
+                raise HardwareError("Hardware daemon closed the connection")
+
+        response = json.loads(line)
+        if "error" in response:
+            raise HardwareError(response["error"])
+        values = []
+        for op, result in zip(ops, response["results"]):
+            if "error" in result:
+                error_cls = LeaseError if result.get("type") == "LeaseError" else HardwareError
+                raise error_cls(f"{op.get('op')}: {result['error']}")
+            values.append(result["value"])
+        return values
+
+    @contextmanager
+    def batch(self):
+        """Collect ops issued in this thread and send them as one batch"""
+        self._local.pending = []
+        try:
+            yield
+            ops = self._local.pending
+        finally:
+            self._local.pending = None
+        if ops:
+            self._send(ops)
+
+    # Leases
+    def lease(self, pins, ttl=None, wait=0):
+        op = {"op": "lease", "pins": list(pins), "ttl": ttl, "wait": wait}
+        if getattr(self._local, "pending", None) is not None:
+            return self.call(op)
+        return self._send([op], timeout=self.timeout + wait)[0]
+
+    def release(self, pins=None):
+        return self.call({"op": "release", "pins": list(pins) if pins is not None else None})
+
+    @contextmanager
+    def holding(self, pins, wait=60, initial=0):
+        """Lease and set up pins for the duration of a block"""
+        self.lease(pins, wait=wait)
+        try:
+            with self.batch():
+                for pin in pins:
+                    self.setup(pin, initial=initial)
+            yield self
+        finally:
+            with self.batch():
+                for pin in pins:
+                    self.output(pin, initial)
+                self.release(pins)
+
+    # Pins
+    def setup(self, pin, mode="out", initial=0):
+        return self.call({"op": "setup", "pin": pin, "mode": mode, "initial": initial})
+
+    def output(self, pin, value):
+        return self.call({"op": "output", "pin": pin, "value": int(value)})
+
+    def input(self, pin):
+        return self.call({"op": "input", "pin": pin})
+
+    def pwm_start(self, pin, freq, duty=0):
+        return self.call({"op": "pwm_start", "pin": pin, "freq": freq, "duty": duty})
+
+    def pwm_duty(self, pin, duty):
+        return self.call({"op": "pwm_duty", "pin": pin, "duty": duty})
+
+    def pwm_stop(self, pin):
+        return self.call({"op": "pwm_stop", "pin": pin})
+
+    # Sensors
+    def ads1115(self, channel):
+        """Raw ADS1115 counts for an input channel"""
+        return self.call({"op": "ads1115", "channel": channel})
+
+    def ads1115_voltage(self, channel):
+        return self.ads1115(channel) * ADS1115_FULL_SCALE / 32768
+
+    def bh1750(self):
+        return self.call({"op": "bh1750"})
+
+    def dht22(self):
+        """Latest DHT22 sample: {"temperature", "humidity", "age"} (None until the first read)"""
+        return self.call({"op": "dht22"})
+
+    def close(self):
+        with self._lock:
+            self._close_locked()
+
+    def _close_locked(self):
+        if self._sock is not None:
+            try:
+                self._reader.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._reader = None
+
+
+class RemotePWM:
+    """Stand-in for RPi.GPIO.PWM backed by the daemon"""
+    def __init__(self, client, pin, freq):
+        self.client = client
+        self.pin = pin
+        self.freq = freq
+
+    def start(self, dc):
+        self.client.pwm_start(self.pin, self.freq, dc)
+
+    def ChangeDutyCycle(self, dc):
+        self.client.pwm_duty(self.pin, dc)
+
+    def stop(self):
+        self.client.pwm_stop(self.pin)
+
+
+class RemoteGPIO:
+    """Drop-in for the subset of RPi.GPIO the control scripts use.
+
+    setup() leases the pin for the life of the connection.
+    """
+    BCM = "BCM"
+    OUT = "out"
+    IN = "in"
+    HIGH = 1
+    LOW = 0
+
+    def __init__(self, client):
+        self.client = client
+
+    def setmode(self, mode):
+        pass  # The daemon always numbers pins BCM
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, mode, initial=LOW):
+        with self.client.batch():
+            self.client.lease([pin])
+            self.client.setup(pin, mode, initial)
+
+    def output(self, pin, value):
+        self.client.output(pin, value)
+
+    def input(self, pin):
+        return self.client.input(pin)
+
+    def PWM(self, pin, freq):
+        return RemotePWM(self.client, pin, freq)
+
+    def cleanup(self):
+        try:
+            self.client.release()
+        except HardwareError as e:
+            print(f"Warning: could not release pins: {e}")
+        self.client.close()
+
+
+def serve(path=SOCKET_PATH):
+    if os.path.exists(path):
+        os.unlink(path)
+
+    daemon = HardwareDaemon()
+    server = _Server(path, daemon)
+    os.chmod(path, 0o660)
+
+    reaper = threading.Thread(target=daemon.reap_leases)
+    reaper.daemon = True
+    reaper.start()
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown).start()
+    signal.signal(signal.SIGTERM, stop)
+
+    logging.info(f"Hardware daemon listening on {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        daemon.shutdown()
+        if os.path.exists(path):
+            os.unlink(path)
+        logging.info("Hardware daemon stopped")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    serve()
@@ -1,7 +1,8 @@
-from flask import Flask, send_file, redirect, url_for
+import argparse
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS  # Import CORS
 import cv2
-import os
+from hardware.streaming import AsyncStreamServer, FrameBroadcaster, MJPEG_MIMETYPE, snapshot_response
 
 app = Flask(__name__)
 
@@ -11,17 +12,33 @@ CORS(app)
 # Use your computer's webcam
 cap = cv2.VideoCapture(0)
 
-# Ensure static directory exists
-STATIC_IMAGE_PATH = 'static/img.jpg'
-os.makedirs('static', exist_ok=True)
+def read_frame():
+    ret, frame = cap.read()
+    return frame if ret else None
+
+broadcaster = FrameBroadcaster(read_frame)
+
+@app.route('/video_feed')
+def video_feed():
+    return Response(broadcaster.mjpeg(), mimetype=MJPEG_MIMETYPE)
+
+@app.route('/stream_stats')
+def stream_stats():
+    return jsonify(broadcaster.status())
 
 @app.route('/capture')
 def capture_image():
-    ret, frame = cap.read()
-    if not ret:
-        return "Failed to capture image", 500
-    cv2.imwrite(STATIC_IMAGE_PATH, frame)
-    return redirect(url_for('static', filename='img.jpg'))
+    # JPEG straight from memory (?width=&quality= optional), 304 if the client has this frame
+    status, body, headers = snapshot_response(broadcaster, request.args, request.headers)
+    return Response(body, status=status, headers=headers)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5004)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="Serve /video_feed, /capture and /stream_stats from one asyncio loop")
+    parser.add_argument('--port', type=int, default=5004)
+    args = parser.parse_args()
+    if args.use_async:
+        AsyncStreamServer(broadcaster, snapshot_paths=['/capture']).run(port=args.port)
+    else:
+        app.run(host='0.0.0.0', port=args.port)
@@ -1,15 +1,23 @@
-import RPi.GPIO as GPIO
 import time
 import threading
+import logging
 from datetime import datetime, timedelta
+from hwd import HardwareClient, RemoteGPIO
+from scheduler import Job, Scheduler
+from dosing import DosingPlanner, Pump
+from relays import RelayTimer
+from climate import ClimateController
 
 # GPIO Setup
+# Pins are owned by the hardware daemon (hwd.py); setup() leases them
+hw = HardwareClient("mega")
+GPIO = RemoteGPIO(hw)
 GPIO.setmode(GPIO.BCM)
 GPIO.setwarnings(False)
 
 # Pin Assignments (Customize these to your actual wiring)
 # Motors (controlled via L298N drivers)
-MOTOR_A_EN = 17    # Enable pin for Motor A
+MOTOR_A_EN = 7     # Enable pin for Motor A (BCM17 is the DHT22, reserved by hwd.py)
 MOTOR_A_IN1 = 27   # Input 1 for Motor A
 MOTOR_A_IN2 = 22   # Input 2 for Motor A
 MOTOR_B_EN = 24    # Enable pin for Motor B
@@ -29,10 +37,28 @@ PUMP_4 = 20        # Nutrient Pump 4
 # Water Motor
 WATER_MOTOR = 21   # Main water circulation motor
 
+# Dosing (calibrate ml/s by timing each pump into a measuring cylinder)
+DOSING_PUMPS = [
+    Pump("nutrient_1", PUMP_1, ml_per_second=1.0, current_a=0.3),
+    Pump("nutrient_2", PUMP_2, ml_per_second=1.0, current_a=0.3),
+    Pump("nutrient_3", PUMP_3, ml_per_second=1.0, current_a=0.3),
+    Pump("nutrient_4", PUMP_4, ml_per_second=1.0, current_a=0.3),
+]
+DOSE_ML = {"nutrient_1": 5, "nutrient_2": 5, "nutrient_3": 5, "nutrient_4": 5}
+PUMP_CURRENT_BUDGET_A = 1.2   # Supply headroom for concurrently running pumps
+INCOMPATIBLE_PUMPS = []       # e.g. [("nutrient_1", "nutrient_2")] to never overlap
+
 # Relay Controls
 FAN_RELAY = 16     # Cooling fan control
 SPRAY_RELAY = 26    # Sprinkler system
 PELTIER_RELAY = 4   # Peltier cooling
+RELAY_EXCLUSIONS = []  # Relay pairs never on together, e.g. [(SPRAY_RELAY, FAN_RELAY)]
+
+# Climate targets (fan/spray/peltier follow the DHT22 instead of a timer)
+TEMP_TARGET = 24.0        # °C
+HUMIDITY_TARGET = 60.0    # %RH
+CLIMATE_INTERVAL = 5      # Seconds between control updates
+DHT_MAX_AGE = 30          # Ignore DHT22 samples older than this
 
 # pH Sensor Control
 PH_POWER = 18       # pH sensor on/off control
@@ -74,7 +100,15 @@ servo_2_pwm.start(0)
 
 # System Variables
 last_water_change = datetime.now()
-system_active = True
+dosing_planner = DosingPlanner(DOSING_PUMPS, PUMP_CURRENT_BUDGET_A,
+                               incompatible=INCOMPATIBLE_PUMPS,
+                               mix_pin=WATER_MOTOR, mix_seconds=120)
+relay_timer = RelayTimer(GPIO, exclusive=RELAY_EXCLUSIONS)
+climate = ClimateController(GPIO.output, FAN_RELAY, SPRAY_RELAY, PELTIER_RELAY,
+                            temp_target=TEMP_TARGET, humidity_target=HUMIDITY_TARGET)
+climate_stop = threading.Event()
+SCHEDULE_STATE_FILE = "mega_schedule.json"  # Survives restarts
+scheduler = Scheduler(SCHEDULE_STATE_FILE)
 
 def set_servo_angle(servo_pwm, angle):
     """Set servo to specific angle (0-180 degrees)"""
@@ -98,10 +132,8 @@ def mix_water(duration=120):
     GPIO.output(WATER_MOTOR, GPIO.LOW)
 
 def control_relay_device(relay_pin, duration=10):
-    """Control relay devices (fan, spray, peltier) for 10 seconds"""
-    GPIO.output(relay_pin, GPIO.HIGH)
-    time.sleep(duration)
-    GPIO.output(relay_pin, GPIO.LOW)
+    """Switch a relay device (fan, spray, peltier) on for 10 seconds without blocking"""
+    relay_timer.pulse(relay_pin, duration)
 
 def check_water_frequency():
     """Check if water needs changing (every 3 days)"""
@@ -114,21 +146,19 @@ def check_water_frequency():
     return False
 
 def dosing_sequence():
-    """Run all peristaltic pumps in sequence"""
+    """Dose all nutrients concurrently within the current budget, then mix once"""
     print("Starting dosing sequence")
-    pumps = [PUMP_1, PUMP_2, PUMP_3, PUMP_4]
-    for pump in pumps:
-        run_pump(pump, 5)  # Run each pump for 5 seconds
-        time.sleep(2)       # Pause between pumps
+    dosing_planner.run(GPIO, DOSE_ML)
     print("Dosing sequence completed")
 
 def environmental_control():
-    """Control fan, spray, and peltier devices"""
+    """Run fan, spray, and peltier devices together (returns immediately).
+    Manual override only; climate_loop normally drives these relays."""
     print("Running environmental control")
     devices = [FAN_RELAY, SPRAY_RELAY, PELTIER_RELAY]
     for device in devices:
         control_relay_device(device)
-    print("Environmental control completed")
+    print("Environmental control scheduled")
 
 def motor_control(motor, direction, speed=50, duration=0):
     """Control motors through L298N drivers"""
@@ -162,26 +192,33 @@ def motor_control(motor, direction, speed=50, duration=0):
         pwm.ChangeDutyCycle(0)
 
 def system_monitor():
-    """Main system monitoring loop"""
-    while system_active:
-        # Check water frequency daily
-        if datetime.now().hour == 8 and datetime.now().minute < 1:
-            check_water_frequency()
-        
-        # Run dosing twice daily (8AM and 8PM)
-        if datetime.now().hour in [8, 20] and datetime.now().minute < 1:
-            dosing_sequence()
-        
-        # Run environmental control every 2 hours
-        if datetime.now().hour % 2 == 0 and datetime.now().minute < 1:
-            environmental_control()
-        
-        time.sleep(60)  # Check every minute
+    """Main system monitoring loop (sleeps until the next job is due)"""
+    # Check water frequency daily
+    scheduler.add(Job("water_check", check_water_frequency, hours=[8], catch_up=True))
+    
+    # Run dosing twice daily (8AM and 8PM); a missed dose runs once on restart
+    scheduler.add(Job("dosing", dosing_sequence, hours=[8, 20], catch_up=True))
+    scheduler.run()
+
+def climate_loop():
+    """Closed-loop fan/spray/peltier control from the daemon's DHT22 samples"""
+    while not climate_stop.is_set():
+        try:
+            reading = hw.dht22()
+            if reading["age"] is None or reading["age"] > DHT_MAX_AGE:
+                climate.update(None, None)
+            else:
+                climate.update(reading["temperature"], reading["humidity"])
+        except Exception as e:
+            print(f"Climate control error: {e}")
+        climate_stop.wait(CLIMATE_INTERVAL)
 
 def cleanup():
     """Clean up GPIO on exit"""
-    global system_active
-    system_active = False
+    scheduler.stop()
+    climate_stop.set()
+    relay_timer.stop()
+    climate.shutdown()
     
     # Stop all motors
     motor_control('A', 'stop')
@@ -202,6 +239,7 @@ def cleanup():
     print("System shutdown complete")
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     try:
         print("Hydroponic System Control Started")
         
@@ -214,6 +252,11 @@ if __name__ == "__main__":
         monitor_thread.daemon = True
         monitor_thread.start()
         
+        # Start climate control thread
+        climate_thread = threading.Thread(target=climate_loop)
+        climate_thread.daemon = True
+        climate_thread.start()
+        
         # Main thread can be used for additional controls
         while True:
             time.sleep(1)
@@ -224,188 +267,3 @@ if __name__ == "__main__":
         print(f"Error: {e}")
     finally:
         cleanup()
-import RPi.GPIO as GPIO
-import time
-from datetime import datetime, timedelta
-
-# Initialize GPIO
-GPIO.setmode(GPIO.BCM)
-GPIO.setwarnings(False)
-
-# Pin Assignments (Update these to match your wiring)
-### Motors ###
-# L298N Driver 1
-M1_EN = 17  # Motor 1 Enable
-M1_IN1 = 27 # Motor 1 Input 1
-M1_IN2 = 22 # Motor 1 Input 2
-
-# L298N Driver 2  
-M2_EN = 24  # Motor 2 Enable
-M2_IN1 = 23 # Motor 2 Input 1
-M2_IN2 = 25 # Motor 2 Input 2
-
-### Servos ###
-SERVO1 = 12
-SERVO2 = 13
-
-### Pumps ###  
-PUMP1 = 5   # Peristaltic Pump 1
-PUMP2 = 6   # Peristaltic Pump 2  
-PUMP3 = 19  # Peristaltic Pump 3
-PUMP4 = 20  # Peristaltic Pump 4
-
-### Water System ###
-WATER_MOTOR = 21  # Main water pump
-SPRAY = 26       # Sprinkler relay
-
-### Environmental ###  
-FAN = 16     # Cooling fan relay
-PELTIER = 4  # Peltier cooler relay
-PH_POWER = 18 # pH sensor power
-
-# Setup Outputs
-for pin in [M1_EN, M1_IN1, M1_IN2, M2_EN, M2_IN1, M2_IN2,
-            SERVO1, SERVO2, PUMP1, PUMP2, PUMP3, PUMP4,
-            WATER_MOTOR, SPRAY, FAN, PELTIER, PH_POWER]:
-    GPIO.setup(pin, GPIO.OUT)
-    GPIO.output(pin, GPIO.LOW)
-
-# Initialize PWM
-m1_pwm = GPIO.PWM(M1_EN, 1000)
-m2_pwm = GPIO.PWM(M2_EN, 1000)
-servo1 = GPIO.PWM(SERVO1, 50)
-servo2 = GPIO.PWM(SERVO2, 50)
-
-m1_pwm.start(0)
-m2_pwm.start(0) 
-servo1.start(0)
-servo2.start(0)
-
-# System Variables
-last_water_change = datetime.now()
-
-def move_servo(servo, angle):
-    """Move servo to specified angle (0-180)"""
-    duty = angle / 18 + 2
-    servo.ChangeDutyCycle(duty)
-    time.sleep(0.3)
-    servo.ChangeDutyCycle(0)  # Prevent jitter
-
-def run_motor(motor, direction, speed=50, duration=0):
-    """Control motor movement
-    motor: 1 or 2
-    direction: 'fwd' or 'rev'
-    speed: 0-100
-    duration: seconds (0 for continuous)
-    """
-    if motor == 1:
-        en, in1, in2, pwm = M1_EN, M1_IN1, M1_IN2, m1_pwm
-    else:
-        en, in1, in2, pwm = M2_EN, M2_IN1, M2_IN2, m2_pwm
-    
-    pwm.ChangeDutyCycle(speed)
-    
-    if direction == 'fwd':
-        GPIO.output(in1, GPIO.HIGH)
-        GPIO.output(in2, GPIO.LOW)
-    else:  # rev
-        GPIO.output(in1, GPIO.LOW)
-        GPIO.output(in2, GPIO.HIGH)
-    
-    if duration > 0:
-        time.sleep(duration)
-        stop_motor(motor)
-
-def stop_motor(motor):
-    """Stop specified motor"""
-    if motor == 1:
-        GPIO.output(M1_IN1, GPIO.LOW)
-        GPIO.output(M1_IN2, GPIO.LOW)
-        m1_pwm.ChangeDutyCycle(0)
-    else:
-        GPIO.output(M2_IN1, GPIO.LOW)
-        GPIO.output(M2_IN2, GPIO.LOW) 
-        m2_pwm.ChangeDutyCycle(0)
-
-def dose_nutrients(pump, duration):
-    """Run peristaltic pump with auto water mixing"""
-    print(f"Dosing pump {pump} for {duration}s")
-    GPIO.output(pump, GPIO.HIGH)
-    time.sleep(duration)
-    GPIO.output(pump, GPIO.LOW)
-    
-    # Auto water mixing
-    print("Mixing water for 2 minutes")
-    GPIO.output(WATER_MOTOR, GPIO.HIGH)
-    time.sleep(120)
-    GPIO.output(WATER_MOTOR, GPIO.LOW)
-
-def control_relay(device, duration=10):
-    """Control relay devices with 10s default runtime"""
-    print(f"Activating {device} for {duration}s")
-    GPIO.output(device, GPIO.HIGH)
-    time.sleep(duration)
-    GPIO.output(device, GPIO.LOW)
-
-def check_water_age():
-    """Check if water needs changing (3-day limit)"""
-    global last_water_change
-    if datetime.now() > last_water_change + timedelta(days=3):
-        print("Water expired - needs changing!")
-        # Add your water change routine here
-        last_water_change = datetime.now()
-        return True
-    return False
-
-def full_dosing_cycle():
-    """Complete nutrient dosing sequence"""
-    print("\n=== Starting Dosing Cycle ===")
-    
-    # Dose each pump sequentially
-    for i, pump in enumerate([PUMP1, PUMP2, PUMP3, PUMP4], 1):
-        dose_nutrients(pump, 5)  # 5s per pump
-        if i < 4:  # Pause between pumps (except last)
-            time.sleep(2)
-    
-    print("=== Dosing Complete ===\n")
-
-def environmental_cycle():
-    """Run all environmental controls"""
-    print("\nRunning Environmental Controls")
-    control_relay(FAN)      # Cooling fan
-    control_relay(SPRAY)    # Sprinkler
-    control_relay(PELTIER)  # Peltier cooler
-    print("Environmental Cycle Complete\n")
-
-# Example Usage
-try:
-    # Initialize servos
-    move_servo(servo1, 90)
-    move_servo(servo2, 90)
-    
-    # Test motors
-    run_motor(1, 'fwd', 75, 2)
-    run_motor(2, 'rev', 50, 2)
-    
-    # Test full system
-    full_dosing_cycle()
-    environmental_cycle()
-    
-    # Check water age
-    check_water_age()
-    
-    # Keep program running
-    while True:
-        time.sleep(1)
-
-except KeyboardInterrupt:
-    print("\nShutting down...")
-    
-finally:
-    # Cleanup
-    m1_pwm.stop()
-    m2_pwm.stop()
-    servo1.stop()
-    servo2.stop()
-    GPIO.cleanup()
-    print("System off")
\ No newline at end of file
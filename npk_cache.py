@@ -0,0 +1,86 @@
+"""
+Byte-bounded LRU cache with hit/miss/eviction counters and optional TTL.
+
+Used for query-image embeddings keyed by content hash, so a long-running
+service keeps a fixed memory budget and an overwritten file is a miss
+rather than a stale hit, and for rendered plots and generated
+descriptions, which may also expire after a time-to-live.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+def nbytes(value):
+    """Size of a NumPy array (or anything with .nbytes / a len())"""
+    return value.nbytes if hasattr(value, "nbytes") else len(value)
+
+
+class LRUCache:
+    """Least-recently-used cache bounded by total value size in bytes"""
+    def __init__(self, max_bytes, sizeof=nbytes, ttl=None):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.ttl = ttl  # Seconds an entry stays valid; None keeps it until evicted
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._items = OrderedDict()  # key -> (value, size, expiry time or None), oldest first
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[2] is not None and item[2] <= time.monotonic():
+                del self._items[key]
+                self.bytes -= item[1]
+                self.expirations += 1
+                item = None
+            if item is None:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            if size > self.max_bytes:
+                return  # Would evict everything and still not fit
+            self._items[key] = (value, size, expires)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted, _) = self._items.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._items),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,106 @@
+"""
+Cache of assembled dataset frames, keyed by source checksums.
+
+Each data source (the main CSV, the tomato ZIP, the Kaggle download) is
+turned into a DataFrame once and saved under <root>/dataset/ as Parquet
+(or pickle when pyarrow isn't installed). manifest.json records the
+checksum each frame was built from; a source whose checksum is unchanged
+is loaded from its frame instead of being re-read, re-extracted or
+re-downloaded.
+
+File checksums are blake2b over the contents, reused while the file's
+size and mtime are unchanged so a multi-GB ZIP is only hashed once.
+"""
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401  (needed by DataFrame.to_parquet)
+    FRAME_FORMAT = "parquet"
+except ImportError:
+    FRAME_FORMAT = "pickle"
+
+
+class DatasetCache:
+    """Per-source DataFrames plus a manifest of the checksums they came from"""
+    def __init__(self, root):
+        self.path = os.path.join(root, "dataset")
+        self.manifest_path = os.path.join(self.path, "manifest.json")
+        os.makedirs(self.path, exist_ok=True)
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+
+    def _save_manifest(self):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp, self.manifest_path)
+
+    def file_checksum(self, path):
+        """Content checksum of a file, rehashed only when size or mtime change"""
+        st = os.stat(path)
+        stat = [st.st_size, st.st_mtime_ns]
+        for entry in self.manifest.values():
+            if entry.get("file") == os.path.abspath(path) and entry.get("stat") == stat:
+                return entry["checksum"], stat
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest(), stat
+
+    def dir_checksum(self, path):
+        """Checksum of a directory listing (relative paths, sizes, mtimes)"""
+        digest = hashlib.blake2b(digest_size=16)
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for file in sorted(files):
+                full = os.path.join(root, file)
+                st = os.stat(full)
+                digest.update(f"{os.path.relpath(full, path)}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+        return digest.hexdigest()
+
+    def load(self, name, checksum):
+        """Cached frame for a source, or None if missing or built from other data"""
+        entry = self.manifest.get(name)
+        if entry is None or entry["checksum"] != checksum:
+            return None
+        frame_path = os.path.join(self.path, entry["frame"])
+        if not os.path.exists(frame_path):
+            return None
+        if entry["frame"].endswith(".parquet"):
+            return pd.read_parquet(frame_path)
+        return pd.read_pickle(frame_path)
+
+    def note_stat(self, name, stat):
+        """Record a new size/mtime for a source whose contents hashed the same"""
+        entry = self.manifest.get(name)
+        if entry is not None and stat is not None and entry.get("stat") != stat:
+            entry["stat"] = stat
+            self._save_manifest()
+
+    def save(self, name, checksum, frame, file=None, stat=None):
+        frame_name = f"{name}.{FRAME_FORMAT}"
+        frame_path = os.path.join(self.path, frame_name)
+        tmp = frame_path + ".tmp"
+        if FRAME_FORMAT == "parquet":
+            try:
+                frame.to_parquet(tmp, index=False)
+            except (TypeError, ValueError, NotImplementedError) as e:
+                # Mixed-type object columns can't go to Parquet as-is
+                print(f"Caching {name} as pickle ({e})")
+                frame_name = f"{name}.pickle"
+                frame_path = os.path.join(self.path, frame_name)
+                tmp = frame_path + ".tmp"
+                frame.to_pickle(tmp)
+        else:
+            frame.to_pickle(tmp)
+        os.replace(tmp, frame_path)
+        self.manifest[name] = {"checksum": checksum, "frame": frame_name,
+                               "file": os.path.abspath(file) if file else None, "stat": stat}
+        self._save_manifest()
@@ -0,0 +1,117 @@
+"""
+Perceptual hashing for near-duplicate image detection.
+
+dHash compares neighbouring pixels of a 9x8 grayscale thumbnail; pHash
+thresholds the low-frequency 8x8 DCT coefficients of a 32x32 thumbnail
+at their median. Both produce 64-bit hashes, computed for a whole batch
+of thumbnails with NumPy, whose Hamming distance stays small under
+re-encoding, resizing and small exposure changes.
+
+HashIndex finds a stored hash within max_distance bits without a full
+scan: each hash is split into max_distance + 1 bands, and by the
+pigeonhole principle any match agrees exactly on at least one band, so
+only hashes sharing a band value are compared.
+"""
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+HASH_METHODS = ("dhash", "phash")
+PHASH_SIZE = 32  # pHash thumbnail side; the hash keeps its 8x8 lowest frequencies
+
+
+def thumbnail(data, size):
+    """Grayscale float32 (h, w) thumbnail of image bytes; size is (w, h)"""
+    image = Image.open(BytesIO(data))
+    image.draft("L", (size[0] * 4, size[1] * 4))  # JPEGs decode at reduced scale
+    return np.asarray(image.convert("L").resize(size, Image.BOX), dtype=np.float32)
+
+
+def _pack(bits):
+    """(B, 64) bool -> (B,) uint64"""
+    return np.packbits(bits, axis=1).view(">u8").ravel().astype(np.uint64)
+
+
+def dhash(thumbnails):
+    """Hashes of (B, 8, 9) thumbnails: is each pixel brighter than its left neighbour?"""
+    thumbnails = np.asarray(thumbnails, dtype=np.float32)
+    return _pack((thumbnails[:, :, 1:] > thumbnails[:, :, :-1]).reshape(len(thumbnails), -1))
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    matrix = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+
+_DCT = _dct_matrix(PHASH_SIZE)
+
+
+def phash(thumbnails):
+    """Hashes of (B, 32, 32) thumbnails: low-frequency DCT coefficients above their median"""
+    thumbnails = np.asarray(thumbnails, dtype=np.float32)
+    low = (_DCT @ thumbnails @ _DCT.T)[:, :8, :8].reshape(len(thumbnails), -1)
+    median = np.median(low[:, 1:], axis=1, keepdims=True)  # The DC term would skew the median
+    return _pack(low > median)
+
+
+def image_hash(data, method="dhash"):
+    """64-bit perceptual hash of image bytes, as a Python int"""
+    if method == "dhash":
+        return int(dhash(thumbnail(data, (9, 8))[None])[0])
+    if method == "phash":
+        return int(phash(thumbnail(data, (PHASH_SIZE, PHASH_SIZE))[None])[0])
+    raise ValueError(f"Unknown hash method {method!r}; choose from {HASH_METHODS}")
+
+
+class HashIndex:
+    """Multi-index hashing: nearest stored hash within max_distance bits"""
+    def __init__(self, max_distance=4):
+        self.max_distance = max_distance
+        n_bands = max_distance + 1
+        bounds = np.linspace(0, 64, n_bands + 1).astype(int)
+        self.bands = [(int(lo), (1 << int(hi - lo)) - 1) for lo, hi in zip(bounds[:-1], bounds[1:])]
+        self.tables = [{} for _ in self.bands]  # Band value -> entry numbers
+        self.hashes = []
+        self.values = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, h, value):
+        n = len(self.values)
+        self.hashes.append(h)
+        self.values.append(value)
+        for (shift, mask), table in zip(self.bands, self.tables):
+            table.setdefault((h >> shift) & mask, []).append(n)
+
+    def find(self, h):
+        """Value of the closest stored hash within max_distance (earliest on ties), or None"""
+        best = (self.max_distance + 1, -1)  # (distance, entry); anything in range beats it
+        for (shift, mask), table in zip(self.bands, self.tables):
+            # Candidate lists are short, so plain int popcounts beat array round trips
+            for n in table.get((h >> shift) & mask, ()):
+                best = min(best, (bin(self.hashes[n] ^ h).count("1"), n))
+        return None if best[1] < 0 else self.values[best[1]]
+
+
+def near_duplicates(hashes, max_distance=4, index=None):
+    """For hashes (ints, or None to skip) in order, the position each one duplicates.
+
+    Greedy: an item maps to the closest earlier kept item within
+    max_distance, otherwise to itself (and is kept). Pass an index to
+    continue adding to it afterwards.
+    """
+    index = index if index is not None else HashIndex(max_distance)
+    representatives = np.arange(len(hashes))
+    for i, h in enumerate(hashes):
+        if h is None:
+            continue
+        found = index.find(h)
+        if found is None:
+            index.add(h, i)
+        else:
+            representatives[i] = found
+    return representatives
@@ -0,0 +1,35 @@
+"""
+Memo cache for generated plant descriptions.
+
+Generating text is the slowest part of a query, and plants that look
+alike and get the same predicted NPK get nearly the same description.
+DescriptionCache keys a description by the predicted NPK quantized to
+npk_step percentage points plus a cluster ID for the image; the
+analyzer uses the content key of the query's nearest reference image,
+which stays stable across index rebuilds and compaction and is the
+same for near-identical queries. Entries are LRU-evicted within a byte
+budget and expire after ttl seconds.
+"""
+import numpy as np
+
+from npk_cache import LRUCache
+
+
+class DescriptionCache:
+    """Descriptions by (NPK bucket, cluster ID)"""
+    def __init__(self, max_bytes=4 * 2**20, ttl=24 * 3600, npk_step=5):
+        self.npk_step = npk_step
+        self.cache = LRUCache(max_bytes, sizeof=lambda text: len(text.encode()), ttl=ttl)
+
+    def key(self, npk, cluster):
+        npk_bucket = tuple(int(v) for v in np.round(np.asarray(npk, dtype=np.float64) / self.npk_step))
+        return npk_bucket, cluster
+
+    def get(self, npk, cluster):
+        return self.cache.get(self.key(npk, cluster))
+
+    def put(self, npk, cluster, text):
+        self.cache.put(self.key(npk, cluster), text)
+
+    def stats(self):
+        return self.cache.stats()
@@ -0,0 +1,256 @@
+"""
+Batched, multi-worker image embedding pipeline.
+
+Stage 1 reads (or downloads) and hashes image sources in a thread pool
+(I/O bound), yielding them as they complete. Stage 2 decodes and resizes
+the images that still need embedding in a process pool, collates them
+into batches for the encoder, and writes each batch's output straight
+into a float32 matrix. Stage 2 can consume stage 1's output as a stream,
+so downloading overlaps with decoding and encoding.
+"""
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from io import BytesIO
+from itertools import islice
+
+import numpy as np
+from PIL import Image
+
+from npk_fetch import default_fetcher
+from npk_sources import is_zip_uri, read_zip_member
+from npk_store import content_hash
+
+IMAGE_SIZE = 224
+
+
+def read_image_bytes(src, fetcher=None):
+    """Raw bytes of a local image, URL or zip:// archive member (bytes pass through)"""
+    if isinstance(src, (bytes, bytearray)):
+        return bytes(src)
+    if is_zip_uri(src):
+        return read_zip_member(src)
+    if src.startswith('http'):
+        return (fetcher or default_fetcher()).fetch(src)
+    with open(src, 'rb') as f:
+        return f.read()
+
+
+def preprocess(src, size=IMAGE_SIZE):
+    """Decode, resize and normalize an image to a (3, size, size) float32 array.
+
+    Matches Resize((size, size)) -> ToTensor() -> Normalize(0.5, 0.5).
+    src is a path, a URL, a zip:// archive member, or raw bytes.
+    """
+    if isinstance(src, (bytes, bytearray)):
+        img = Image.open(BytesIO(src))
+    elif src.startswith('http') or is_zip_uri(src):
+        img = Image.open(BytesIO(read_image_bytes(src)))
+    else:
+        img = Image.open(src)
+    img.draft("RGB", (size, size))  # Let JPEG decode at reduced scale when possible
+    img = img.convert("RGB")
+    img = img.resize((size, size), Image.BILINEAR)
+    array = np.asarray(img, dtype=np.float32) / 255.0
+    return ((array - 0.5) / 0.5).transpose(2, 0, 1)
+
+
+def _preprocess_job(job):
+    src, size = job
+    try:
+        return preprocess(src, size)
+    except Exception as e:
+        return e
+
+
+def _hash_job(src, fetcher=None, perceptual=None):
+    try:
+        data = read_image_bytes(src, fetcher)
+    except Exception as e:
+        return e, None, None
+    try:
+        extra = perceptual(data) if perceptual else None
+    except Exception:
+        extra = None  # Undecodable images fail later, in preprocessing
+    return content_hash(data), data, extra
+
+
+def iter_hashed(sources, max_workers=8, fetcher=None, perceptual=None, ordered=False):
+    """Yield (position, key or exception, bytes, perceptual hash) for each source as its read completes.
+
+    perceptual is an optional bytes -> hash function (see npk_dedup),
+    run in the worker threads; without it the last item is None. With
+    ordered=True results come in source order instead. At most
+    2 * max_workers reads are in flight or waiting to be consumed, so a
+    slow consumer bounds memory rather than buffering every image.
+    """
+    sources = iter(enumerate(sources))
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        def submit(i, src):
+            return pool.submit(_hash_job, src, fetcher, perceptual), i
+
+        pending = deque(submit(i, src) for i, src in islice(sources, 2 * max_workers))
+        while pending:
+            if ordered:
+                done = [pending.popleft()]
+            else:
+                finished, _ = wait([future for future, _ in pending], return_when=FIRST_COMPLETED)
+                done = [item for item in pending if item[0] in finished]
+                for item in done:
+                    pending.remove(item)
+            for future, i in done:
+                for j, src in islice(sources, 1):
+                    pending.append(submit(j, src))
+                yield (i, *future.result())
+
+
+def hash_sources(sources, max_workers=8, fetcher=None):
+    """Content hash of each source; returns [(key or exception, bytes)] in order"""
+    results = [None] * len(sources)
+    for i, key, data, _ in iter_hashed(sources, max_workers, fetcher):
+        results[i] = (key, data)
+    return results
+
+
+INFERENCE_MODES = ("fp32", "int8", "traced")
+
+
+def moondream_encoder(model, device, mode="fp32", num_threads=None):
+    """encode_batch callable for a Moondream model (patch tokens mean-pooled).
+
+    mode picks the CPU inference path:
+      fp32    the model as loaded
+      int8    dynamic int8 quantization of the vision encoder's Linear layers
+              (CPU only; modifies the model in place)
+      traced  TorchScript trace of encode_image, falling back to fp32 if the
+              model doesn't trace
+    num_threads sets torch's intra-op thread count (None keeps torch's default).
+    """
+    import torch
+
+    if mode not in INFERENCE_MODES:
+        raise ValueError(f"Unknown inference mode {mode!r}; choose from {INFERENCE_MODES}")
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if mode == "int8" and device != "cpu":
+        print(f"int8 quantization is CPU-only; using fp32 on {device}")
+        mode = "fp32"
+
+    encode = model.encode_image
+    if mode == "int8":
+        target = getattr(model, "vision_encoder", model)  # Leave the text model untouched
+        torch.ao.quantization.quantize_dynamic(target, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    elif mode == "traced":
+        example = torch.zeros(2, 3, IMAGE_SIZE, IMAGE_SIZE, device=device)
+        try:
+            with torch.inference_mode():
+                encode = torch.jit.trace(model.encode_image, example, check_trace=False)
+        except Exception as e:
+            print(f"Could not trace encode_image ({e}); using fp32")
+
+    def encode_batch(batch):
+        with torch.inference_mode():
+            out = encode(torch.from_numpy(batch).to(device)).float().cpu().numpy()
+        # Pool patch tokens so every image is a single fixed-size vector
+        if out.ndim > 2:
+            out = out.reshape(out.shape[0], -1, out.shape[-1]).mean(axis=1)
+        return out.astype(np.float32)
+    return encode_batch
+
+
+def moondream_features(model, device, batch):
+    """Moondream's un-pooled image features for a preprocessed (B, 3, H, W) float32 batch,
+    the form answer_question() takes; the same input encode_batch feeds encode_image"""
+    import torch
+
+    with torch.inference_mode():
+        return model.encode_image(torch.from_numpy(batch).to(device))
+
+
+def default_workers():
+    # Leave cores for the encoder's own intra-op threads
+    return max(1, (os.cpu_count() or 2) // 2)
+
+
+class EmbeddingPipeline:
+    """Runs preprocess -> batch -> encode over many images"""
+    def __init__(self, encode_batch, image_size=IMAGE_SIZE, batch_size=16, num_workers=None):
+        self.encode_batch = encode_batch  # (B, 3, H, W) float32 -> (B, D) float32
+        self.image_size = image_size
+        self.batch_size = batch_size
+        self.num_workers = num_workers or default_workers()
+        self.last_stats = None
+
+    def _preprocessed(self, sources):
+        """Yield (source, preprocessed array) in order, keeping a bounded number in flight"""
+        window = self.batch_size * (self.num_workers + 1)
+        jobs = iter(sources)
+
+        def submit(pool, src):
+            return src, pool.submit(_preprocess_job, (src, self.image_size))
+
+        with ProcessPoolExecutor(max_workers=self.num_workers) as pool:
+            pending = deque(submit(pool, src) for src in islice(jobs, window))
+            while pending:
+                src, future = pending.popleft()
+                result = future.result()
+                for next_src in islice(jobs, 1):
+                    pending.append(submit(pool, next_src))
+                yield src, result
+
+    def run(self, sources, progress=None):
+        """Embed sources (paths, URLs or bytes); any iterable, including a generator.
+
+        Returns (matrix, ok): matrix has one row per source, ok marks the
+        rows that were embedded successfully.
+        """
+        started = time.perf_counter()
+        matrix = None
+        sized = hasattr(sources, '__len__')
+        ok = np.zeros(len(sources) if sized else 1024, dtype=bool)
+        rows = 0
+        batch, batch_rows = [], []
+
+        def flush():
+            nonlocal matrix
+            embeddings = np.asarray(self.encode_batch(np.stack(batch)), dtype=np.float32)
+            if matrix is None:
+                matrix = np.zeros((len(ok), embeddings.shape[1]), dtype=np.float32)
+            if len(matrix) < len(ok):
+                matrix = np.concatenate([matrix, np.zeros((len(ok) - len(matrix), matrix.shape[1]),
+                                                          dtype=np.float32)])
+            matrix[batch_rows] = embeddings
+            ok[batch_rows] = True
+            if progress:
+                progress(len(batch))
+            batch.clear()
+            batch_rows.clear()
+
+        for row, (src, array) in enumerate(self._preprocessed(sources)):
+            rows = row + 1
+            if rows > len(ok):
+                ok = np.concatenate([ok, np.zeros(len(ok), dtype=bool)])  # Grow streamed input
+            if isinstance(array, Exception):
+                print(f"Error processing image {str(src)[:120]}: {array}")
+                continue
+            batch.append(array)
+            batch_rows.append(row)
+            if len(batch) >= self.batch_size:
+                flush()
+        if batch:
+            flush()
+
+        elapsed = time.perf_counter() - started
+        self.last_stats = {
+            "images": int(ok.sum()),
+            "seconds": elapsed,
+            "images_per_sec": float(ok.sum() / elapsed) if elapsed > 0 else 0.0,
+            "batch_size": self.batch_size,
+            "num_workers": self.num_workers,
+        }
+        if not sized:
+            ok = ok[:rows]
+        if matrix is None:
+            return np.zeros((len(ok), 0), dtype=np.float32), ok
+        return matrix[:len(ok)], ok
@@ -0,0 +1,128 @@
+"""
+Pooled HTTP image fetching with timeouts, retries and an on-disk cache.
+
+Fetcher keeps one keep-alive requests.Session per thread (Session isn't
+thread-safe), retries connection errors and 429/5xx responses with
+exponential backoff, and never waits forever: every request has a
+(connect, read) timeout. With a cache_dir, response bodies are stored by
+URL hash alongside their ETag/Last-Modified, so later runs read them from
+disk (or revalidate with a conditional GET when revalidate=True).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+TIMEOUT = (5, 30)  # Seconds: connect, read
+RETRIES = 3
+BACKOFF = 0.5      # Retry waits 0.5s, 1s, 2s, ...
+
+
+class Fetcher:
+    """Thread-safe GETs over per-thread keep-alive sessions"""
+    def __init__(self, cache_dir=None, timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF,
+                 pool_size=16, revalidate=False):
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.revalidate = revalidate
+        self.stats = {"requests": 0, "cache_hits": 0, "not_modified": 0, "bytes": 0, "seconds": 0.0}
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            retry = Retry(total=self.retries, backoff_factor=self.backoff,
+                          status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"])
+            adapter = HTTPAdapter(max_retries=retry, pool_connections=self.pool_size,
+                                  pool_maxsize=self.pool_size)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._local.session = session
+        return session
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for name, delta in deltas.items():
+                self.stats[name] += delta
+
+    def _cache_paths(self, url):
+        name = hashlib.blake2b(url.encode(), digest_size=16).hexdigest()
+        base = os.path.join(self.cache_dir, name)
+        return base + ".body", base + ".json"
+
+    def _read_cache(self, url):
+        body_path, meta_path = self._cache_paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                return f.read(), meta
+        except (OSError, ValueError):
+            return None, None
+
+    def _write_cache(self, url, body, response):
+        body_path, meta_path = self._cache_paths(url)
+        for path, data, mode in [(body_path, body, "wb"),
+                                 (meta_path, json.dumps({
+                                     "url": url,
+                                     "etag": response.headers.get("ETag"),
+                                     "last_modified": response.headers.get("Last-Modified"),
+                                     "fetched": time.time(),
+                                 }), "w")]:
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, mode) as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+    def fetch(self, url):
+        """Response body for url, raising on HTTP errors after retries"""
+        body = meta = None
+        if self.cache_dir:
+            body, meta = self._read_cache(url)
+            if body is not None and not self.revalidate:
+                self._count(cache_hits=1)
+                return body
+
+        headers = {}
+        if meta:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        started = time.perf_counter()
+        response = self._session().get(url, headers=headers, timeout=self.timeout)
+        self._count(requests=1, seconds=time.perf_counter() - started)
+        if response.status_code == 304 and body is not None:
+            self._count(not_modified=1)
+            return body
+        response.raise_for_status()
+        self._count(bytes=len(response.content))
+        if self.cache_dir:
+            self._write_cache(url, response.content, response)
+        return response.content
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_fetcher():
+    """Shared Fetcher without a disk cache, for one-off URL reads"""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = Fetcher()
+        return _default
@@ -0,0 +1,334 @@
+"""
+Vector indexes for NPK neighbour search over L2-normalized embeddings.
+
+ExactIndex scores every reference with one BLAS matrix product (cosine
+similarity is a dot product on normalized vectors). IVFIndex is an
+inverted-file index: vectors are clustered with spherical k-means, stored
+grouped by cluster, and a query only scans the n_probe closest clusters.
+Both save to a directory of .npy files that load memory-mapped, and both
+return cosine distances (1 - similarity) like sklearn's metric='cosine'.
+
+Indexes take updates without a rebuild: add() appends vectors under the
+next ids, remove() tombstones ids so searches skip them, and compact()
+drops tombstones and renumbers the survivors 0..n-1 in id order. IVFIndex
+keeps added vectors in a small in-memory delta (assigned to the trained
+lists) until compaction merges them into the main arrays.
+"""
+import json
+import os
+
+import numpy as np
+
+CHUNK_ROWS = 8192  # Rows scored per block when the matrix is float16 or huge
+
+
+def _top_k(scores, k):
+    """Indices of the k highest scores per row, best first"""
+    k = min(k, scores.shape[1])
+    if k == scores.shape[1]:
+        top = np.argsort(-scores, axis=1)
+    else:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+    return top[:, :k]
+
+
+def _scores(queries, matrix):
+    """queries (Q, D) float32 @ matrix.T, converting float16 blocks on the fly"""
+    if matrix.dtype == np.float32 and len(matrix) <= CHUNK_ROWS * 8:
+        return queries @ matrix.T
+    out = np.empty((len(queries), len(matrix)), dtype=np.float32)
+    for start in range(0, len(matrix), CHUNK_ROWS):
+        block = np.asarray(matrix[start:start + CHUNK_ROWS], dtype=np.float32)
+        out[:, start:start + len(block)] = queries @ block.T
+    return out
+
+
+def _as_queries(queries):
+    queries = np.asarray(queries, dtype=np.float32)
+    return queries[None, :] if queries.ndim == 1 else queries
+
+
+class ExactIndex:
+    """Brute-force cosine search with a single matrix product"""
+    kind = "exact"
+
+    def __init__(self, vectors=None):
+        self.vectors = vectors
+        self.deleted = np.zeros(0 if vectors is None else len(vectors), dtype=bool)
+
+    def build(self, vectors):
+        self.vectors = vectors
+        self.deleted = np.zeros(len(vectors), dtype=bool)
+        return self
+
+    @property
+    def size(self):
+        """Ids in use, including tombstoned ones"""
+        return len(self.deleted)
+
+    def __len__(self):
+        return int(self.size - self.deleted.sum())
+
+    def pending(self):
+        """Updates that compact() would fold away"""
+        return int(self.deleted.sum())
+
+    def add(self, vectors):
+        """Append vectors; returns their ids"""
+        ids = np.arange(self.size, self.size + len(vectors))
+        self.vectors = np.concatenate([self.vectors, np.asarray(vectors, dtype=self.vectors.dtype)])
+        self.deleted = np.concatenate([self.deleted, np.zeros(len(vectors), dtype=bool)])
+        return ids
+
+    def remove(self, ids):
+        self.deleted[ids] = True
+
+    def compact(self):
+        self.vectors = np.asarray(self.vectors)[~self.deleted]
+        self.deleted = np.zeros(len(self.vectors), dtype=bool)
+
+    def search(self, queries, k):
+        """Return (cosine distances, indices), each (Q, k)"""
+        queries = _as_queries(queries)
+        scores = _scores(queries, self.vectors)
+        if self.deleted.any():
+            scores[:, self.deleted] = -np.inf
+        top = _top_k(scores, min(k, len(self)))
+        return 1 - np.take_along_axis(scores, top, axis=1), top
+
+    def save(self, path, fingerprint=None):
+        _begin_save(path)
+        _save_array(path, "vectors", self.vectors)
+        _save_array(path, "deleted", self.deleted)
+        _write_meta(path, {"kind": self.kind, "fingerprint": fingerprint})
+
+    def save_updates(self, path, fingerprint=None):
+        # Added vectors live in the main matrix, so there is no smaller delta to write
+        self.save(path, fingerprint)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        index = cls(np.load(os.path.join(path, "vectors.npy"), mmap_mode="r" if mmap else None))
+        index.deleted = np.load(os.path.join(path, "deleted.npy"))
+        return index
+
+
+class IVFIndex:
+    """Inverted-file approximate index built with spherical k-means"""
+    kind = "ivf"
+
+    def __init__(self, n_lists=None, n_probe=8, iterations=10, seed=0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = None
+        self.vectors = None  # Vectors grouped by list
+        self.ids = None      # Original row of each grouped vector
+        self.offsets = None  # List j spans vectors[offsets[j]:offsets[j + 1]]
+        # Delta of vectors added since the last build/compaction
+        self.extra_vectors = None
+        self.extra_ids = np.zeros(0, dtype=np.int64)
+        self.extra_lists = np.zeros(0, dtype=np.int32)
+        self.deleted = np.zeros(0, dtype=bool)
+
+    @property
+    def size(self):
+        """Ids in use, including tombstoned ones"""
+        return len(self.deleted)
+
+    def __len__(self):
+        return int(self.size - self.deleted.sum())
+
+    def pending(self):
+        """Updates that compact() would fold away"""
+        return int(self.deleted.sum()) + len(self.extra_ids)
+
+    def _assign(self, vectors, centroids):
+        assign = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), CHUNK_ROWS):
+            block = np.asarray(vectors[start:start + CHUNK_ROWS], dtype=np.float32)
+            assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return assign
+
+    def _kmeans(self, sample, n_lists, rng):
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(self.iterations):
+            assign = self._assign(sample, centroids)
+            order = np.argsort(assign, kind="stable")
+            counts = np.bincount(assign, minlength=n_lists)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            nonempty = counts > 0
+            sums = np.add.reduceat(sample[order], starts[nonempty], axis=0)
+            centroids[nonempty] = sums
+            # Re-seed empty clusters from random samples
+            empty = np.flatnonzero(~nonempty)
+            if len(empty):
+                centroids[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        return centroids
+
+    def _set_lists(self, vectors, ids, lists):
+        """Store vectors grouped by list as the main arrays"""
+        order = np.argsort(lists, kind="stable")
+        counts = np.bincount(lists, minlength=self.n_lists)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.ids = np.asarray(ids, dtype=np.int64)[order]
+        self.vectors = np.asarray(vectors)[order]
+        self.extra_vectors = self.vectors[:0].copy()
+        self.extra_ids = np.zeros(0, dtype=np.int64)
+        self.extra_lists = np.zeros(0, dtype=np.int32)
+
+    def build(self, vectors):
+        n = len(vectors)
+        if n == 0:
+            raise ValueError("Cannot build an index over no vectors")
+        n_lists = self.n_lists or max(1, int(np.sqrt(n)))
+        self.n_lists = min(n_lists, n)
+        rng = np.random.default_rng(self.seed)
+
+        # Train on a sample; a few hundred points per list is plenty
+        sample_size = min(n, 256 * self.n_lists)
+        sample_rows = np.sort(rng.choice(n, sample_size, replace=False))
+        sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+        self.centroids = self._kmeans(sample, self.n_lists, rng)
+
+        self._set_lists(vectors, np.arange(n), self._assign(vectors, self.centroids))
+        self.deleted = np.zeros(n, dtype=bool)
+        return self
+
+    def add(self, vectors):
+        """Assign vectors to the trained lists and append them to the delta; returns their ids"""
+        vectors = np.asarray(vectors, dtype=self.vectors.dtype)
+        ids = np.arange(self.size, self.size + len(vectors))
+        self.extra_vectors = np.concatenate([self.extra_vectors, vectors])
+        self.extra_ids = np.concatenate([self.extra_ids, ids])
+        self.extra_lists = np.concatenate([self.extra_lists, self._assign(vectors, self.centroids)])
+        self.deleted = np.concatenate([self.deleted, np.zeros(len(vectors), dtype=bool)])
+        return ids
+
+    def remove(self, ids):
+        self.deleted[ids] = True
+
+    def compact(self):
+        """Merge the delta into the lists and drop tombstones (centroids are not retrained)"""
+        main_lists = np.repeat(np.arange(self.n_lists, dtype=np.int32), np.diff(self.offsets))
+        vectors = np.concatenate([np.asarray(self.vectors), self.extra_vectors])
+        ids = np.concatenate([np.asarray(self.ids), self.extra_ids])
+        lists = np.concatenate([main_lists, self.extra_lists])
+
+        keep = ~self.deleted[ids]
+        renumber = np.cumsum(~self.deleted) - 1
+        self._set_lists(vectors[keep], renumber[ids[keep]], lists[keep])
+        self.deleted = np.zeros(len(self.ids), dtype=bool)
+
+    def search(self, queries, k):
+        """Return (cosine distances, indices), each (Q, k)"""
+        queries = _as_queries(queries)
+        k = min(k, len(self))
+        n_probe = min(self.n_probe, self.n_lists)
+        probes = _top_k(queries @ self.centroids.T, n_probe)
+        has_deleted = self.deleted.any()
+
+        distances = np.empty((len(queries), k), dtype=np.float32)
+        indices = np.empty((len(queries), k), dtype=np.int64)
+        for qi, query in enumerate(queries):
+            candidates = np.concatenate([np.arange(self.offsets[j], self.offsets[j + 1])
+                                         for j in probes[qi]])
+            extra = np.flatnonzero(np.isin(self.extra_lists, probes[qi]))
+            ids = np.concatenate([self.ids[candidates], self.extra_ids[extra]])
+            live = ~self.deleted[ids] if has_deleted else np.ones(len(ids), dtype=bool)
+            if live.sum() < k:
+                # Too few in the probed lists: scan everything
+                candidates = np.arange(len(self.ids))
+                extra = np.arange(len(self.extra_ids))
+                ids = np.concatenate([self.ids, self.extra_ids])
+                live = ~self.deleted[ids]
+            scores = np.concatenate([_scores(query[None, :], self.vectors[candidates]),
+                                     _scores(query[None, :], self.extra_vectors[extra])], axis=1)
+            scores[0, ~live] = -np.inf
+            top = _top_k(scores, k)[0]
+            distances[qi] = 1 - scores[0, top]
+            indices[qi] = ids[top]
+        return distances, indices
+
+    def _meta(self, fingerprint):
+        return {"kind": self.kind, "n_lists": self.n_lists, "n_probe": self.n_probe,
+                "iterations": self.iterations, "seed": self.seed, "fingerprint": fingerprint}
+
+    def save(self, path, fingerprint=None):
+        _begin_save(path)
+        for name in ["centroids", "vectors", "ids", "offsets",
+                     "extra_vectors", "extra_ids", "extra_lists", "deleted"]:
+            _save_array(path, name, getattr(self, name))
+        _write_meta(path, self._meta(fingerprint))
+
+    def save_updates(self, path, fingerprint=None):
+        """Persist only the delta and tombstones; the main arrays are unchanged since save()"""
+        _begin_save(path)
+        for name in ["extra_vectors", "extra_ids", "extra_lists", "deleted"]:
+            _save_array(path, name, getattr(self, name))
+        _write_meta(path, self._meta(fingerprint))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        meta = _read_meta(path)
+        index = cls(meta["n_lists"], meta["n_probe"], meta["iterations"], meta["seed"])
+        mode = "r" if mmap else None
+        index.centroids = np.load(os.path.join(path, "centroids.npy"))
+        index.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode=mode)
+        index.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode=mode)
+        index.offsets = np.load(os.path.join(path, "offsets.npy"))
+        for name in ["extra_vectors", "extra_ids", "extra_lists", "deleted"]:
+            setattr(index, name, np.load(os.path.join(path, f"{name}.npy")))
+        return index
+
+
+INDEX_TYPES = {cls.kind: cls for cls in [ExactIndex, IVFIndex]}
+
+
+def _begin_save(path):
+    os.makedirs(path, exist_ok=True)
+    meta_path = os.path.join(path, "index_meta.json")
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+
+def _save_array(path, name, array):
+    # Replace rather than overwrite: a live mmap of the old file stays valid
+    tmp = os.path.join(path, f"{name}.tmp.npy")
+    np.save(tmp, np.asarray(array))
+    os.replace(tmp, os.path.join(path, f"{name}.npy"))
+
+
+def _write_meta(path, meta):
+    # Written last, so a crash mid-save leaves no meta and the index is rebuilt
+    tmp = os.path.join(path, "index_meta.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(path, "index_meta.json"))
+
+
+def _read_meta(path):
+    with open(os.path.join(path, "index_meta.json")) as f:
+        return json.load(f)
+
+
+def make_index(kind, **params):
+    """New, unbuilt index of the given kind ("exact" or "ivf")"""
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {kind!r}; choose from {sorted(INDEX_TYPES)}")
+    return INDEX_TYPES[kind](**params)
+
+
+def load_index(path, mmap=True, fingerprint=None):
+    """Load a saved index; None if absent or saved for different data"""
+    try:
+        meta = _read_meta(path)
+    except (OSError, ValueError):
+        return None
+    if fingerprint is not None and meta.get("fingerprint") != fingerprint:
+        return None
+    return INDEX_TYPES[meta["kind"]].load(path, mmap=mmap)
@@ -0,0 +1,79 @@
+"""
+Ternary NPK plots rendered without pyplot.
+
+A TernaryPlot owns one Agg-backed Figure. The triangle, its grid and
+the corner labels are drawn once and kept as a background bitmap; each
+render restores that bitmap, draws the point and caption artists on
+top and encodes the pixels as PNG. Nothing goes through pyplot, so a
+long-running process never accumulates figures, and the PNGs are
+cached by NPK rounded to `resolution` percentage points.
+"""
+import threading
+from io import BytesIO
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.tri import UniformTriRefiner
+from PIL import Image
+
+from npk_cache import LRUCache
+
+CORNER_LABELS = ("N", "P", "K")  # In the order of the triangle's corners
+
+
+class TernaryPlot:
+    """Cached PNG renders of NPK points on a ternary diagram"""
+    def __init__(self, triang, corners, figsize=(4, 3.8), dpi=100, resolution=1, cache_bytes=16 * 2**20):
+        self.corners = np.asarray(corners, dtype=np.float64)
+        self.resolution = resolution
+        self.cache = LRUCache(cache_bytes)
+        self._lock = threading.Lock()  # One figure, shared by every caller
+
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        ax = self.figure.add_axes([0.05, 0.02, 0.9, 0.86])
+        ax.set_aspect("equal")
+        ax.axis("off")
+        ax.set_xlim(-0.08, 1.08)
+        ax.set_ylim(-0.08, self.corners[:, 1].max() + 0.08)
+        ax.triplot(UniformTriRefiner(triang).refine_triangulation(subdiv=2), color="0.85", lw=0.6)
+        ax.triplot(triang, color="0.2", lw=1.2)
+        for (x, y), label, ha, va in zip(self.corners, CORNER_LABELS,
+                                         ["right", "left", "center"], ["top", "top", "bottom"]):
+            ax.text(x, y, label, ha=ha, va=va, fontsize=12, fontweight="bold")
+
+        # Animated artists are left out of canvas.draw(), so the background stays clean
+        self.point, = ax.plot([], [], "o", ms=10, color="tab:green", mec="black", animated=True)
+        self.caption = self.figure.text(0.5, 0.97, "", ha="center", va="top", fontsize=10, animated=True)
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+
+    def position(self, npk):
+        """Barycentric (x, y) of an N, P, K triple"""
+        weights = np.asarray(npk, dtype=np.float64)
+        return weights / max(weights.sum(), 1e-12) @ self.corners
+
+    def render(self, npk, title=None):
+        """PNG bytes for one NPK point (percentages), from the cache when possible"""
+        npk = np.round(np.asarray(npk, dtype=np.float64) / self.resolution) * self.resolution
+        key = (tuple(npk.tolist()), title)
+        png = self.cache.get(key)
+        if png is not None:
+            return png
+
+        x, y = self.position(npk)
+        caption = "N {:.0f}  P {:.0f}  K {:.0f}".format(*npk)
+        with self._lock:
+            self.canvas.restore_region(self.background)
+            self.point.set_data([x], [y])
+            self.caption.set_text(f"{title}\n{caption}" if title else caption)
+            self.figure.draw_artist(self.point)
+            self.figure.draw_artist(self.caption)
+            pixels = np.array(self.canvas.buffer_rgba())  # Copy, then encode outside the lock
+
+        buffer = BytesIO()
+        Image.fromarray(pixels, "RGBA").save(buffer, "PNG", compress_level=1)
+        png = buffer.getvalue()
+        self.cache.put(key, png)
+        return png
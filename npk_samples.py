@@ -0,0 +1,86 @@
+"""
+Append-only log of reference samples added or removed at runtime.
+
+Each line is one JSON record:
+    {"op": "add", "key", "path", "Plant_Name", "Species", "Source", "N", "P", "K"}
+    {"op": "remove", "key"}
+    {"op": "compact"}
+
+Replaying the log over the dataset rows gives the same row order the
+analyzer had in memory: dataset rows first, then one row per "add" in
+log order. Rows removed before the last "compact" are dropped; rows
+removed after it are still present but tombstoned, matching the saved
+index, which only drops tombstones when it is compacted.
+"""
+import json
+import os
+from collections import defaultdict
+
+import numpy as np
+
+SAMPLE_COLUMNS = ['Plant_Name', 'Species', 'Source', 'N', 'P', 'K']
+
+
+class SampleLog:
+    """JSON-lines log of runtime sample additions and removals"""
+    def __init__(self, path):
+        self.path = path
+        self.records = []
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        try:
+                            self.records.append(json.loads(line))
+                        except ValueError:
+                            break  # Torn final line from an interrupted append
+
+    def added(self):
+        """The "add" records, in order"""
+        return [rec for rec in self.records if rec["op"] == "add"]
+
+    def append(self, records):
+        with open(self.path, "a") as f:
+            for rec in records:
+                f.write(json.dumps(rec) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.records.extend(records)
+
+    def rewrite(self, records):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            for rec in records:
+                f.write(json.dumps(rec) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.records = list(records)
+
+    def replay(self, keys, n_base):
+        """Apply the log to per-row content keys.
+
+        keys has the n_base dataset rows first, then one entry per "add"
+        record (None where the image is unavailable). Returns (rows kept,
+        active flag per kept row).
+        """
+        alive = np.array([key is not None for key in keys], dtype=bool)
+        kept = alive.copy()
+        rows_by_key = defaultdict(list)
+        for i in range(n_base):
+            if keys[i] is not None:
+                rows_by_key[keys[i]].append(i)
+
+        next_row = n_base
+        for rec in self.records:
+            if rec["op"] == "add":
+                if keys[next_row] is not None:
+                    rows_by_key[keys[next_row]].append(next_row)
+                next_row += 1
+            elif rec["op"] == "remove":
+                alive[rows_by_key.pop(rec["key"], [])] = False
+            elif rec["op"] == "compact":
+                kept &= alive
+        rows = np.flatnonzero(kept)
+        return rows, alive[rows]
@@ -0,0 +1,268 @@
+"""
+HTTP inference service for the NPK analyzer.
+
+Keeps one ComprehensivePlantNPKAnalyzer (model, embeddings and index)
+warm and serves:
+    POST /analyze   image upload (multipart "image" field or a raw image/*
+                    body), or JSON {"source": "camera"} to grab a frame
+                    from the camera service's /image endpoint
+    GET  /plot      NPK triangle PNG for ?n=&p=&k=[&title=], rendered on
+                    demand (each /analyze result links one as "plot_url")
+    GET  /metrics   queue depth, batch sizes and latency percentiles
+    GET  /health
+
+Request threads don't call the analyzer themselves: they submit to a
+MicroBatcher, whose single worker gathers whatever arrives within
+max_wait of the first request (up to max_batch) and runs it as one
+analyze_plants() call, so throughput rises with concurrency.
+
+Usage: python npk_server.py --csv data.csv --tomato-zip tomato.zip
+           [--port 5005] [--max-batch 16] [--max-wait-ms 20] [--index ivf]
+"""
+import argparse
+import math
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from urllib.parse import urlencode
+
+import numpy as np
+import requests
+from flask import Flask, Response, jsonify, request
+from flask_cors import CORS
+
+from npk_embed import IMAGE_SIZE, INFERENCE_MODES
+
+CAMERA_URL = os.environ.get("CAMERA_URL", "http://localhost:5000/image")
+REQUEST_TIMEOUT = 60  # Seconds a request waits for its batch
+
+
+class Metrics:
+    """Counters plus sliding windows of recent latencies and batch sizes"""
+    def __init__(self, window=2000):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.latencies = deque(maxlen=window)   # Submit -> result, seconds
+        self.queue_waits = deque(maxlen=window)  # Submit -> batch start, seconds
+        self.batch_sizes = deque(maxlen=window)
+        self.batch_times = deque(maxlen=window)  # process_batch() duration, seconds
+
+    def record_batch(self, size, waits, batch_time, latencies, errors):
+        with self.lock:
+            self.requests += size
+            self.errors += errors
+            self.batches += 1
+            self.batch_sizes.append(size)
+            self.batch_times.append(batch_time)
+            self.queue_waits.extend(waits)
+            self.latencies.extend(latencies)
+
+    def snapshot(self):
+        def ms(values):
+            if not values:
+                return None
+            p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+            return {"p50": p50, "p95": p95, "p99": p99, "max": max(values) * 1000}
+
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "batches": self.batches,
+                "mean_batch_size": float(np.mean(self.batch_sizes)) if self.batch_sizes else None,
+                "latency_ms": ms(list(self.latencies)),
+                "queue_wait_ms": ms(list(self.queue_waits)),
+                "batch_time_ms": ms(list(self.batch_times)),
+            }
+
+
+class MicroBatcher:
+    """Groups concurrent submissions into batches for one worker thread"""
+    def __init__(self, process_batch, max_batch=16, max_wait=0.02, metrics=None):
+        self.process_batch = process_batch  # list of items -> list of results
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.metrics = metrics or Metrics()
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, item):
+        """Queue an item; the returned Future resolves to its result"""
+        future = Future()
+        self.queue.put((item, future, time.perf_counter()))
+        return future
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def _gather(self, first):
+        """The first item plus whatever arrives before its deadline"""
+        batch = [first]
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                # Past the deadline (e.g. the worker was busy), still take what's already queued
+                item = self.queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+            except queue.Empty:
+                break
+            if item is None:
+                self.queue.put(None)  # Stop after this batch
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self.queue.get()
+            if first is None:
+                return
+            batch = self._gather(first)
+            started = time.perf_counter()
+            try:
+                results = self.process_batch([item for item, _, _ in batch])
+            except Exception as e:
+                results = [e] * len(batch)
+            done = time.perf_counter()
+
+            errors = 0
+            for (_, future, _), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                    errors += 1
+                else:
+                    if isinstance(result, dict) and "error" in result:
+                        errors += 1
+                    future.set_result(result)
+            self.metrics.record_batch(len(batch), [started - t for _, _, t in batch], done - started,
+                                      [done - t for _, _, t in batch], errors)
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+def _jsonable(value):
+    """Convert NumPy scalars/arrays in an analyzer result for jsonify; NaN/inf become null"""
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return _jsonable(value.tolist())
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None  # Not representable in JSON
+    return value
+
+
+def create_app(analyzer, max_batch=16, max_wait=0.02, describe=False):
+    """Flask app around analyzer; describe is passed to analyze_plants (False, "cached" or True)"""
+    app = Flask(__name__)
+    CORS(app)
+
+    def process_batch(items):
+        images = [image for image, _ in items]
+        names = [name for _, name in items]
+        return analyzer.analyze_plants(images, names, describe=describe, visualize=False)
+
+    batcher = MicroBatcher(process_batch, max_batch, max_wait)
+    app.config["batcher"] = batcher
+
+    @app.route('/analyze', methods=['POST'])
+    def analyze():
+        plant_name = request.values.get('plant_name')
+        if 'image' in request.files:
+            image = request.files['image'].read()
+        elif request.mimetype.startswith('image/'):
+            image = request.get_data()
+        elif (request.get_json(silent=True) or {}).get('source') == 'camera':
+            try:
+                response = requests.get(CAMERA_URL, timeout=10)
+                response.raise_for_status()
+            except requests.RequestException as e:
+                return jsonify({"error": f"Camera unavailable: {e}"}), 502
+            image = response.content
+            plant_name = request.get_json().get('plant_name', plant_name)
+        else:
+            return jsonify({"error": "Send an 'image' file, an image/* body, or {\"source\": \"camera\"}"}), 400
+
+        try:
+            result = batcher.submit((image, plant_name)).result(timeout=REQUEST_TIMEOUT)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        if "error" in result:
+            return jsonify(_jsonable(result)), 422
+        if not np.isfinite(np.asarray(result["npk"], dtype=np.float64)).all():
+            return jsonify({"error": "Analyzer produced a non-finite NPK prediction"}), 500
+        # The plot stays off the batch path; clients fetch it only if they show it
+        n, p, k = (int(v) for v in result["npk"])
+        query = {"n": n, "p": p, "k": k, **({"title": plant_name} if plant_name else {})}
+        return jsonify(dict(_jsonable(result), plot_url=f"/plot?{urlencode(query)}")), 200
+    
+    @app.route('/plot')
+    def plot():
+        try:
+            npk = [float(request.args[name]) for name in ('n', 'p', 'k')]
+            if not all(math.isfinite(v) and v >= 0 for v in npk) or sum(npk) <= 0:
+                raise ValueError
+        except (KeyError, ValueError):
+            return jsonify({"error": "Pass finite, non-negative n, p and k"}), 400
+        png = analyzer.visualize_npk(npk, request.args.get('title'))
+        return Response(png, mimetype='image/png', headers={"Cache-Control": "public, max-age=86400"})
+
+    @app.route('/metrics')
+    def metrics():
+        return jsonify(dict(batcher.metrics.snapshot(), queue_depth=batcher.depth(),
+                            max_batch=batcher.max_batch, max_wait_ms=batcher.max_wait * 1000,
+                            query_cache=analyzer.query_cache.stats(),
+                            plot_cache=analyzer.plot_cache_stats(),
+                            description_cache=analyzer.description_cache.stats()))
+
+    @app.route('/health')
+    def health():
+        return jsonify({"status": "ok", "references": len(analyzer.index)})
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", required=True)
+    parser.add_argument("--tomato-zip", required=True)
+    parser.add_argument("--kaggle-dataset", default="baronn/lettuce-npk-dataset")
+    parser.add_argument("--cache-dir", default="embedding_cache")
+    parser.add_argument("--index", default="exact", choices=["exact", "ivf"])
+    parser.add_argument("--inference-mode", default="fp32", choices=INFERENCE_MODES)
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    parser.add_argument("--max-batch", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=20)
+    parser.add_argument("--describe", nargs="?", const="on", default="off", choices=["off", "cached", "on"],
+                        help="Text descriptions: generate on a cache miss (on), only from the cache, or none")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5005)
+    args = parser.parse_args()
+
+    from ai import ComprehensivePlantNPKAnalyzer
+    analyzer = ComprehensivePlantNPKAnalyzer(
+        csv_path=args.csv, tomato_zip_path=args.tomato_zip, kaggle_dataset=args.kaggle_dataset,
+        cache_dir=args.cache_dir, batch_size=args.max_batch, index=args.index,
+        inference_mode=args.inference_mode, num_threads=args.threads)
+
+    # Warm up now rather than on the first request
+    print(f"Serving {len(analyzer.index)} reference images")
+    analyzer.encode_batch(np.zeros((1, 3, IMAGE_SIZE, IMAGE_SIZE), dtype=np.float32))
+
+    describe = {"off": False, "cached": "cached", "on": True}[args.describe]
+    app = create_app(analyzer, args.max_batch, args.max_wait_ms / 1000, describe)
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
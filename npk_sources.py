@@ -0,0 +1,98 @@
+"""
+Image dataset sources: plain directories and ZIP archives, read in place.
+
+A source lists its image members and gives each one a URI that the
+embedding pipeline can read later, in any thread or worker process:
+a file path for directories, or "zip://<archive>!<member>" for archive
+members. Nothing is extracted; a member is read straight out of the
+archive into memory only when it is hashed or decoded.
+"""
+import os
+import threading
+import zipfile
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+ZIP_SCHEME = "zip://"
+
+_zips = {}  # (pid, archive path) -> open ZipFile
+_zips_lock = threading.Lock()
+
+
+def _is_image(name):
+    base = os.path.basename(name)
+    # Skip macOS resource forks (__MACOSX/._foo.jpg), which aren't images
+    return (base.lower().endswith(IMAGE_EXTENSIONS) and not base.startswith("._")
+            and not name.startswith("__MACOSX/"))
+
+
+def _open_zip(path):
+    """Shared ZipFile per process (a handle inherited over fork would share its file offset)"""
+    key = (os.getpid(), path)
+    with _zips_lock:
+        zf = _zips.get(key)
+        if zf is None:
+            zf = _zips[key] = zipfile.ZipFile(path)
+        return zf
+
+
+def zip_uri(path, member):
+    return f"{ZIP_SCHEME}{os.path.abspath(path)}!{member}"
+
+
+def is_zip_uri(src):
+    return isinstance(src, str) and src.startswith(ZIP_SCHEME)
+
+
+def read_zip_member(uri):
+    """Bytes of a zip:// member"""
+    path, member = uri[len(ZIP_SCHEME):].split("!", 1)
+    # ZipFile serializes reads of the shared handle, so threads can share it
+    with _open_zip(path).open(member) as f:
+        return f.read()
+
+
+class DirectorySource:
+    """Images under a directory tree"""
+    def __init__(self, root):
+        self.root = root
+
+    def members(self):
+        members = []
+        for root, dirs, files in os.walk(self.root):
+            dirs.sort()
+            for file in sorted(files):
+                if _is_image(file):
+                    members.append(os.path.relpath(os.path.join(root, file), self.root))
+        return members
+
+    def uri(self, member):
+        return os.path.join(self.root, member)
+
+    def read(self, member):
+        with open(self.uri(member), 'rb') as f:
+            return f.read()
+
+
+class ZipSource:
+    """Images inside a ZIP archive, read without extracting"""
+    def __init__(self, path):
+        self.path = path
+
+    def members(self):
+        return [info.filename for info in _open_zip(self.path).infolist()
+                if not info.is_dir() and _is_image(info.filename)]
+
+    def uri(self, member):
+        return zip_uri(self.path, member)
+
+    def read(self, member):
+        return read_zip_member(self.uri(member))
+
+
+def open_source(path):
+    """DirectorySource or ZipSource for a path"""
+    if os.path.isdir(path):
+        return DirectorySource(path)
+    if zipfile.is_zipfile(path):
+        return ZipSource(path)
+    raise ValueError(f"{path} is neither a directory nor a ZIP archive")
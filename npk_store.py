@@ -0,0 +1,116 @@
+"""
+Persistent content-addressed embedding store.
+
+Embeddings live in one append-only float32 matrix file that is
+memory-mapped on load, with a small JSON index mapping image content
+hashes to rows. Each model ID gets its own directory, so changing the
+model or preprocessing never returns stale vectors.
+
+    <root>/<model slug>/embeddings.f32   raw float32 rows, dim columns
+    <root>/<model slug>/index.json       {"model_id", "dim", "rows", "keys": {hash: row}}
+"""
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+
+def content_hash(data):
+    """Stable key for image bytes"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class EmbeddingStore:
+    """On-disk embedding matrix keyed by content hash"""
+    def __init__(self, root, model_id):
+        self.model_id = model_id
+        self.path = os.path.join(root, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_id))
+        self.matrix_path = os.path.join(self.path, "embeddings.f32")
+        self.index_path = os.path.join(self.path, "index.json")
+        os.makedirs(self.path, exist_ok=True)
+
+        self.dim = None
+        self.rows = 0
+        self.keys = {}
+        self._mmap = None
+        self._load_index()
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path) as f:
+            index = json.load(f)
+        if index.get("model_id") != self.model_id:
+            raise ValueError(f"Store at {self.path} belongs to {index.get('model_id')}")
+        self.dim = index["dim"]
+        self.rows = index["rows"]
+        self.keys = index["keys"]
+
+    def _save_index(self):
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"model_id": self.model_id, "dim": self.dim,
+                       "rows": self.rows, "keys": self.keys}, f)
+        os.replace(tmp, self.index_path)
+
+    def matrix(self):
+        """Memory-mapped (rows, dim) view of every stored embedding"""
+        if self.rows == 0:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        if self._mmap is None or self._mmap.shape[0] != self.rows:
+            self._mmap = np.memmap(self.matrix_path, dtype=np.float32, mode="r",
+                                   shape=(self.rows, self.dim))
+        return self._mmap
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def get(self, key):
+        row = self.keys.get(key)
+        return None if row is None else np.array(self.matrix()[row])
+
+    def get_many(self, keys):
+        """Return (embeddings for found keys, boolean mask of which keys were found)"""
+        rows = [self.keys.get(key) for key in keys]
+        found = np.array([row is not None for row in rows], dtype=bool)
+        if not found.any():
+            return np.zeros((0, self.dim or 0), dtype=np.float32), found
+        return np.array(self.matrix()[[row for row in rows if row is not None]]), found
+
+    def put_many(self, keys, embeddings):
+        """Append embeddings for new keys (existing keys are left alone)"""
+        keys = list(keys)
+        if not keys:
+            return  # An empty batch carries no dimension to adopt
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim == 1:
+            embeddings = embeddings[None, :]
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+        elif embeddings.shape[1] != self.dim:
+            raise ValueError(f"Embedding dim {embeddings.shape[1]} != store dim {self.dim}")
+
+        new = [(key, i) for i, key in enumerate(keys) if key not in self.keys]
+        seen = set()
+        new = [(key, i) for key, i in new if not (key in seen or seen.add(key))]
+        if not new:
+            return
+
+        with open(self.matrix_path, "ab") as f:
+            # Drop any partial rows left by an interrupted write
+            f.truncate(self.rows * self.dim * 4)
+            f.seek(self.rows * self.dim * 4)
+            f.write(np.ascontiguousarray(embeddings[[i for _, i in new]]).tobytes())
+        for key, _ in new:
+            self.keys[key] = self.rows
+            self.rows += 1
+        self._mmap = None
+        self._save_index()
+
+    def put(self, key, embedding):
+        self.put_many([key], embedding)
@@ -1,14 +1,10 @@
-import RPi.GPIO as GPIO
 import time
 import threading
 import logging
 import json
 import requests
 import numpy as np
-from adafruit_ads1x15.analog_in import AnalogIn
-import adafruit_ads1x15.ads1115 as ADS
-import board
-import busio
+from hwd import HardwareClient, LeaseError, RemoteGPIO
 
 # Setup logging
 logging.basicConfig(
@@ -21,6 +17,9 @@ logging.basicConfig(
 )
 
 # GPIO Setup
+# Pins and the ADS1115 are owned by the hardware daemon (hwd.py)
+hw = HardwareClient("ph")
+GPIO = RemoteGPIO(hw)
 GPIO.setmode(GPIO.BCM)
 GPIO.setwarnings(False)
 
@@ -39,27 +38,18 @@ PH_LOW_THRESHOLD = 6.5
 PH_HIGH_THRESHOLD = 7.5
 PH_STABILITY_THRESHOLD = 0.3  # Maximum allowed standard deviation for stable reading
 
-# Initialize I2C for ADS1115 (ADC for pH sensor)
-i2c = busio.I2C(board.SCL, board.SDA)
-ads = ADS.ADS1115(i2c)
-ph_channel = AnalogIn(ads, ADS.P0)  # Connect pH sensor to A0 on ADS1115
+PH_ADC_CHANNEL = 0  # pH sensor on A0 of the ADS1115
 
-# Set up GPIO pins
-GPIO.setup(PH_SERVO_PIN, GPIO.OUT)
-GPIO.setup(PH_UPPER_PUMP, GPIO.OUT)
-GPIO.setup(PH_LOWER_PUMP, GPIO.OUT)
-GPIO.setup(WATER_PUMP, GPIO.OUT)
-
-# Initialize servo
+# Pins are only leased while they're driven (see adjust_ph_servo and
+# dose_ph_solution), so rasberry.py can share them in between
 ph_servo = GPIO.PWM(PH_SERVO_PIN, 50)  # 50Hz PWM frequency
-ph_servo.start(7.5)  # Initialize to middle position (neutral)
 
 def read_ph():
     """
     Read pH value from analog sensor connected to ADS1115
     Convert voltage to pH value based on calibration
     """
-    voltage = ph_channel.voltage
+    voltage = hw.ads1115_voltage(PH_ADC_CHANNEL)
     
     # Convert voltage to pH based on calibration
     # This is an example conversion - you'll need to calibrate your sensor
@@ -75,9 +65,30 @@ def adjust_ph_servo(position):
     """
     # Convert position (0-100) to servo duty cycle (typically 2.5-12.5)
     duty_cycle = 2.5 + (position / 10)
-    ph_servo.ChangeDutyCycle(duty_cycle)
-    time.sleep(0.5)  # Give servo time to move
-    ph_servo.ChangeDutyCycle(0)  # Stop servo jitter
+    with hw.holding([PH_SERVO_PIN]):
+        ph_servo.start(duty_cycle)
+        time.sleep(0.5)  # Give servo time to move
+        ph_servo.stop()  # Stop servo jitter
+
+def dose_ph_solution(pump_pin, duration=5, mix_time=10):
+    """
+    Run a pH solution pump, then the water pump to mix.
+    Each pin is leased from the hardware daemon only while it runs,
+    waiting if another script is currently using it.
+    """
+    with hw.holding([pump_pin]):
+        hw.output(pump_pin, GPIO.HIGH)
+        time.sleep(duration)
+        hw.output(pump_pin, GPIO.LOW)
+
+    # Mix solution, unless rasberry.py's pump cycle holds the pump: it's already circulating
+    try:
+        with hw.holding([WATER_PUMP], wait=0):
+            hw.output(WATER_PUMP, GPIO.HIGH)
+            time.sleep(mix_time)
+            hw.output(WATER_PUMP, GPIO.LOW)
+    except LeaseError:
+        logging.info("Water pump is running under another script; skipping the mix")
 
 def get_stable_ph_reading(max_dip_time=300, retry_time=60):
     """
@@ -152,14 +163,7 @@ def adjust_ph_level(ph_value):
         # Continue adding pH UP solution until threshold is reached or max attempts exceeded
         attempts = 0
         while attempts < 5:  # Maximum 5 attempts to avoid overadjustment
-            GPIO.output(PH_UPPER_PUMP, GPIO.HIGH)  # Turn on the upper pH solution pump
-            time.sleep(5)  # Pump for 5 seconds
-            GPIO.output(PH_UPPER_PUMP, GPIO.LOW)  # Turn off the upper pH solution pump
-            
-            # Mix solution
-            GPIO.output(WATER_PUMP, GPIO.HIGH)
-            time.sleep(10)  # Run water pump for 10 seconds to mix
-            GPIO.output(WATER_PUMP, GPIO.LOW)
+            dose_ph_solution(PH_UPPER_PUMP)  # Pump for 5 seconds, then mix for 10
             
             # Wait for solution to mix fully
             time.sleep(60)
@@ -184,14 +188,7 @@ def adjust_ph_level(ph_value):
         # Continue adding pH DOWN solution until threshold is reached or max attempts exceeded
         attempts = 0
         while attempts < 5:  # Maximum 5 attempts to avoid overadjustment
-            GPIO.output(PH_LOWER_PUMP, GPIO.HIGH)  # Turn on the lower pH solution pump
-            time.sleep(5)  # Pump for 5 seconds
-            GPIO.output(PH_LOWER_PUMP, GPIO.LOW)  # Turn off the lower pH solution pump
-            
-            # Mix solution
-            GPIO.output(WATER_PUMP, GPIO.HIGH)
-            time.sleep(10)  # Run water pump for 10 seconds to mix
-            GPIO.output(WATER_PUMP, GPIO.LOW)
+            dose_ph_solution(PH_LOWER_PUMP)  # Pump for 5 seconds, then mix for 10
             
             # Wait for solution to mix fully
             time.sleep(60)
@@ -237,25 +234,11 @@ def send_data_to_backend(ph_value, adjustment_made):
             if "action" in response_data:
                 if response_data["action"] == "adjust_up":
                     logging.info("Backend requested pH UP adjustment")
-                    GPIO.output(PH_UPPER_PUMP, GPIO.HIGH)
-                    time.sleep(5)  # Keep motor on for 5 seconds as requested
-                    GPIO.output(PH_UPPER_PUMP, GPIO.LOW)
-                    
-                    # Mix solution
-                    GPIO.output(WATER_PUMP, GPIO.HIGH)
-                    time.sleep(10)
-                    GPIO.output(WATER_PUMP, GPIO.LOW)
+                    dose_ph_solution(PH_UPPER_PUMP)  # Keep motor on for 5 seconds as requested
                     
                 elif response_data["action"] == "adjust_down":
                     logging.info("Backend requested pH DOWN adjustment")
-                    GPIO.output(PH_LOWER_PUMP, GPIO.HIGH)
-                    time.sleep(5)  # Keep motor on for 5 seconds as requested
-                    GPIO.output(PH_LOWER_PUMP, GPIO.LOW)
-                    
-                    # Mix solution
-                    GPIO.output(WATER_PUMP, GPIO.HIGH)
-                    time.sleep(10)
-                    GPIO.output(WATER_PUMP, GPIO.LOW)
+                    dose_ph_solution(PH_LOWER_PUMP)  # Keep motor on for 5 seconds as requested
                     
             return True
         else:
@@ -311,6 +294,5 @@ if __name__ == "__main__":
     except Exception as e:
         logging.error(f"System error: {e}")
     finally:
-        ph_servo.stop()
         GPIO.cleanup()
         logging.info("System shutdown complete")
\ No newline at end of file
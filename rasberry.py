@@ -1,16 +1,20 @@
-import RPi.GPIO as GPIO
 import time
 import threading
-from smbus2 import SMBus
 import serial
-import Adafruit_DHT
 import math
 import os
 import board
 import requests  # Added for HTTP requests
 import json     # Added for JSON handling
+from contextlib import nullcontext
+from hwd import HardwareClient, HardwareError, LeaseError, RemoteGPIO
 
 # GPIO Mode (BCM)
+# Pins and the I2C bus are owned by the hardware daemon (hwd.py). Pins are
+# leased only while this script is actuating them (a motor wave, a servo
+# sweep, the water pump's ON phase), since ph.py doses on the same pumps.
+hw = HardwareClient("rasberry")
+GPIO = RemoteGPIO(hw)
 GPIO.setmode(GPIO.BCM)
 GPIO.setwarnings(False)
 
@@ -19,7 +23,7 @@ PUMP_PINS = [board.D18, board.D24, board.D23, board.D25]  # L298N motor driver i
 SERVO_PINS = [board.D12, board.D16]         # Direct servo connections
 WATER_RELAY_PIN = board.D27               # Relay for main pump
 DS18B20_PIN = board.D4             # DS18B20 temperature sensor
-DHT_PIN = board.D17                # DHT22 temperature/humidity sensor
+DHT_PIN = board.D17                # DHT22 temperature/humidity sensor (polled by hwd.py)
 CO2_TX = board.D14                 # SYP16 CO2 sensor
 CO2_RX = board.D15                 # SYP16 CO2 sensor
 PH_UPPER_PUMP = board.D18                  # PH Up relay
@@ -28,21 +32,7 @@ FAN_PIN = board.D22                  # Fan relay
 SPRINKLER_PIN = board.D5              # Sprinkler relay
 PH_SENSOR_PIN = board.D6             # pH sensor
 
-# I2C setup using board
-i2c = board.I2C()  # uses board.SCL and board.SDA automatically
-
-# I2C Addresses and Channel Assignments
-PCA9548A_ADDR = 0x70
-BH1750_ADDR = 0x23
-ADS1115_ADDR = 0x48
-
-# I2C Channel Assignments
-BH1750_CHANNEL = 1    # BH1750 on channel 1
-ADS1115_CHANNEL = 3   # ADS1115 on channel 3
-
-# ADS1115 Registers
-ADS1115_REG_POINTER_CONVERT = 0x00
-ADS1115_REG_POINTER_CONFIG = 0x01
+# I2C devices (PCA9548A mux, BH1750, ADS1115) are driven by hwd.py
 
 # PWM Settings
 PWM_FREQ = 50               # 50Hz for servos
@@ -80,20 +70,16 @@ class HydroponicSystem:
             print(f"Error detecting board: {e}")
             self.simulation_mode = True
 
-        # Initialize I2C with board detection
-        try:
-            if self.board_type == "Raspberry Pi":
-                self.i2c = SMBus(1)
-            else:
-                print("I2C not available - entering simulation mode")
-                self.simulation_mode = True
-                self.i2c = None
-        except Exception as e:
-            print(f"I2C initialization error: {e}")
+        # I2C goes through the hardware daemon
+        if self.board_type == "Raspberry Pi":
+            self.i2c = hw
+        else:
+            print("I2C not available - entering simulation mode")
             self.simulation_mode = True
             self.i2c = None
             
         # Initialize GPIO
+        self.pins_leasable = False  # True once the daemon's pins are usable
         self.setup_gpio()
         
         # Initialize sensors
@@ -135,31 +121,12 @@ class HydroponicSystem:
         """Setup GPIO with board pin detection"""
         try:
             if self.board_type == "Raspberry Pi":
-                # Setup pump control pins
-                for pin in PUMP_PINS:
-                    GPIO.setup(pin.id, GPIO.OUT)
-                    
-                # Setup servo pins
-                for pin in SERVO_PINS:
-                    GPIO.setup(pin.id, GPIO.OUT)
-                    
-                # Setup relay
-                GPIO.setup(RELAY_PIN.id, GPIO.OUT)
-                GPIO.output(RELAY_PIN.id, GPIO.HIGH)  # Start with pump OFF
-                
-                # Initialize PWM for motors
-                self.motor_pwm = []
-                for pin in PUMP_PINS:
-                    pwm = GPIO.PWM(pin.id, MOTOR_FREQ)
-                    pwm.start(0)
-                    self.motor_pwm.append(pwm)
-                
-                # Initialize PWM for servos
-                self.servo_pwm = []
-                for pin in SERVO_PINS:
-                    pwm = GPIO.PWM(pin.id, PWM_FREQ)
-                    pwm.start(0)
-                    self.servo_pwm.append(pwm)
+                hw.call({"op": "ping"})  # Fail over to simulation if the daemon is down
+
+                # PWM handles only; each pin is leased and set up while it runs
+                self.motor_pwm = [GPIO.PWM(pin.id, MOTOR_FREQ) for pin in PUMP_PINS]
+                self.servo_pwm = [GPIO.PWM(pin.id, PWM_FREQ) for pin in SERVO_PINS]
+                self.pins_leasable = True
             else:
                 print("Using simulation mode for GPIO")
                 self.motor_pwm = [DummyPWM() for _ in PUMP_PINS]
@@ -170,6 +137,12 @@ class HydroponicSystem:
             self.motor_pwm = [DummyPWM() for _ in PUMP_PINS]
             self.servo_pwm = [DummyPWM() for _ in SERVO_PINS]
 
+    def holding(self, pins, wait=0, initial=GPIO.LOW):
+        """Lease pins from hwd for a block (a no-op without the daemon's pins)"""
+        if not self.pins_leasable:
+            return nullcontext()
+        return hw.holding([pin.id for pin in pins], wait=wait, initial=initial)
+
     def setup_sensors(self):
         """Initialize sensors with error handling"""
         try:
@@ -189,68 +162,29 @@ class HydroponicSystem:
             print(f"Warning: Could not initialize CO2 sensor: {e}")
             self.co2_sensor = None
 
-    def select_i2c_channel(self, channel):
-        """Select channel on PCA9548A with debug"""
-        if not self.i2c:
-            print("I2C not initialized")
-            return
-        try:
-            print(f"Selecting I2C channel {channel}")
-            self.i2c.write_byte(PCA9548A_ADDR, 1 << channel)
-            time.sleep(0.1)
-            print(f"Channel {channel} selected")
-        except Exception as e:
-            print(f"Error selecting I2C channel {channel}: {e}")
-
     def read_ads1115(self, channel):
-        """Read raw value from ADS1115 with debug"""
+        """Read raw value from ADS1115 (mux select + conversion run in hwd)"""
         if not self.i2c:
             print("I2C not initialized")
             return None
         try:
-            print(f"Reading ADS1115 channel {channel}")
-            self.select_i2c_channel(ADS1115_CHANNEL)  # Channel 3
-            
-            # ADS1115 configuration
-            config = [0x84, 0x83]  # Single shot, ±4.096V, 128SPS
-            config[0] |= (channel << 4)
-            
-            print("Writing ADS1115 config")
-            self.i2c.write_i2c_block_data(ADS1115_ADDR, ADS1115_REG_POINTER_CONFIG, config)
-            time.sleep(0.1)
-            
-            print("Reading ADS1115 conversion")
-            data = self.i2c.read_i2c_block_data(ADS1115_ADDR, ADS1115_REG_POINTER_CONVERT, 2)
-            value = (data[0] << 8) | data[1]
-            
-            if value & 0x8000:
-                value -= 65536
-            
-            print(f"ADS1115 value: {value}")
+            value = self.i2c.ads1115(channel)
+            print(f"ADS1115 channel {channel} value: {value}")
             return value
-        except Exception as e:
+        except HardwareError as e:
             print(f"Error reading ADS1115 channel {channel}: {e}")
             return None
 
     def read_bh1750(self):
-        """Read light level from BH1750 with debug"""
+        """Read light level from BH1750 via hwd"""
         if not self.i2c:
             print("I2C not initialized")
             return None
         try:
-            print("Reading BH1750")
-            self.select_i2c_channel(BH1750_CHANNEL)  # Channel 1
-            
-            print("Configuring BH1750")
-            self.i2c.write_byte(BH1750_ADDR, 0x10)  # Continuous high-res mode
-            time.sleep(0.2)
-            
-            print("Reading BH1750 data")
-            data = self.i2c.read_i2c_block_data(BH1750_ADDR, 0x00, 2)
-            light = (data[0] << 8 | data[1]) / 1.2
+            light = self.i2c.bh1750()
             print(f"BH1750 value: {light}")
             return light
-        except Exception as e:
+        except HardwareError as e:
             print(f"Error reading BH1750: {e}")
             return None
 
@@ -265,10 +199,10 @@ class HydroponicSystem:
 
         try:
             if self.board_type == "Raspberry Pi":
-                humidity, temperature = Adafruit_DHT.read_retry(self.dht, DHT_PIN.id)
-                if humidity is not None and temperature is not None:
-                    if 0 <= humidity <= 100 and -40 <= temperature <= 80:
-                        return humidity, temperature
+                # hwd.py polls the DHT22 and shares the latest sample
+                reading = hw.dht22()
+                if reading["age"] is not None and reading["age"] < 30:
+                    return reading["humidity"], reading["temperature"]
             else:
                 print("DHT22: Not supported on this platform")
                 return 50.0, 25.0  # Simulated values
@@ -340,13 +274,11 @@ class HydroponicSystem:
                     angle = data['angle']
                     print(f"Received command for {servo_name} servo: angle={angle}")
                     
-                    # Apply to appropriate servo
+                    # Move the appropriate servo; its sweep thread continues from there
                     if servo_name == "pH" and len(self.servo_pwm) > 0:
-                        duty = 2 + (angle / 18)  # Convert angle to duty cycle
-                        self.servo_pwm[0].ChangeDutyCycle(duty)
+                        self.servo_positions[0] = angle
                     elif servo_name == "EC" and len(self.servo_pwm) > 1:
-                        duty = 2 + (angle / 18)  # Convert angle to duty cycle
-                        self.servo_pwm[1].ChangeDutyCycle(duty)
+                        self.servo_positions[1] = angle
         except Exception as e:
             print(f"Error checking servo commands: {e}")
 
@@ -412,39 +344,64 @@ class HydroponicSystem:
                 print(f"Error in sensor reading thread: {e}")
                 time.sleep(5)
 
+    def next_motor_speed(self, motor_index):
+        """Advance the motor's wave pattern and return its new speed"""
+        speed = self.speed_pattern[self.current_pattern_index[motor_index]]
+        self.motor_speeds[motor_index] = speed
+        self.current_pattern_index[motor_index] = (self.current_pattern_index[motor_index] + 1) % len(self.speed_pattern)
+        return speed
+
     def motor_control_thread(self, motor_index):
-        """Continuous motor control thread with wave-like speed pattern"""
+        """Continuous motor control thread with wave-like speed pattern.
+
+        The pin is leased for each run of non-zero speeds and released at
+        the zero step, when ph.py can take it to dose.
+        """
+        pwm = self.motor_pwm[motor_index]
         while self.running:
+            speed = self.next_motor_speed(motor_index)
+            if speed == 0:
+                time.sleep(1)
+                continue
             try:
-                # Update speed from pattern
-                self.motor_speeds[motor_index] = self.speed_pattern[self.current_pattern_index[motor_index]]
-                
-                # Apply speed to motor
-                self.motor_pwm[motor_index].ChangeDutyCycle(self.motor_speeds[motor_index])
-                
-                # Move to next speed in pattern
-                self.current_pattern_index[motor_index] = (self.current_pattern_index[motor_index] + 1) % len(self.speed_pattern)
-                
-                # Delay before next speed change
-                time.sleep(1)  # Change speed every second
+                with self.holding([PUMP_PINS[motor_index]]):
+                    pwm.start(speed)
+                    while self.running and speed:
+                        pwm.ChangeDutyCycle(speed)
+                        time.sleep(1)  # Change speed every second
+                        speed = self.next_motor_speed(motor_index)
+                    pwm.stop()
+            except LeaseError:
+                print(f"Motor {motor_index} pin in use by another script; skipping this wave")
+                time.sleep(1)
             except Exception as e:
                 print(f"Error in motor control: {e}")
                 time.sleep(1)
 
     def servo_control_thread(self, servo_index):
-        """Continuous servo control thread"""
+        """Continuous servo control thread, leasing the pin for one sweep at a time"""
+        pwm = self.servo_pwm[servo_index]
         while self.running:
             try:
-                # Update position
-                self.servo_positions[servo_index] += SERVO_STEP
-                if self.servo_positions[servo_index] > SERVO_MAX_ANGLE:
-                    self.servo_positions[servo_index] = SERVO_MIN_ANGLE
-                
-                # Convert angle to duty cycle (0-180 degrees = 2-12% duty cycle)
-                duty = 2 + (self.servo_positions[servo_index] / 18)
-                self.servo_pwm[servo_index].ChangeDutyCycle(duty)
-                
-                time.sleep(0.1)
+                with self.holding([SERVO_PINS[servo_index]]):
+                    pwm.start(0)
+                    while self.running:
+                        # Update position
+                        self.servo_positions[servo_index] += SERVO_STEP
+                        if self.servo_positions[servo_index] > SERVO_MAX_ANGLE:
+                            self.servo_positions[servo_index] = SERVO_MIN_ANGLE
+                            break  # End of the sweep: let other scripts have the pin
+
+                        # Convert angle to duty cycle (0-180 degrees = 2-12% duty cycle)
+                        duty = 2 + (self.servo_positions[servo_index] / 18)
+                        pwm.ChangeDutyCycle(duty)
+
+                        time.sleep(0.1)
+                    pwm.stop()
+                time.sleep(0.5)
+            except LeaseError:
+                print(f"Servo {servo_index} pin in use by another script; retrying")
+                time.sleep(1)
             except Exception as e:
                 print(f"Error in servo control: {e}")
                 time.sleep(1)
@@ -457,17 +414,33 @@ class HydroponicSystem:
             
             if not self.pump_state and elapsed_time >= self.pump_off_duration:
                 print("Turning Water Pump ON")
-                GPIO.output(RELAY_PIN.id, GPIO.LOW)
+                self.water_pump_on()
                 self.pump_state = True
                 self.pump_start_time = current_time
             elif self.pump_state and elapsed_time >= self.pump_on_duration:
                 print("Turning Water Pump OFF")
-                GPIO.output(RELAY_PIN.id, GPIO.HIGH)
+                self.water_pump_off()
                 self.pump_state = False
                 self.pump_start_time = current_time
+        except LeaseError:
+            print("Water pump in use by another script; will retry")
         except Exception as e:
             print(f"Error controlling water pump: {e}")
 
+    def water_pump_on(self):
+        """Lease the relay for the ON phase (active low, so HIGH is its safe level)"""
+        if self.pins_leasable:
+            with hw.batch():
+                hw.lease([WATER_RELAY_PIN.id])
+                hw.setup(WATER_RELAY_PIN.id, initial=GPIO.HIGH)
+                hw.output(WATER_RELAY_PIN.id, GPIO.LOW)
+
+    def water_pump_off(self):
+        if self.pins_leasable:
+            with hw.batch():
+                hw.output(WATER_RELAY_PIN.id, GPIO.HIGH)
+                hw.release([WATER_RELAY_PIN.id])
+
     def start(self):
         """Start all control and monitoring threads"""
         try:
@@ -509,19 +482,13 @@ class HydroponicSystem:
         for thread in self.threads:
             thread.join()
         
-        # Stop PWM
-        for pwm in self.motor_pwm:
-            pwm.stop()
-        for pwm in self.servo_pwm:
-            pwm.stop()
-        
-        # Make sure pump is off during cleanup
-        if self.board_type == "Raspberry Pi":
-            GPIO.output(RELAY_PIN.id, GPIO.HIGH)  # Turn OFF
+        # Motor and servo threads stop their PWM and release their pins on exit;
+        # make sure the pump is off and nothing stays leased
+        if self.pins_leasable:
+            if self.pump_state:
+                self.water_pump_off()
             GPIO.cleanup()
-        
-        # Close I2C and serial connections
-        if self.i2c:
+        elif self.i2c:
             self.i2c.close()
         if self.co2_sensor:
             self.co2_sensor.close()
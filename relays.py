@@ -0,0 +1,129 @@
+"""
+Non-blocking timed relay control.
+
+pulse() schedules an on/off interval and returns immediately; a single
+timer thread switches the relays at the right moments. Intervals on
+different relays overlap freely, overlapping intervals on the same relay
+merge, and mutual-exclusion rules push a relay's interval back until any
+excluded relay's scheduled interval has ended.
+"""
+import heapq
+import logging
+import threading
+import time
+
+
+class RelayTimer:
+    """Timer thread switching relays on schedule"""
+    def __init__(self, gpio, exclusive=()):
+        self.gpio = gpio
+        self.exclusive = {}  # pin -> set of pins that may not be on with it
+        for a, b in exclusive:
+            self.exclusive.setdefault(a, set()).add(b)
+            self.exclusive.setdefault(b, set()).add(a)
+
+        self.events = []     # (time, seq, pin, +1 on / -1 off)
+        self.intervals = {}  # pin -> [(start, end)] scheduled or active
+        self.on_count = {}   # pin -> overlapping intervals currently active
+        self.cond = threading.Condition()
+        self.running = True
+        self._seq = 0
+
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _push(self, at, pin, delta):
+        self._seq += 1
+        heapq.heappush(self.events, (at, self._seq, pin, delta))
+
+    def _earliest_start(self, pin, start, duration):
+        """Delay start until no excluded relay is scheduled to be on"""
+        moved = True
+        while moved:
+            moved = False
+            for other in self.exclusive.get(pin, ()):
+                for other_start, other_end in self.intervals.get(other, ()):
+                    if other_start < start + duration and start < other_end:
+                        start = other_end
+                        moved = True
+        return start
+
+    def pulse(self, pin, duration, delay=0):
+        """Turn pin on for duration seconds after delay; returns the start delay used"""
+        with self.cond:
+            now = time.monotonic()
+            start = self._earliest_start(pin, now + delay, duration)
+            end = start + duration
+            self.intervals.setdefault(pin, []).append((start, end))
+            self._push(start, pin, 1)
+            self._push(end, pin, -1)
+            self.cond.notify()
+        if start > now + delay:
+            logging.info(f"Relay {pin} delayed {start - now - delay:.1f}s by exclusion rule")
+        return start - now
+
+    def cancel(self, pin):
+        """Turn pin off now and drop its pending intervals"""
+        with self.cond:
+            self.events = [event for event in self.events if event[2] != pin]
+            heapq.heapify(self.events)
+            self.intervals.pop(pin, None)
+            self.on_count[pin] = 0
+            self.gpio.output(pin, 0)
+            self.cond.notify_all()
+
+    def is_on(self, pin):
+        with self.cond:
+            return self.on_count.get(pin, 0) > 0
+
+    def wait_idle(self, timeout=None):
+        """Block until every scheduled interval has finished"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while self.events:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+        return True
+
+    def _run(self):
+        with self.cond:
+            while self.running:
+                if not self.events:
+                    self.cond.wait()
+                    continue
+                at, _, pin, delta = self.events[0]
+                delay = at - time.monotonic()
+                if delay > 0:
+                    self.cond.wait(delay)
+                    continue
+                heapq.heappop(self.events)
+                self._apply(pin, delta, at)
+                self.cond.notify_all()
+
+    def _apply(self, pin, delta, at):
+        count = self.on_count.get(pin, 0)
+        self.on_count[pin] = max(count + delta, 0)
+        try:
+            if count == 0 and delta > 0:
+                self.gpio.output(pin, 1)
+            elif count == 1 and delta < 0:
+                self.gpio.output(pin, 0)
+        except Exception as e:
+            logging.error(f"Relay {pin} switch failed: {e}")
+        if delta < 0:
+            self.intervals[pin] = [(s, e) for s, e in self.intervals.get(pin, []) if e > at]
+
+    def stop(self):
+        """Stop the timer thread and switch every relay off"""
+        with self.cond:
+            self.running = False
+            pins = set(self.on_count) | {event[2] for event in self.events}
+            self.events = []
+            self.intervals = {}
+            self.cond.notify_all()
+        for pin in pins:
+            self.gpio.output(pin, 0)
+            self.on_count[pin] = 0
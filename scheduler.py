@@ -0,0 +1,190 @@
+"""
+Cron-like job scheduler for the control scripts.
+
+Jobs sit in a heap ordered by their next fire time and the scheduler
+thread sleeps until the earliest one is due, instead of polling every
+minute. Each job's next fire time is computed from the time it was
+*scheduled* for, so a slow job can never make it fire twice, and a job
+that is still due when the scheduler gets to it (within its grace
+period) always runs.
+
+Overruns and downtime are handled explicitly: when a fire time has
+passed by more than the job's grace period, the job either runs once to
+catch up (catch_up=True, multiple misses are coalesced into one run) or
+is skipped to its next fire time. Last/next run times are persisted to a
+small JSON file so schedules survive restarts.
+"""
+import heapq
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+MAX_SLEEP = 3600  # Re-check at least hourly in case the wall clock is stepped
+
+
+class Job:
+    """A job that fires at minute `minute` of every hour in `hours`"""
+    def __init__(self, name, func, hours=range(24), minute=0, catch_up=False,
+                 grace=timedelta(minutes=30)):
+        self.name = name
+        self.func = func
+        self.hours = sorted(set(hours))
+        self.minute = minute
+        self.catch_up = catch_up
+        self.grace = grace
+        if not self.hours or not all(0 <= h < 24 for h in self.hours):
+            raise ValueError(f"Job {name}: hours must be within 0-23")
+        if not 0 <= minute < 60:
+            raise ValueError(f"Job {name}: minute must be within 0-59")
+
+    def next_fire(self, after):
+        """First fire time strictly after `after`"""
+        day = after.replace(minute=0, second=0, microsecond=0)
+        for day_offset in range(2):
+            base = day + timedelta(days=day_offset)
+            for hour in self.hours:
+                fire = base.replace(hour=hour, minute=self.minute)
+                if fire > after:
+                    return fire
+        raise AssertionError("unreachable: every job fires at least once a day")
+
+
+class Scheduler:
+    """Heap-based scheduler running jobs one at a time in its own thread"""
+    def __init__(self, state_file=None, now=datetime.now):
+        self.state_file = state_file
+        self.now = now
+        self.jobs = {}
+        self.heap = []  # (fire_time, seq, job name)
+        self.state = self._load_state()
+        self.cond = threading.Condition()
+        self.running = True
+        self._seq = 0
+
+    def _load_state(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read schedule state {self.state_file}: {e}")
+            return {}
+
+    def _save_state(self):
+        if not self.state_file:
+            return
+        tmp = self.state_file + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(self.state, f, indent=2)
+            os.replace(tmp, self.state_file)
+        except OSError as e:
+            logging.warning(f"Could not save schedule state {self.state_file}: {e}")
+
+    def _push(self, fire_time, job):
+        self._seq += 1
+        heapq.heappush(self.heap, (fire_time, self._seq, job.name))
+        self.state.setdefault(job.name, {})["next_run"] = fire_time.isoformat()
+
+    def add(self, job):
+        """Register a job, resuming from its persisted state if any"""
+        with self.cond:
+            self.jobs[job.name] = job
+            saved = self.state.get(job.name, {})
+            now = self.now()
+            if "next_run" in saved:
+                fire = datetime.fromisoformat(saved["next_run"])
+            elif "last_run" in saved:
+                fire = job.next_fire(datetime.fromisoformat(saved["last_run"]))
+            else:
+                fire = job.next_fire(now)
+            self._push(fire, job)
+            self._save_state()
+            self.cond.notify()
+
+    def _resolve_missed(self, job, fire_time, now):
+        """Handle a fire time that is past its grace period.
+
+        Returns the fire time to run now, or None to skip ahead. A catch-up
+        run stands for every fire time up to now, including any still within
+        grace, so the next run is the first fire time after now and a
+        catch-up is never followed straight away by a regular run.
+        """
+        missed = []
+        next_fire = fire_time
+        while next_fire + job.grace < now:
+            missed.append(next_fire)
+            next_fire = job.next_fire(next_fire)
+        if job.catch_up:
+            covered = missed[-1]
+            while next_fire <= now:
+                covered, next_fire = next_fire, job.next_fire(next_fire)
+            logging.warning(f"Job {job.name} missed {len(missed)} run(s) since "
+                            f"{fire_time:%Y-%m-%d %H:%M}; running once to catch up")
+            return covered
+        logging.warning(f"Job {job.name} missed {len(missed)} run(s) since "
+                        f"{fire_time:%Y-%m-%d %H:%M}; skipping to {next_fire:%Y-%m-%d %H:%M}")
+        self._push(next_fire, job)
+        self._save_state()
+        return None
+
+    def _next_due(self):
+        """Block until a job is due; returns (fire_time, job) or None on stop"""
+        with self.cond:
+            while self.running:
+                if not self.heap:
+                    self.cond.wait()
+                    continue
+                fire_time, _, name = self.heap[0]
+                now = self.now()
+                delay = (fire_time - now).total_seconds()
+                if delay > 0:
+                    self.cond.wait(min(delay, MAX_SLEEP))
+                    continue
+
+                heapq.heappop(self.heap)
+                job = self.jobs[name]
+                if fire_time + job.grace < now:
+                    # Missed through downtime or another job overrunning
+                    fire_time = self._resolve_missed(job, fire_time, now)
+                    if fire_time is None:
+                        continue
+                return fire_time, job
+        return None
+
+    def run(self):
+        """Run jobs until stop() is called"""
+        while True:
+            due = self._next_due()
+            if due is None:
+                break
+            fire_time, job = due
+
+            started = self.now()
+            logging.info(f"Running job {job.name} (scheduled {fire_time:%H:%M})")
+            try:
+                job.func()
+            except Exception as e:
+                logging.error(f"Job {job.name} failed: {e}")
+            finished = self.now()
+
+            with self.cond:
+                self.state[job.name] = {"last_run": fire_time.isoformat()}
+                self._push(job.next_fire(fire_time), job)
+                self._save_state()
+            logging.info(f"Job {job.name} finished in {(finished - started).total_seconds():.0f}s")
+
+    def start(self):
+        """Run the scheduler in a daemon thread"""
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
@@ -0,0 +1,30 @@
+import threading
+from datetime import datetime
+
+from scheduler import Job, Scheduler
+
+
+def test_catch_up_after_downtime_runs_once():
+    # Dosing at 08:00 and 20:00; down from before 08:00 until 20:10. The 20:00
+    # slot is still within grace, but the catch-up run must cover it too.
+    now = datetime(2024, 5, 1, 20, 10)
+    scheduler = Scheduler(now=lambda: now)
+    scheduler.state = {"dosing": {"next_run": datetime(2024, 5, 1, 8, 0).isoformat()}}
+    runs = []
+    ran = threading.Event()
+
+    def dose():
+        runs.append(now)
+        ran.set()
+
+    scheduler.add(Job("dosing", dose, hours=[8, 20], catch_up=True))
+    thread = scheduler.start()
+    assert ran.wait(5)
+    ran.clear()
+    assert not ran.wait(0.5)  # No second run straight after the catch-up
+    scheduler.stop()
+    thread.join(5)
+
+    assert len(runs) == 1
+    assert scheduler.state["dosing"]["last_run"] == datetime(2024, 5, 1, 20, 0).isoformat()
+    assert scheduler.heap[0][0] == datetime(2024, 5, 2, 8, 0)